@@ -1,3 +1,25 @@
-from dicetables_db.requesthandler import RequestHandler
-from dicetables_db.connections.sql_connection import SQLConnection
-from dicetables_db.connections.mongodb_connection import MongoDBConnection
+"""
+The package attributes are imported on first use, so "import dicetables_db" is cheap and pymongo is only
+imported when MongoDBConnection is used.
+"""
+from importlib import import_module
+
+__all__ = ['RequestHandler', 'SQLConnection', 'MongoDBConnection']
+
+_LAZY_ATTRIBUTES = {
+    'RequestHandler': 'dicetables_db.requesthandler',
+    'SQLConnection': 'dicetables_db.connections.sql_connection',
+    'MongoDBConnection': 'dicetables_db.connections.mongodb_connection',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
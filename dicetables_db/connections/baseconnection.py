@@ -1,5 +1,16 @@
+from contextlib import contextmanager
+
 from dicetables_db.tools.documentid import DocumentId
 
+DEFAULT_BATCH_SIZE = 100
+
+ASCENDING = 1
+DESCENDING = -1
+
+
+class DuplicateKeyError(ValueError):
+    """raised by insert when a document repeats a value in a unique index."""
+
 
 class BaseConnection(object):
 
@@ -20,10 +31,13 @@ class BaseConnection(object):
     def is_collection_empty(self):
         raise NotImplementedError
 
-    def find(self, params_dict=None, restrictions=None):
+    def find(self, params_dict=None, restrictions=None, batch_size=DEFAULT_BATCH_SIZE, sort=None, limit=None):
         """
 
-        :return: iterable of document dictionaries
+        :param batch_size: number of documents fetched from the database at a time
+        :param sort: [(column, ASCENDING or DESCENDING), ...]
+        :param limit: maximum number of documents returned. None means no limit
+        :return: lazy iterable of document dictionaries
         """
         raise NotImplementedError
 
@@ -37,10 +51,26 @@ class BaseConnection(object):
     def insert(self, document):
         """
 
+        :raises DuplicateKeyError: if document breaks a unique index
         :return: instance of self.id_class()
         """
         raise NotImplementedError
 
+    def insert_many(self, documents):
+        """
+
+        :return: list of instances of self.id_class()
+        """
+        return [self.insert(document) for document in documents]
+
+    @contextmanager
+    def transaction(self):
+        """
+        writes inside the block are committed together when it exits, and discarded if it raises.
+        connections whose writes are each committed at once (mongo) do nothing.
+        """
+        yield
+
     def reset_collection(self):
         raise NotImplementedError
 
@@ -50,7 +80,7 @@ class BaseConnection(object):
     def close(self):
         raise NotImplementedError
 
-    def create_index(self, columns_tuple):
+    def create_index(self, columns_tuple, unique=False):
         raise NotImplementedError
 
     def has_index(self, columns_tuple):
@@ -1,47 +1,49 @@
+from time import monotonic
+
 from pymongo import MongoClient, ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError as MongoDuplicateKeyError
 
-from dicetables_db.connections.baseconnection import BaseConnection
+from dicetables_db.connections.baseconnection import BaseConnection, DuplicateKeyError, DEFAULT_BATCH_SIZE
 
 
 class MongoDBConnection(BaseConnection):
-    def __init__(self, db_name: str, collection_name: str, ip='localhost', port=27017):
-        self._client = MongoClient(ip, port)
+    def __init__(self, db_name: str, collection_name: str, ip='localhost', port=27017, metadata_ttl: float = None):
+        """
+
+        :param metadata_ttl: seconds before cached collection and index names are read again. None keeps
+            them until this connection changes them, which is only safe with a single writer.
+        """
+        self._client = MongoClient(ip, port, connect=False)
         self._db = self._client[db_name]
         self._collection = self._db[collection_name]
         self._params_storage = (db_name, collection_name, ip, str(port))
         self._place_holder = None
+        self._info = MongoInformation(self._db, self._collection, metadata_ttl)
 
     def is_collection_empty(self):
         return not self._collection.count()
 
     def get_info(self):
-        indices = self._get_indices()
         info = {
             'db': self._db.name,
-            'collections': self._db.collection_names(),
+            'collections': self._info.collections,
             'current_collection': self._collection.name,
-            'indices': indices,
+            'indices': self._info.indices,
             'ip': self._params_storage[2],
             'port': self._params_storage[3]
         }
         return info
 
-    def _get_indices(self):
-        out = []
-        if self._collection.name in self._db.collection_names():
-            index_info = self._collection.index_information()
-            use_keys = [key for key in self._collection.index_information() if key != '_id_']
-            for key in use_keys:
-                columns = [pair[0] for pair in index_info[key]['key']]
-                out.append(tuple(columns))
-                out.sort()
-        return out
+    def refresh_information(self):
+        """reads collection and index names again. use after another process changes them."""
+        self._info.refresh_information()
 
     def reset_collection(self):
         self.drop_collection()
 
     def drop_collection(self):
         self._db.drop_collection(self._collection.name)
+        self._info.drop_collection()
 
     def close(self):
         if self._client:
@@ -49,15 +51,20 @@ class MongoDBConnection(BaseConnection):
         self._client = None
         self._collection = None
         self._db = None
+        self._info = None
 
-    def find(self, params_dict=None, projection=None):
+    def find(self, params_dict=None, projection=None, batch_size=DEFAULT_BATCH_SIZE, sort=None, limit=None):
         """
 
-        :return: iterable of results
+        :return: lazy iterable of results
         """
         new_params, new_projection = self._prep_find_inputs(params_dict, projection)
-        results = self._collection.find(new_params, new_projection)
-        return [self._result_with_new_id(result) for result in results]
+        results = self._collection.find(new_params, new_projection, batch_size=batch_size)
+        if sort:
+            results = results.sort(list(sort))
+        if limit is not None:
+            results = results.limit(limit)
+        return (self._result_with_new_id(result) for result in results)
 
     def find_one(self, params_dict=None, projection=None):
         new_params, new_projection = self._prep_find_inputs(params_dict, projection)
@@ -71,8 +78,30 @@ class MongoDBConnection(BaseConnection):
         return new_params, new_projection
 
     def _params_with_new_id(self, params):
+        if params is None:
+            return None
+        new_params = {}
+        for key, value in params.items():
+            if key == '$or':
+                value = [self._params_with_new_id(sub_params) for sub_params in value]
+            elif key == '_id':
+                value = self._id_query_with_new_id(value)
+            new_params[key] = value
+        return new_params
+
+    def _id_query_with_new_id(self, query):
         convert_method = self.id_class().to_bson_id
-        return self._dict_with_new_id(convert_method, params)
+        if not isinstance(query, dict):
+            return convert_method(query)
+        new_query = {}
+        for operator, operand in query.items():
+            if operator == '$in':
+                new_query[operator] = [convert_method(doc_id) for doc_id in operand]
+            elif operator == '$exists':
+                new_query[operator] = operand
+            else:
+                new_query[operator] = convert_method(operand)
+        return new_query
 
     def _result_with_new_id(self, result):
         convert_method = self.id_class().from_bson_id
@@ -107,14 +136,96 @@ class MongoDBConnection(BaseConnection):
         :return: ObjectId
         """
         to_insert = document.copy()
-        obj_id = self._collection.insert_one(to_insert).inserted_id
+        try:
+            obj_id = self._collection.insert_one(to_insert).inserted_id
+        except MongoDuplicateKeyError as error:
+            raise DuplicateKeyError(str(error)) from error
+        self._info.add_collection()
         return self.id_class().from_bson_id(obj_id)
 
-    def create_index(self, column_tuple):
+    def insert_many(self, documents):
+        to_insert = [document.copy() for document in documents]
+        if not to_insert:
+            return []
+        try:
+            obj_ids = self._collection.insert_many(to_insert).inserted_ids
+        except BulkWriteError as error:
+            raise DuplicateKeyError(str(error)) from error
+        self._info.add_collection()
+        return [self.id_class().from_bson_id(obj_id) for obj_id in obj_ids]
+
+    def create_index(self, column_tuple, unique=False):
         params = [(column_name, ASCENDING) for column_name in column_tuple]
-        self._collection.create_index(params)
+        try:
+            self._collection.create_index(params, unique=unique)
+        except MongoDuplicateKeyError as error:
+            raise DuplicateKeyError(str(error)) from error
+        self._info.add_index(tuple(column_tuple))
 
     def has_index(self, columns_tuple):
-        indices = self.get_info()['indices']
-        return columns_tuple in indices
+        return self._info.has_index(columns_tuple)
+
+
+class MongoInformation(object):
+    """
+    Collection and index names for one mongo collection, read from the server on first use and kept
+    until ttl seconds pass (never, if ttl is None) or refresh_information() is called.
+    """
+
+    def __init__(self, database, collection, ttl: float = None) -> None:
+        self._db = database
+        self._collection = collection
+        self._ttl = ttl
+        self._loaded_at = None
+        self._collections = None
+        self._indices = None
+
+    def _refresh_if_stale(self):
+        if self._loaded_at is None or (self._ttl is not None and monotonic() - self._loaded_at >= self._ttl):
+            self.refresh_information()
+
+    def refresh_information(self):
+        self._collections = sorted(self._db.list_collection_names())
+        self._indices = self._read_indices() if self._collection.name in self._collections else []
+        self._loaded_at = monotonic()
+
+    def _read_indices(self):
+        index_info = self._collection.index_information()
+        out = [tuple(pair[0] for pair in info['key']) for key, info in index_info.items() if key != '_id_']
+        return sorted(out)
+
+    @property
+    def collections(self):
+        self._refresh_if_stale()
+        return self._collections[:]
+
+    @property
+    def indices(self):
+        self._refresh_if_stale()
+        return self._indices[:]
+
+    def has_index(self, columns_tuple):
+        self._refresh_if_stale()
+        return columns_tuple in self._indices
+
+    def add_collection(self):
+        """mongo creates a collection on its first insert or index."""
+        if self._loaded_at is not None and self._collection.name not in self._collections:
+            self._collections.append(self._collection.name)
+            self._collections.sort()
+
+    def add_index(self, columns_tuple):
+        if self._loaded_at is None:
+            return
+        self.add_collection()
+        if columns_tuple not in self._indices:
+            self._indices.append(columns_tuple)
+            self._indices.sort()
+
+    def drop_collection(self):
+        if self._loaded_at is None:
+            return
+        self._indices = []
+        if self._collection.name in self._collections:
+            self._collections.remove(self._collection.name)
 
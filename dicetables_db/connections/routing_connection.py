@@ -0,0 +1,92 @@
+from itertools import cycle
+from time import monotonic
+
+from dicetables_db.connections.baseconnection import BaseConnection, DEFAULT_BATCH_SIZE
+
+
+class RoutingConnection(BaseConnection):
+    """
+    Sends writes (insert, create_index, reset_collection, drop_collection) to a primary connection and
+    reads (find, find_one, is_collection_empty) round-robin to replicas.
+
+    Copying data from the primary to the replicas is left to the deployment (a mongo replica set, or
+    sqlite files refreshed with SQLConnection.save_to_target). For read_your_writes seconds after a write,
+    reads go to the primary so a request can read back the tables it just inserted.
+    """
+
+    def __init__(self, primary: BaseConnection, replicas: list = None, read_your_writes: float = 0.0) -> None:
+        self._primary = primary
+        self._replicas = list(replicas) if replicas else []
+        self._replica_cycle = cycle(self._replicas)
+        self._read_your_writes = read_your_writes
+        self._last_write = None
+
+    @property
+    def primary(self):
+        return self._primary
+
+    @property
+    def replicas(self):
+        return self._replicas[:]
+
+    @property
+    def read_your_writes(self):
+        return self._read_your_writes
+
+    def _record_write(self):
+        self._last_write = monotonic()
+
+    def mark_replicas_synced(self):
+        """call when the replicas have caught up with the primary. reads go back to replicas at once."""
+        self._last_write = None
+
+    def _get_reader(self):
+        if not self._replicas or self._is_in_read_your_writes_window():
+            return self._primary
+        return next(self._replica_cycle)
+
+    def _is_in_read_your_writes_window(self):
+        if self._last_write is None:
+            return False
+        return monotonic() - self._last_write < self._read_your_writes
+
+    def get_info(self):
+        info = self._primary.get_info()
+        info['replicas'] = len(self._replicas)
+        return info
+
+    def is_collection_empty(self):
+        return self._get_reader().is_collection_empty()
+
+    def find(self, params_dict=None, projection=None, batch_size=DEFAULT_BATCH_SIZE, sort=None, limit=None):
+        return self._get_reader().find(params_dict, projection, batch_size, sort, limit)
+
+    def find_one(self, params_dict=None, projection=None):
+        return self._get_reader().find_one(params_dict, projection)
+
+    def insert(self, document):
+        self._record_write()
+        return self._primary.insert(document)
+
+    def transaction(self):
+        self._record_write()
+        return self._primary.transaction()
+
+    def reset_collection(self):
+        self._record_write()
+        self._primary.reset_collection()
+
+    def drop_collection(self):
+        self._record_write()
+        self._primary.drop_collection()
+
+    def close(self):
+        for connection in [self._primary] + self._replicas:
+            connection.close()
+
+    def create_index(self, columns_tuple, unique=False):
+        self._record_write()
+        self._primary.create_index(columns_tuple, unique)
+
+    def has_index(self, columns_tuple):
+        return self._primary.has_index(columns_tuple)
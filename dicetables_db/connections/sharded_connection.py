@@ -0,0 +1,188 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+from heapq import merge
+from itertools import chain, islice
+from zlib import crc32
+
+from dicetables_db.connections.baseconnection import BaseConnection, DEFAULT_BATCH_SIZE, DESCENDING
+from dicetables_db.connections.sql_connection import SQLConnection
+
+
+class ShardedConnection(BaseConnection):
+    """
+    Spreads one logical collection over several connections.
+
+    Documents are routed by a hash of their die-type set (the 'group'), so every Finder query, which always
+    names a group, goes to exactly one shard. Queries without a group fan out to every shard, in parallel
+    threads when max_workers > 1. Only use threads with shards that are thread safe (MongoDBConnection).
+    """
+
+    def __init__(self, shards: list, max_workers: int = 1) -> None:
+        if not shards:
+            raise ValueError('ShardedConnection requires at least one shard.')
+        self._shards = list(shards)
+        self._executor = ThreadPoolExecutor(max_workers) if max_workers > 1 else None
+
+    @classmethod
+    def using_SQL(cls, db_path, collection_name, number_of_shards):
+        """each shard gets its own file, db_path with '_<index>' before the extension, so that shards do not
+        share index names or lock each other. ':memory:' shards are already separate databases."""
+        shards = [SQLConnection(_get_shard_path(db_path, index), '{}_{}'.format(collection_name, index))
+                  for index in range(number_of_shards)]
+        return cls(shards)
+
+    @classmethod
+    def using_mongo_db(cls, db_name, collection_name, number_of_shards, ip='localhost', port=27017):
+        from dicetables_db.connections.mongodb_connection import MongoDBConnection
+        shards = [MongoDBConnection(db_name, '{}_{}'.format(collection_name, index), ip, port)
+                  for index in range(number_of_shards)]
+        return cls(shards, max_workers=number_of_shards)
+
+    @property
+    def shards(self):
+        return self._shards[:]
+
+    def get_shard_index(self, group: str) -> int:
+        die_type_set = '&'.join(sorted(group.split('&')))
+        return crc32(die_type_set.encode('utf-8')) % len(self._shards)
+
+    def get_shard(self, group: str) -> BaseConnection:
+        return self._shards[self.get_shard_index(group)]
+
+    def _get_shards_for_query(self, params_dict):
+        if params_dict and isinstance(params_dict.get('group'), str):
+            return [self.get_shard(params_dict['group'])]
+        return self._shards
+
+    def _on_shards(self, shards, method_name, *args):
+        if self._executor is None or len(shards) == 1:
+            return [getattr(shard, method_name)(*args) for shard in shards]
+        return list(self._executor.map(lambda shard: getattr(shard, method_name)(*args), shards))
+
+    def _find_on_shards(self, shards, params_dict, projection, batch_size, sort, limit):
+        """find is lazy, so with threads each worker also fetches the first batch. otherwise the shards would
+        only run their queries one after another as the results are read."""
+        def find_first_batch(shard):
+            documents = iter(shard.find(params_dict, projection, batch_size, sort, limit))
+            return chain(list(islice(documents, batch_size)), documents)
+
+        if self._executor is None or len(shards) == 1:
+            return [shard.find(params_dict, projection, batch_size, sort, limit) for shard in shards]
+        return list(self._executor.map(find_first_batch, shards))
+
+    def get_info(self):
+        shard_info = [shard.get_info() for shard in self._shards]
+        indices = [set(info['indices']) for info in shard_info]
+        info = {
+            'db': [info['db'] for info in shard_info],
+            'collections': sorted(set(chain.from_iterable(info['collections'] for info in shard_info))),
+            'current_collection': [info['current_collection'] for info in shard_info],
+            'indices': sorted(set.intersection(*indices)),
+            'shards': len(self._shards)
+        }
+        return info
+
+    def is_collection_empty(self):
+        return all(self._on_shards(self._shards, 'is_collection_empty'))
+
+    def find(self, params_dict=None, projection=None, batch_size=DEFAULT_BATCH_SIZE, sort=None, limit=None):
+        shards = self._get_shards_for_query(params_dict)
+        if len(shards) == 1:
+            return shards[0].find(params_dict, projection, batch_size, sort, limit)
+        shard_projection, added_columns = _add_sort_columns(projection, sort)
+        results = self._find_on_shards(shards, params_dict, shard_projection, batch_size, sort, limit)
+        if sort:
+            documents = merge(*results, key=lambda document: _SortKey(document, sort))
+        else:
+            documents = chain.from_iterable(results)
+        if limit is not None:
+            documents = islice(documents, limit)
+        if added_columns:
+            documents = (_remove_columns(document, added_columns) for document in documents)
+        return documents
+
+    def find_one(self, params_dict=None, projection=None):
+        shards = self._get_shards_for_query(params_dict)
+        for result in self._on_shards(shards, 'find_one', params_dict, projection):
+            if result is not None:
+                return result
+        return None
+
+    def insert(self, document):
+        return self.get_shard(document.get('group', '')).insert(document)
+
+    @contextmanager
+    def transaction(self):
+        """one transaction per shard. they commit one after another, so this is not atomic across shards."""
+        with ExitStack() as stack:
+            for shard in self._shards:
+                stack.enter_context(shard.transaction())
+            yield
+
+    def reset_collection(self):
+        self._on_shards(self._shards, 'reset_collection')
+
+    def drop_collection(self):
+        self._on_shards(self._shards, 'drop_collection')
+
+    def close(self):
+        self._on_shards(self._shards, 'close')
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def create_index(self, columns_tuple, unique=False):
+        self._on_shards(self._shards, 'create_index', columns_tuple, unique)
+
+    def has_index(self, columns_tuple):
+        return all(self._on_shards(self._shards, 'has_index', columns_tuple))
+
+
+def _get_shard_path(db_path, index):
+    if db_path == ':memory:':
+        return db_path
+    base, extension = os.path.splitext(db_path)
+    return '{}_{}{}'.format(base, index, extension)
+
+
+class _SortKey(object):
+    """orders documents the way the shards sorted them: column by column, with missing values and None
+    first when ascending."""
+
+    def __init__(self, document, sort):
+        self.values = [document.get(col) for col, _ in sort]
+        self.descending = [direction == DESCENDING for _, direction in sort]
+
+    def __lt__(self, other):
+        for value, other_value, descending in zip(self.values, other.values, self.descending):
+            if value == other_value:
+                continue
+            if descending:
+                value, other_value = other_value, value
+            if value is None or other_value is None:
+                return value is None
+            return value < other_value
+        return False
+
+
+def _add_sort_columns(projection, sort):
+    """
+
+    :return: a projection that also returns the sort columns, and the columns to remove from the results
+    """
+    if not projection or not sort or len({bool(value) for value in projection.values()}) != 1:
+        return projection, []
+    sort_columns = [col for col, _ in sort]
+    if any(projection.values()):
+        added = [col for col in sort_columns if col not in projection]
+        new_projection = dict(projection, **{col: 1 for col in added})
+    else:
+        added = [col for col in sort_columns if col in projection]
+        new_projection = {col: value for col, value in projection.items() if col not in added}
+    return new_projection, added
+
+
+def _remove_columns(document, columns):
+    for col in columns:
+        document.pop(col, None)
+    return document
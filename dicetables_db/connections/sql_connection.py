@@ -1,21 +1,57 @@
 import sqlite3 as lite
+from contextlib import contextmanager
+from time import monotonic
 
-from dicetables_db.connections.baseconnection import BaseConnection
+from dicetables_db.connections.baseconnection import (BaseConnection, DuplicateKeyError, DEFAULT_BATCH_SIZE,
+                                                      DESCENDING)
+
+BACKUP_PAGES_PER_STEP = 256
+
+COMPARISONS = {'$lt': '<', '$lte': '<=', '$gt': '>', '$gte': '>=', '$ne': '<>'}
+
+SYNCHRONOUS_VALUES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
 
 
 class SQLConnection(BaseConnection):
-    def __init__(self, db_path, collection_name):
+    def __init__(self, db_path, collection_name, commit_every: int = None, commit_interval: float = None,
+                 synchronous: str = None, journal_mode: str = None):
+        """
+        by default inserts are committed only by close(), commit() or a transaction() block.
+
+        :param commit_every: also commit after this many inserts outside a transaction
+        :param commit_interval: also commit on the first insert this many seconds after the last commit
+        :param synchronous: sqlite PRAGMA synchronous, one of SYNCHRONOUS_VALUES
+        :param journal_mode: sqlite PRAGMA journal_mode, one of JOURNAL_MODES. 'WAL' lets other processes
+            read while this one writes.
+        """
         self._path = db_path
         self._collection = collection_name
+        self._commit_every = commit_every
+        self._commit_interval = commit_interval
+        self._uncommitted = 0
+        self._last_commit = monotonic()
+        self._transaction_depth = 0
 
         self._connection = lite.connect(self._path, detect_types=lite.PARSE_DECLTYPES)
         lite.register_adapter(self.id_class(), self.id_class().to_string)
 
         self._cursor = self._connection.cursor()
+        self._set_pragmas(synchronous, journal_mode)
 
         self._set_up()
         self._in_memory = InMemoryInformation(self)
 
+    def _set_pragmas(self, synchronous, journal_mode):
+        if synchronous is not None:
+            if synchronous.upper() not in SYNCHRONOUS_VALUES:
+                raise ValueError('synchronous must be one of {}'.format(SYNCHRONOUS_VALUES))
+            self._cursor.execute('PRAGMA synchronous = {}'.format(synchronous.upper()))
+        if journal_mode is not None:
+            if journal_mode.upper() not in JOURNAL_MODES:
+                raise ValueError('journal_mode must be one of {}'.format(JOURNAL_MODES))
+            self._cursor.execute('PRAGMA journal_mode = {}'.format(journal_mode.upper()))
+
     def _set_up(self):
         command = "CREATE TABLE IF NOT EXISTS [{}] (_id {}, PRIMARY KEY(_id))".format(self._collection,
                                                                                       self.id_class().__name__)
@@ -48,13 +84,20 @@ class SQLConnection(BaseConnection):
         entries = self._cursor.execute(count_entries).fetchone()[0]
         return entries == 0
 
-    def find(self, params_dict=None, projection=None):
+    def find(self, params_dict=None, projection=None, batch_size=DEFAULT_BATCH_SIZE, sort=None, limit=None):
         keys_list = self._get_columns_list(projection)
-        command, values = self._get_command_and_values(params_dict, keys_list)
-        values_lists = self._cursor.execute(command, values).fetchall()
-
-        to_check = [self._make_dict(keys_list, value_list) for value_list in values_lists]
-        return [element for element in to_check if element is not None]
+        command, values = self._get_command_and_values(params_dict, keys_list, sort, limit)
+        cursor = self._connection.execute(command, values)
+        return self._iter_results(cursor, keys_list, batch_size)
+
+    def _iter_results(self, cursor, keys_list, batch_size):
+        values_lists = cursor.fetchmany(batch_size)
+        while values_lists:
+            for values_list in values_lists:
+                document = self._make_dict(keys_list, values_list)
+                if document is not None:
+                    yield document
+            values_lists = cursor.fetchmany(batch_size)
 
     def find_one(self, params_dict=None, projection=None):
         keys_list = self._get_columns_list(projection)
@@ -65,11 +108,11 @@ class SQLConnection(BaseConnection):
         return self._make_dict(keys_list, values_list)
 
     def _get_columns_list(self, projection):
+        if projection and self._does_projection_use_inclusion(projection):
+            return self._get_columns_by_inclusion(projection)
+        self._in_memory.refresh_columns()
         if not projection:
             return self._in_memory.columns
-        projection_uses_inclusion = self._does_projection_use_inclusion(projection)
-        if projection_uses_inclusion:
-            return self._get_columns_by_inclusion(projection)
         return self._get_columns_by_exlusion(projection)
 
     @staticmethod
@@ -80,24 +123,27 @@ class SQLConnection(BaseConnection):
         return bool_list[0]
 
     def _get_columns_by_inclusion(self, projection):
-        return [col for col in projection if self._in_memory.has_column(col)]
+        return [col for col in projection if self._has_column(col)]
+
+    def _has_column(self, col):
+        if not self._in_memory.has_column(col):
+            # another connection to the same file may have added it after this one read the schema.
+            self._in_memory.refresh_columns()
+        return self._in_memory.has_column(col)
 
     def _get_columns_by_exlusion(self, projection):
         all_cols = self._in_memory.columns
         return [col for col in all_cols if col not in projection]
 
-    def _get_command_and_values(self, params_dict, columns_list):
-        if self._has_non_existent_columns(params_dict) or not columns_list:
+    def _get_command_and_values(self, params_dict, columns_list, sort=None, limit=None):
+        if not columns_list:
             return 'SELECT NULL FROM [{}]'.format(self._collection), []
 
         select_statement = self._get_select_statement(columns_list)
         where_statement, values = self._get_statement_and_values_for_where(params_dict)
-        return select_statement + where_statement, values
-
-    def _has_non_existent_columns(self, params_dict):
-        if not params_dict:
-            return False
-        return any(not self._in_memory.has_column(key) for key in params_dict)
+        order_statement = self._get_order_statement(sort)
+        limit_statement, limit_values = self._get_statement_and_values_for_limit(limit)
+        return select_statement + where_statement + order_statement + limit_statement, values + limit_values
 
     def _get_select_statement(self, columns_list):
         safe_col_names = ['[{}]'.format(col) for col in columns_list]
@@ -108,26 +154,89 @@ class SQLConnection(BaseConnection):
     def _get_statement_and_values_for_where(self, params_dict):
         if not params_dict:
             return '', []
-        where_vals = []
+        where_string, values = self._get_clause_and_values(params_dict)
+        return ' WHERE ' + where_string, values
+
+    def _get_clause_and_values(self, params_dict):
+        if not params_dict:
+            return '1', []
+        clauses = []
         values = []
-        for col, inequality_info in params_dict.items():
-            inequality_str, value = self._get_inequality_data(inequality_info)
-            where_vals.append('[{}]{}?'.format(col, inequality_str))
-            values.append(value)
+        for key, value in params_dict.items():
+            if key == '$or':
+                clause, new_values = self._get_or_clause_and_values(value)
+            else:
+                clause, new_values = self._get_column_clause_and_values(key, value)
+            clauses.append(clause)
+            values += new_values
+        return ' AND '.join(clauses), values
+
+    def _get_or_clause_and_values(self, params_dicts):
+        if not params_dicts:
+            raise ValueError('$or requires a non-empty list.')
+        clauses = []
+        values = []
+        for params_dict in params_dicts:
+            clause, new_values = self._get_clause_and_values(params_dict)
+            clauses.append('({})'.format(clause))
+            values += new_values
+        return '({})'.format(' OR '.join(clauses)), values
+
+    def _get_column_clause_and_values(self, col, query):
+        operators = query if isinstance(query, dict) else {'$eq': query}
+        if not operators:
+            raise ValueError('Empty operator dict for column {!r}.'.format(col))
+        if not self._has_column(col):
+            matches_missing = all(_matches_missing(operator, operand) for operator, operand in operators.items())
+            return ('1' if matches_missing else '0'), []
+        clauses = []
+        values = []
+        for operator, operand in operators.items():
+            clause, new_values = self._get_operator_clause_and_values(col, operator, operand)
+            clauses.append(clause)
+            values += new_values
+        return ' AND '.join(clauses), values
 
-        where_string = ' WHERE ' + ' AND '.join(where_vals)
-        return where_string, values
+    @staticmethod
+    def _get_operator_clause_and_values(col, operator, operand):
+        """a missing field is NULL. as in Mongo, it matches None and is not equal to any other value."""
+        if operator == '$eq':
+            if operand is None:
+                return '[{}] IS NULL'.format(col), []
+            return '[{}]=?'.format(col), [operand]
+        if operator == '$ne':
+            if operand is None:
+                return '[{}] IS NOT NULL'.format(col), []
+            return '([{0}]<>? OR [{0}] IS NULL)'.format(col), [operand]
+        if operator in COMPARISONS:
+            return '[{}]{}?'.format(col, COMPARISONS[operator]), [operand]
+        if operator == '$in':
+            operand = list(operand)
+            values = [value for value in operand if value is not None]
+            clauses = ['[{}] IN ({})'.format(col, ', '.join('?' * len(values)))] if values else []
+            if len(values) < len(operand):
+                clauses.append('[{}] IS NULL'.format(col))
+            if not clauses:
+                return '0', []
+            return '({})'.format(' OR '.join(clauses)), values
+        if operator == '$exists':
+            return '[{}] IS {}NULL'.format(col, 'NOT ' if operand else ''), []
+        raise ValueError('Unsupported query operator: {!r}'.format(operator))
+
+    def _get_order_statement(self, sort):
+        if not sort:
+            return ''
+        order_vals = ['[{}]{}'.format(col, ' DESC' if direction == DESCENDING else '')
+                      for col, direction in sort if self._has_column(col)]
+        if not order_vals:
+            return ''
+        return ' ORDER BY ' + ', '.join(order_vals)
 
     @staticmethod
-    def _get_inequality_data(inequality_info):
-        inequalities = {'$lt': '<', '$lte': '<=', '$gt': '>', '$gte': '>=', '$ne': '<>'}
-        if isinstance(inequality_info, dict):
-            key, value = next(iter(inequality_info.items()))
-            inequality_str = inequalities[key]
-        else:
-            inequality_str = '='
-            value = inequality_info
-        return inequality_str, value
+    def _get_statement_and_values_for_limit(limit):
+        if limit is None:
+            return '', []
+        return ' LIMIT ?', [limit]
 
     def _make_dict(self, keys, values):
         if all(value is None for value in values):
@@ -144,9 +253,55 @@ class SQLConnection(BaseConnection):
         self._update_columns(document)
         id_to_return = self.id_class().new()
         command, values = self._insert_command_and_values(document, id_to_return)
-        self._cursor.execute(command, values)
+        try:
+            self._cursor.execute(command, values)
+        except lite.IntegrityError as error:
+            raise DuplicateKeyError(str(error)) from error
+        self._uncommitted += 1
+        self._commit_if_due()
         return id_to_return
 
+    def insert_many(self, documents):
+        with self.transaction():
+            return super(SQLConnection, self).insert_many(documents)
+
+    def _commit_if_due(self):
+        if self._transaction_depth:
+            return
+        if self._commit_every is not None and self._uncommitted >= self._commit_every:
+            self.commit()
+        elif self._commit_interval is not None and monotonic() - self._last_commit >= self._commit_interval:
+            self.commit()
+
+    def commit(self):
+        self._connection.commit()
+        self._uncommitted = 0
+        self._last_commit = monotonic()
+
+    @contextmanager
+    def transaction(self):
+        """nested blocks join the outermost one, which commits or rolls back everything."""
+        if not self._transaction_depth:
+            if self._connection.in_transaction:
+                self.commit()
+            self._cursor.execute('BEGIN')
+        self._transaction_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self._rollback()
+            raise
+        self._transaction_depth -= 1
+        if not self._transaction_depth:
+            self.commit()
+
+    def _rollback(self):
+        self._connection.rollback()
+        self._uncommitted = 0
+        self._in_memory.refresh_information()
+
     def _insert_command_and_values(self, document, id_to_return):
         values_str = '?, '
         values = [id_to_return]
@@ -166,18 +321,18 @@ class SQLConnection(BaseConnection):
     def _add_column(self, column, value):
         if isinstance(value, int):
             type_str = 'INTEGER'
-            default = 0
         elif isinstance(value, str):
             type_str = 'TEXT'
-            default = ''
         else:
             type_str = 'BLOB'
-            default = None
 
         command = 'ALTER TABLE [{}] ADD COLUMN [{}] {}'.format(self._collection, column, type_str)
-        if default is not None:
-            command += ' DEFAULT {!r}'.format(default)
-        self._cursor.execute(command)
+        try:
+            self._cursor.execute(command)
+        except lite.OperationalError as error:
+            # another connection to the same file added it after this one read the schema.
+            if 'duplicate column name' not in str(error):
+                raise
         self._in_memory.add_column(column)
 
     def drop_collection(self):
@@ -207,7 +362,7 @@ class SQLConnection(BaseConnection):
         self._connection = None
         self._cursor = None
 
-    def create_index(self, columns_tuple):
+    def create_index(self, columns_tuple, unique=False):
         new_column_type = object
         self._update_columns(dict.fromkeys(columns_tuple, new_column_type))
 
@@ -215,39 +370,76 @@ class SQLConnection(BaseConnection):
 
         index_values = ', '.join(safe_col_names)
         index_name = '&'.join(columns_tuple)
-        command = "CREATE INDEX [{}] ON [{}] ({})".format(index_name, self._collection, index_values)
-
-        self._cursor.execute(command)
+        command = "CREATE {}INDEX [{}] ON [{}] ({})".format('UNIQUE ' if unique else '', index_name,
+                                                           self._collection, index_values)
+        try:
+            self._cursor.execute(command)
+        except lite.IntegrityError as error:
+            raise DuplicateKeyError(str(error)) from error
+        except lite.OperationalError as error:
+            # another connection to the same file may have made the same index after this one read the schema.
+            if 'already exists' not in str(error) or not self._is_existing_index(index_name, columns_tuple, unique):
+                raise
+            self._in_memory.refresh_indices()
         self._in_memory.add_index(columns_tuple)
 
+    def _is_existing_index(self, index_name, columns_tuple, unique):
+        index_list = self._cursor.execute('PRAGMA index_list([{}])'.format(self._collection)).fetchall()
+        is_unique = [bool(index_data[2]) for index_data in index_list if index_data[1] == index_name]
+        if is_unique != [unique]:
+            return False
+        index_info = self._cursor.execute('PRAGMA index_info([{}])'.format(index_name)).fetchall()
+        return tuple(col_data[2] for col_data in index_info) == tuple(columns_tuple)
+
     def has_index(self, columns_tuple):
         return self._in_memory.has_index(columns_tuple)
 
-    # TODO flesh out these two methods and test them.  just basic idea. need serious
-    def save_to_target(self, db_name):
-        """
-        this is just notes.  this is a super buggy idea and will only work with a bit of tweaking.
+    def save_to_target(self, db_path, progress=None):
         """
-        commands = self._connection.iterdump()
-        target_db = lite.connect(db_name)
-        cursor = target_db.cursor()
-        for command in commands:
-            cursor.execute(command)
-        target_db.commit()
-        target_db.close()
-
-    def load_from_target(self, db_name):
+        copies the whole database (every collection) to db_path with the sqlite backup API.
+
+        :param progress: optional callable(status, remaining_pages, total_pages)
         """
-        this is just notes.  this is a super buggy idea and will only work with a bit of tweaking.
+        self._connection.commit()
+        target_db = lite.connect(db_path)
+        try:
+            self._backup(self._connection, target_db, progress)
+        finally:
+            target_db.close()
+
+    def load_from_target(self, db_path, progress=None):
         """
-        self.drop_collection()
-        db_connect = lite.connect(db_name)
-        commands = db_connect.iterdump()
+        replaces the whole database (every collection) with the one at db_path using the sqlite backup API.
 
-        for command in commands:
-            self.cursor.execute(command)
+        :param progress: optional callable(status, remaining_pages, total_pages)
+        """
+        self._connection.commit()
+        source_db = lite.connect(db_path)
+        try:
+            self._backup(source_db, self._connection, progress)
+        finally:
+            source_db.close()
+        self._set_up()
         self._in_memory.refresh_information()
 
+    @staticmethod
+    def _backup(source, target, progress):
+        pages_per_step = -1 if progress is None else BACKUP_PAGES_PER_STEP
+        source.backup(target, pages=pages_per_step, progress=progress)
+
+
+def _matches_missing(operator, operand):
+    """whether a field that no document has satisfies the operator, as in Mongo."""
+    if operator == '$exists':
+        return not operand
+    if operator == '$eq':
+        return operand is None
+    if operator == '$ne':
+        return operand is not None
+    if operator == '$in':
+        return None in operand
+    return False
+
 
 class InMemoryInformation(object):
     def __init__(self, connection):
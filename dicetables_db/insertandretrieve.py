@@ -1,48 +1,153 @@
-from typing import Optional
+from typing import List, Optional
 
 from dicetables import DiceTable, DiceRecord
 
-from dicetables_db.connections.baseconnection import BaseConnection
+from dicetables_db.connections.baseconnection import BaseConnection, DuplicateKeyError, DESCENDING
 from dicetables_db.tools.documentid import DocumentId
 from dicetables_db.tools.serializer import Serializer
-from dicetables_db.tools.dbprep import PrepDiceTable, SearchParams
+from dicetables_db.tools.dbprep import PrepDiceTable, SearchParams, get_group, get_hash, get_label_list, get_score
+from dicetables_db.tools.bloomfilter import BloomFilter
+from dicetables_db.tools.tablestore import MMapTableStore
+
+HAS_TABLES_CHUNK_SIZE = 500
 
 
 class DiceTableInsertionAndRetrieval(object):
-    def __init__(self, connection: BaseConnection) -> None:
+    def __init__(self, connection: BaseConnection, table_store: MMapTableStore = None, table_cache=None,
+                 bloom_filter: BloomFilter = None) -> None:
+        """
+
+        :param table_store: optional side store. added tables are also written to it and get_table reads
+            from it before falling back to the connection.
+        :param table_cache: optional cache with get(doc_id) and put(doc_id, table), such as
+            tools.sharedcache.SharedTableCache. get_table checks it first and fills it on a miss.
+        :param bloom_filter: optional filter of stored hashes. exact-match lookups it rules out skip the
+            database. an empty filter is rebuilt from the collection here. a filter loaded from disk must
+            have been saved from this collection. tables added by other processes are not in it, so a miss
+            may be wrong for them, and the unique hash index still stops add_table from duplicating them.
+        """
         self._conn = connection
+        self._store = table_store
+        self._cache = table_cache
         if not self.has_required_index():
             self._create_required_index()
+        self._use_hash = self._conn.has_index(('hash',))
+        self._bloom = bloom_filter if self._use_hash else None
+        if self._bloom is not None and not len(self._bloom):
+            self.rebuild_bloom_filter()
 
     @property
     def connection_info(self) -> dict:
         return self._conn.get_info()
 
     def has_required_index(self) -> bool:
-        return self._conn.has_index(('group', 'score'))
+        return self._conn.has_index(('group', 'score')) and self._conn.has_index(('hash',))
 
     def _create_required_index(self):
-        self._conn.create_index(('group', 'score'))
+        if not self._conn.has_index(('group', 'score')):
+            self._conn.create_index(('group', 'score'))
+        if not self._conn.has_index(('hash',)) and self._conn.is_collection_empty():
+            self._conn.create_index(('hash',), unique=True)
 
     def reset(self):
         self._conn.reset_collection()
         self._create_required_index()
+        self._use_hash = True
+        if self._bloom is not None:
+            self._bloom.clear()
+
+    def rebuild_bloom_filter(self):
+        self._bloom.clear()
+        for document in self._conn.find({}, {'hash': 1}):
+            self._bloom.add(document['hash'])
+
+    def _might_have(self, hash_str):
+        return self._bloom is None or hash_str in self._bloom
 
     def has_table(self, dice_table: DiceTable) -> bool:
         if dice_table.dice_data() == DiceRecord.new():
             return False
 
-        finder = Finder(self._conn, dice_table.get_list())
+        return self.has_dice_list(dice_table.get_list())
+
+    def has_dice_list(self, dice_list: list) -> bool:
+        finder = Finder(self._conn, dice_list, self._use_hash)
+        if not self._might_have(finder.hash):
+            return False
         return finder.get_exact_match() is not None
 
+    def has_tables(self, dice_tables: list) -> List[bool]:
+        """
+        has_table for many tables with one query per group in each HAS_TABLES_CHUNK_SIZE tables. every query
+        names its group, so a ShardedConnection sends it to one shard.
+
+        :return: [bool, ...] in the same order as dice_tables
+        """
+        dice_lists = [table.get_list() for table in dice_tables]
+        keys = [self._get_key(dice_list) for dice_list in dice_lists]
+        to_check = [(key, dice_list) for key, dice_list in zip(keys, dice_lists)
+                    if dice_list and self._might_have(key)]
+        found = set()
+        for start in range(0, len(to_check), HAS_TABLES_CHUNK_SIZE):
+            chunk = to_check[start: start + HAS_TABLES_CHUNK_SIZE]
+            if self._use_hash:
+                found.update(self._find_stored_hashes(chunk))
+            else:
+                found.update(self._find_stored_labels([dice_list for _, dice_list in chunk]))
+        return [key in found for key in keys]
+
+    def _get_key(self, dice_list):
+        if self._use_hash:
+            return get_hash(get_label_list(dice_list))
+        return tuple(get_label_list(dice_list))
+
+    def _find_stored_hashes(self, hashes_and_dice_lists):
+        hashes_by_group = {}
+        for hash_str, dice_list in hashes_and_dice_lists:
+            hashes_by_group.setdefault(get_group(get_label_list(dice_list)), []).append(hash_str)
+        for group, hashes in hashes_by_group.items():
+            for document in self._conn.find({'group': group, 'hash': {'$in': hashes}}, {'hash': 1}):
+                yield document['hash']
+
+    def _find_stored_labels(self, dice_lists):
+        """for collections made before the hash column: match group and score, then compare die counts."""
+        label_lists = [get_label_list(dice_list) for dice_list in dice_lists]
+        groups = sorted({'&'.join(label for label, _ in label_list) for label_list in label_lists})
+        scores = sorted({get_score(dice_list) for dice_list in dice_lists})
+        projection = {'group': 1}
+        for label_list in label_lists:
+            projection.update((label, 1) for label, _ in label_list)
+
+        query = {'group': {'$in': groups}, 'score': {'$in': scores}}
+        for document in self._conn.find(query, projection):
+            yield tuple((label, document.get(label)) for label in document['group'].split('&'))
+
     def add_table(self, dice_table: DiceTable) -> DocumentId:
+        """
+
+        :return: DocumentId of the new document, or of the stored copy if the table is already in the
+            database (detected atomically by the unique 'hash' index).
+        """
         adder = PrepDiceTable(dice_table)
-        doc_id = self._conn.insert(adder.get_dict())
+        try:
+            doc_id = self._conn.insert(adder.get_dict())
+        except DuplicateKeyError:
+            doc_id = self._conn.find_one({'group': adder.get_group(), 'hash': adder.get_hash()}, {'_id': 1})['_id']
+        else:
+            if self._store is not None:
+                self._store.add(doc_id, adder.get_serialized())
+        if self._bloom is not None:
+            self._bloom.add(adder.get_hash())
         return doc_id
 
+    def add_tables(self, dice_tables: list) -> List[DocumentId]:
+        """add_table for each table, in one transaction."""
+        with self._conn.transaction():
+            return [self.add_table(table) for table in dice_tables]
+
     def find_nearest_table(self, dice_list: list) -> Optional[DocumentId]:
-        finder = Finder(self._conn, dice_list)
-        doc_id = finder.get_exact_match()
+        finder = Finder(self._conn, dice_list, self._use_hash)
+        doc_id = finder.get_exact_match() if self._might_have(finder.hash) else None
         if doc_id is None:
             doc_id = finder.find_nearest_table()
 
@@ -51,20 +156,41 @@ class DiceTableInsertionAndRetrieval(object):
         return doc_id
 
     def get_table(self, doc_id: DocumentId) -> DiceTable:
+        if self._cache is not None:
+            cached = self._cache.get(doc_id)
+            if cached is not None:
+                return cached
+        table = self._load_table(doc_id)
+        if self._cache is not None:
+            self._cache.put(doc_id, table)
+        return table
+
+    def _load_table(self, doc_id):
+        if self._store is not None:
+            stored = self._store.get(doc_id)
+            if stored is not None:
+                return Serializer.deserialize(stored)
         data = self._conn.find_one({'_id': doc_id}, {'serialized': True})
         return Serializer.deserialize(data['serialized'])
 
 
 class Finder(object):
 
-    def __init__(self, connection: BaseConnection, dice_list: list) -> None:
+    def __init__(self, connection: BaseConnection, dice_list: list, use_hash: bool = True) -> None:
         self._conn = connection
+        self._use_hash = use_hash
+        self._group = get_group(get_label_list(dice_list))
+        self._hash = get_hash(get_label_list(dice_list))
         self._param_maker = SearchParams(dice_list)
         self._param_score = self._param_maker.get_score()
 
         self._doc_id = None  # type: DocumentId
         self._highest_found_score = 0
 
+    @property
+    def hash(self) -> str:
+        return self._hash
+
     def get_exact_match(self) -> Optional[DocumentId]:
         query_dict = self._get_query_dict_for_exact()
         doc_id_in_dict = self._conn.find_one(query_dict, {'_id': 1})
@@ -73,18 +199,19 @@ class Finder(object):
         return doc_id_in_dict['_id']
 
     def _get_query_dict_for_exact(self):
+        if self._use_hash:
+            return {'group': self._group, 'hash': self._hash}
         group, dice_dict = next(self._param_maker.get_search_params())[0]
         dice_dict['group'] = group
         dice_dict['score'] = self._param_score
         return dice_dict
 
     def find_nearest_table(self) -> Optional[DocumentId]:
-        for search_param in self._param_maker.get_search_params():
-            if self._is_close_enough():
+        for bound, group, dice_dict in self._param_maker.get_bounded_search_params():
+            if bound <= self._highest_found_score or self._is_close_enough():
                 break
-            candidates = self._get_list_of_candidates(search_param)
-            if candidates:
-                biggest_score = max(candidates, key=lambda dictionary: dictionary['score'])
+            biggest_score = self._get_best_candidate(group, dice_dict)
+            if biggest_score is not None:
                 self._update_id_and_highest_score(biggest_score)
 
         if self._doc_id is None:
@@ -95,13 +222,10 @@ class Finder(object):
         close_enough = 0.8
         return (self._highest_found_score / float(self._param_score)) >= close_enough
 
-    def _get_list_of_candidates(self, group_dice_dict_list):
-        out = []
-        for group, dice_dict in group_dice_dict_list:
-            query_dict = self._get_query_dict_for_nearest(group, dice_dict)
-            cursor = self._conn.find(query_dict, {'_id': 1, 'score': 1})
-            out += list(cursor)
-        return out
+    def _get_best_candidate(self, group, dice_dict):
+        query_dict = self._get_query_dict_for_nearest(group, dice_dict)
+        results = self._conn.find(query_dict, {'_id': 1, 'score': 1}, sort=[('score', DESCENDING)], limit=1)
+        return next(iter(results), None)
 
     def _get_query_dict_for_nearest(self, group, dice_dict):
         output_dict = {'group': group, 'score': {'$lte': self._param_score}}
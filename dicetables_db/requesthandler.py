@@ -1,38 +1,92 @@
+from concurrent.futures import ProcessPoolExecutor
 from queue import Queue
 import string
 
 from dicetables_db.connections.sql_connection import SQLConnection
-from dicetables_db.connections.mongodb_connection import MongoDBConnection
 from dicetables_db.connections.baseconnection import BaseConnection
 
 from dicetables_db.insertandretrieve import DiceTableInsertionAndRetrieval
+from dicetables_db.responsecache import ResponseCache
 from dicetables_db.taskmanager import TaskManager
+from dicetables_db.tools.axestools import encode_axes, downsample_axes
+from dicetables_db.tools.dbprep import get_hash, get_label_list
+from dicetables_db.tools.lrucache import LRUCache
+from dicetables_db.tools.tasktools import Moments, ModifiedTable
 
+from dicetables.eventsinfo import safe_true_div
+from dicetables.tools.numberforamtter import NumberFormatter
 from dicetables import (Parser, DiceTable, DiceRecord, EventsCalculations,
                         ParseError, LimitsError, InvalidEventsError, DiceRecordError)
 
 
 class RequestHandler(object):
-    def __init__(self, connection: BaseConnection, max_dice_value=12000) -> None:
+    def __init__(self, connection: BaseConnection, max_dice_value=12000, parse_cache_size=1024,
+                 response_cache: ResponseCache = None, table_store=None, table_cache=None, bloom_filter=None,
+                 saver=None, closed_form=False) -> None:
+        """
+        the database is not touched (index check and creation) until the first request.
+
+        parse_cache_size: how many parsed and validated instruction strings to keep, keyed by the stripped,
+        lower case string and the delimiters.
+
+        response_cache: optional responsecache.ResponseCache of finished responses, keyed by get_response_key.
+
+        table_store, table_cache and bloom_filter are passed to DiceTableInsertionAndRetrieval. saver and
+        closed_form are passed to TaskManager.
+        """
         self._conn = connection
-        self._task_manager = TaskManager(DiceTableInsertionAndRetrieval(self._conn))
+        self._insert_retrieve_kwargs = {'table_store': table_store, 'table_cache': table_cache,
+                                        'bloom_filter': bloom_filter}
+        self._task_manager_kwargs = {'saver': saver, 'closed_form': closed_form}
+        self._task_manager = None
         self._table = DiceTable.new()
         self._parser = Parser(ignore_case=True)
         self._max_dice_value = max_dice_value
+        self._parsed = LRUCache(parse_cache_size)
+        self._response_cache = response_cache
 
     @classmethod
-    def using_SQL(cls, db_path, collection_name, max_dice_value=12000):
-        return cls(SQLConnection(db_path, collection_name), max_dice_value=max_dice_value)
+    def using_SQL(cls, db_path, collection_name, max_dice_value=12000, **kwargs):
+        """
+
+        :param kwargs: any other RequestHandler keyword arguments.
+        """
+        return cls(SQLConnection(db_path, collection_name), max_dice_value=max_dice_value, **kwargs)
 
     @classmethod
-    def using_mongo_db(cls, db_name, collection_name, ip='localhost', port=27017, max_dice_value=12000):
-        return cls(MongoDBConnection(db_name, collection_name, ip, port), max_dice_value=max_dice_value)
+    def using_mongo_db(cls, db_name, collection_name, ip='localhost', port=27017, max_dice_value=12000, **kwargs):
+        """
+
+        :param kwargs: any other RequestHandler keyword arguments.
+        """
+        from dicetables_db.connections.mongodb_connection import MongoDBConnection
+        return cls(MongoDBConnection(db_name, collection_name, ip, port), max_dice_value=max_dice_value, **kwargs)
+
+    def _get_task_manager(self):
+        if self._task_manager is None:
+            insert_retrieve = DiceTableInsertionAndRetrieval(self._conn, **self._insert_retrieve_kwargs)
+            self._task_manager = TaskManager(insert_retrieve, **self._task_manager_kwargs)
+        return self._task_manager
 
     def request_dice_table_construction(self, instructions: str, update_queue: Queue = None,
                                         num_delimiter: str = '*', pairs_delimiter: str = '&') -> None:
 
+        record = self._parse_instructions(instructions, num_delimiter, pairs_delimiter)
+
+        self._table = self._get_task_manager().process_request(record, update_queue=update_queue,
+                                                               lazy_modifier=True)
+
+    def _parse_instructions(self, instructions, num_delimiter='*', pairs_delimiter='&'):
         self._raise_error_for_bad_delimiter(num_delimiter, pairs_delimiter)
 
+        key = (instructions.strip().lower(), num_delimiter, pairs_delimiter)
+        record = self._parsed.get(key)
+        if record is None:
+            record = self._parse_and_check(instructions, num_delimiter, pairs_delimiter)
+            self._parsed.put(key, record)
+        return record
+
+    def _parse_and_check(self, instructions, num_delimiter, pairs_delimiter):
         record = DiceRecord.new()
 
         if instructions.strip() == '':
@@ -51,8 +105,7 @@ class RequestHandler(object):
             record = record.add_die(die, number)
 
         self._check_record_against_max_dice_value(record)
-
-        self._table = self._task_manager.process_request(record, update_queue=update_queue)
+        return record
 
     @staticmethod
     def _raise_error_for_bad_delimiter(num_delimiter, pairs_delimiter):
@@ -68,37 +121,301 @@ class RequestHandler(object):
                              .format(self._max_dice_value))
 
     def get_table(self):
+        if isinstance(self._table, ModifiedTable):
+            self._table = self._table.to_dice_table()
         return self._table
 
     def close_connection(self):
         self._conn.close()
 
-    def get_response(self, input_str, update_queue=None):
-        errors = (ValueError, SyntaxError, AttributeError, IndexError,
-                  ParseError, LimitsError, InvalidEventsError, DiceRecordError)
+    def get_response(self, input_str, update_queue=None, fields=None, max_points=None):
+        """
+        with a response_cache, a repeated request is answered from it and get_table() is not updated.
+        """
+        try:
+            record = self._parse_instructions(input_str)
+            key = self._get_cache_key(record, fields, max_points)
+            cached = None if key is None else self._response_cache.get(key)
+            if cached is not None:
+                if update_queue is not None:
+                    update_queue.put('STOP')
+                return cached
+
+            self._table = self._get_task_manager().process_request(record, update_queue=update_queue,
+                                                                   lazy_modifier=True)
+            moments = Moments.from_dice_list(self._table.get_list())
+            response = make_dict(self._table, fields, max_points, moments)
+            if key is not None:
+                self._response_cache.put(key, response)
+            return response
+        except RESPONSE_ERRORS as e:
+            return _make_error_dict(e)
+
+    def get_responses(self, input_strs: list, fields=None, max_points=None, workers=1) -> list:
+        """
+        get_response for each of input_strs, in order.
+
+        tables are built together by TaskManager.process_requests, so repeated requests are built once and
+        smaller requests feed larger ones. with workers > 1, the responses are made in a process pool.
+        """
+        try:
+            _check_fields(fields)
+            field_error = None
+        except ValueError as e:
+            field_error = e
+        responses = [None] * len(input_strs)
+        records = {}
+        for index, input_str in enumerate(input_strs):
+            try:
+                record = self._parse_instructions(input_str)
+            except RESPONSE_ERRORS as e:
+                responses[index] = _make_error_dict(e)
+            else:
+                if field_error is not None:
+                    responses[index] = _make_error_dict(field_error)
+                    continue
+                key = self._get_cache_key(record, fields, max_points)
+                cached = None if key is None else self._response_cache.get(key)
+                if cached is not None:
+                    responses[index] = cached
+                else:
+                    records.setdefault(tuple(sorted(record.get_dict().items())), (record, key, []))[2].append(index)
+        if not records:
+            return responses
 
         try:
-            self.request_dice_table_construction(input_str, update_queue)
-            return make_dict(self._table)
-        except errors as e:
-            return {'error': e.args[0], 'type': e.__class__.__name__}
+            tables = self._get_task_manager().process_requests([record for record, _, _ in records.values()],
+                                                               lazy_modifier=True)
+        except RESPONSE_ERRORS:
+            for indices in sorted((indices for _, _, indices in records.values()), key=lambda indices: indices[-1]):
+                response = self.get_response(input_strs[indices[0]], fields=fields, max_points=max_points)
+                for index in indices:
+                    responses[index] = dict(response)
+            return responses
+
+        last_indices = [indices[-1] for _, _, indices in records.values()]
+        self._table = tables[last_indices.index(max(last_indices))]
+        jobs = [(table, fields, max_points, Moments.from_dice_list(table.get_list())) for table in tables]
+        if workers <= 1:
+            made = [_make_dict_or_error(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                made = list(executor.map(_make_dict_or_error, *zip(*jobs)))
+        for response, (_, key, indices) in zip(made, records.values()):
+            if key is not None and 'error' not in response:
+                self._response_cache.put(key, response)
+            for index in indices:
+                responses[index] = dict(response)
+        return responses
+
+    def _get_cache_key(self, record, fields, max_points):
+        if self._response_cache is None:
+            return None
+        return get_response_key(record, fields, max_points)
+
+
+RESPONSE_ERRORS = (ValueError, SyntaxError, AttributeError, IndexError,
+                   ParseError, LimitsError, InvalidEventsError, DiceRecordError)
+
+
+def _make_error_dict(error):
+    return {'error': error.args[0], 'type': error.__class__.__name__}
+
+
+def _make_dict_or_error(dice_table, fields, max_points, moments):
+    try:
+        return make_dict(dice_table, fields, max_points, moments)
+    except RESPONSE_ERRORS as e:
+        return _make_error_dict(e)
+
+
+RESPONSE_KEY_VERSION = 1
+
+
+def get_response_key(record: DiceRecord, fields=None, max_points: int = None) -> str:
+    """
+    the same dice, modifiers included, in any order and case give the same key. fields and max_points are
+    part of it because they change the response.
+    """
+    fields = RESPONSE_FIELDS if fields is None else tuple(fields)
+    record_hash = get_hash(get_label_list(sorted(record.get_dict().items())))
+    return '{}|{}|{}|{}'.format(RESPONSE_KEY_VERSION, record_hash, ','.join(fields), max_points)
+
+
+RESPONSE_FIELDS = ('diceStr', 'name', 'data', 'tableString', 'forSciNum', 'range', 'mean', 'stddev')
+EXTRA_FIELDS = ('binaryData',)
+AXES_FIELDS = ('data', 'binaryData')
+ROWS_PER_CHUNK = 1000
+DOWNSAMPLED_AXES = LRUCache(128)
+
 
+def _check_fields(fields):
+    if fields is None:
+        return RESPONSE_FIELDS
+    unknown = [field for field in fields if field not in RESPONSE_FIELDS + EXTRA_FIELDS]
+    if unknown:
+        raise ValueError('Unknown response field(s): {}'.format(', '.join(map(str, unknown))))
+    return tuple(fields)
 
-def make_dict(dice_table: DiceTable):
-    calc = EventsCalculations(dice_table)
-    out = dict()
-    out['diceStr'] = '\n'.join(['{!r}: {}'.format(die, number) for die, number in dice_table.get_list()])
-    out['name'] = repr(dice_table)
 
-    out['data'] = calc.percentage_axes()
-    out['tableString'] = calc.full_table_string()
+def _get_dice_str(dice_table, calc):
+    return '\n'.join(['{!r}: {}'.format(die, number) for die, number in dice_table.get_list()])
 
+
+def _get_for_scinum(calc):
     for_scinum_lst = [el.split(': ') for el in calc.full_table_string(6, -1).split('\n')[:-1]]
-    for_scinum_dict = {int(pair[0]): pair[1].split('e+') for pair in for_scinum_lst}
+    return {int(pair[0]): pair[1].split('e+') for pair in for_scinum_lst}
+
+
+_FIELD_MAKERS = {
+    'diceStr': _get_dice_str,
+    'name': lambda dice_table, calc: repr(dice_table),
+    'tableString': lambda dice_table, calc: calc.full_table_string(),
+    'forSciNum': lambda dice_table, calc: _get_for_scinum(calc),
+    'range': lambda dice_table, calc: calc.events_range(),
+    'mean': lambda dice_table, calc: round(calc.mean(), 3),
+    'stddev': lambda dice_table, calc: calc.stddev(3),
+}
+
+
+class _ResponseCalculations(EventsCalculations):
+    """
+    EventsCalculations of a table with every event moved by offset, read from the unmoved table. mean and
+    stddev come from moments when they are given.
+    """
+
+    def __init__(self, events, offset=0, moments: Moments = None) -> None:
+        super(_ResponseCalculations, self).__init__(events)
+        self._events = events
+        self.offset = offset
+        self._moments = moments
+
+    def mean(self):
+        if self._moments is not None:
+            return self._moments.mean()
+        if not self.offset:
+            return super(_ResponseCalculations, self).mean()
+        total = self.info.total_occurrences()
+        numerator = sum(value * frequency for value, frequency in self.info.get_items()) + self.offset * total
+        return safe_true_div(numerator, total)
+
+    def stddev(self, decimal_place=4):
+        if self._moments is not None:
+            return self._moments.stddev(decimal_place)
+        if not self.offset:
+            return super(_ResponseCalculations, self).stddev(decimal_place)
+        # the inherited stddev would use the moved mean with the unmoved events.
+        return EventsCalculations(self._events).stddev(decimal_place)
+
+    def events_range(self):
+        return tuple(value + self.offset for value in self.info.events_range())
+
+    def all_events_include_zeroes(self):
+        rows = self.info.all_events_include_zeroes()
+        return rows if not self.offset else [(value + self.offset, frequency) for value, frequency in rows]
+
+    def full_table_string(self, shown_digits=4, max_comma_exp=6):
+        if not self.offset:
+            return super(_ResponseCalculations, self).full_table_string(shown_digits, max_comma_exp)
+        return ''.join(_iter_table_rows(self, ROWS_PER_CHUNK, shown_digits, max_comma_exp, ''.join))
+
+    def percentage_axes(self):
+        return _move_axes(super(_ResponseCalculations, self).percentage_axes(), self.offset)
+
+
+def _move_axes(axes, offset):
+    if not offset:
+        return axes
+    x_axis, y_axis = axes
+    return [tuple(value + offset for value in x_axis), y_axis]
+
+
+def _get_calculations(dice_table, moments):
+    if isinstance(dice_table, ModifiedTable):
+        return _ResponseCalculations(dice_table.table, dice_table.modifier, moments)
+    return _ResponseCalculations(dice_table, 0, moments)
+
+
+def _get_axes(dice_table, calc, max_points):
+    """only a ModifiedTable is cached. TaskManager built it from its dice record, so the record fixes the events."""
+    if max_points is None:
+        return calc.percentage_axes()
+    if not isinstance(dice_table, ModifiedTable):
+        return downsample_axes(dice_table, max_points)
+    key = (tuple(dice_table.get_list()), max_points)
+    axes = DOWNSAMPLED_AXES.get_or_make(
+        key, lambda: _move_axes(downsample_axes(dice_table.table, max_points), calc.offset))
+    return list(axes)
+
+
+def make_dict(dice_table: DiceTable, fields=None, max_points: int = None, moments: Moments = None):
+    """
+    fields: names from RESPONSE_FIELDS and EXTRA_FIELDS. only these are computed. default is RESPONSE_FIELDS.
+    'binaryData' is 'data' packed by tools.axestools.encode_axes.
+
+    max_points: if set, 'data' and 'binaryData' are downsampled to about that many points
+    (tools.axestools.downsample_axes). downsampled axes of a ModifiedTable are cached in DOWNSAMPLED_AXES.
+
+    moments: the table's tools.tasktools.Moments. if given, 'mean' and 'stddev' come from it instead of
+    a pass over the events.
+
+    dice_table may be a tools.tasktools.ModifiedTable. its modifier is added to the events as they are
+    rendered, so the modified events are never built.
+    """
+    fields = _check_fields(fields)
+    calc = _get_calculations(dice_table, moments)
+    out = {field: _FIELD_MAKERS[field](dice_table, calc) for field in fields if field not in AXES_FIELDS}
+    if any(field in AXES_FIELDS for field in fields):
+        axes = _get_axes(dice_table, calc, max_points)
+        if 'data' in fields:
+            out['data'] = axes
+        if 'binaryData' in fields:
+            out['binaryData'] = encode_axes(axes)
+    return {field: out[field] for field in fields}
+
+
+def iter_response(dice_table: DiceTable, fields=None, rows_per_chunk: int = ROWS_PER_CHUNK,
+                  max_points: int = None, moments: Moments = None):
+    """
+    the same fields as make_dict, as (field, chunk) pairs. 'tableString', 'forSciNum' and 'data' are
+    built and yielded rows_per_chunk rows at a time; every other field is one chunk.
+
+    joining the 'tableString' chunks, updating a dict with the 'forSciNum' chunks and extending both
+    axes with the 'data' chunks gives the make_dict values.
+    """
+    fields = _check_fields(fields)
+    if rows_per_chunk < 1:
+        raise ValueError('rows_per_chunk must be at least 1.')
+    calc = _get_calculations(dice_table, moments)
+    for field in fields:
+        if field == 'tableString':
+            chunks = _iter_table_rows(calc, rows_per_chunk, 4, 6, ''.join)
+        elif field == 'forSciNum':
+            chunks = _iter_table_rows(calc, rows_per_chunk, 6, -1, _sci_num_chunk)
+        elif field == 'data':
+            chunks = _iter_axes(_get_axes(dice_table, calc, max_points), rows_per_chunk)
+        elif field == 'binaryData':
+            chunks = [encode_axes(_get_axes(dice_table, calc, max_points))]
+        else:
+            chunks = [_FIELD_MAKERS[field](dice_table, calc)]
+        for chunk in chunks:
+            yield field, chunk
+
+
+def _iter_table_rows(calc, rows_per_chunk, shown_digits, max_comma_exp, join):
+    formatter = NumberFormatter(shown_digits=shown_digits, max_comma_exp=max_comma_exp)
+    right_just = max(len(str(value)) for value in calc.events_range())
+    rows = calc.all_events_include_zeroes()
+    for start in range(0, len(rows), rows_per_chunk):
+        yield join(['{:>{}}: {}\n'.format(value, right_just, formatter.format(frequency))
+                    for value, frequency in rows[start:start + rows_per_chunk]])
+
+
+def _sci_num_chunk(lines):
+    return {int(value): number.split('e+') for value, number in (line[:-1].split(': ') for line in lines)}
 
-    out['forSciNum'] = for_scinum_dict
 
-    out['range'] = calc.info.events_range()
-    out['mean'] = round(calc.mean(), 3)
-    out['stddev'] = calc.stddev(3)
-    return out
+def _iter_axes(axes, rows_per_chunk):
+    x_axis, y_axis = axes
+    for start in range(0, len(x_axis), rows_per_chunk):
+        yield [x_axis[start:start + rows_per_chunk], y_axis[start:start + rows_per_chunk]]
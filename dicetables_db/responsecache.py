@@ -0,0 +1,89 @@
+import sqlite3
+from threading import Lock
+
+from dicetables_db.tools.lrucache import LRUCache
+from dicetables_db.tools.serializer import Serializer
+
+
+class ResponseCache(object):
+    """
+    A two tier cache of finished responses: an in-memory LRU in front of an optional sqlite file.
+
+    Entries found on disk are copied to memory. Every put goes to both tiers, so the file keeps every
+    response ever made until clear() and survives restarts. keys are strings; see RequestHandler for how
+    it builds them.
+
+    Both tiers hold the serialized response, so every get returns a new copy that the caller may change.
+    """
+
+    def __init__(self, path: str = None, max_memory: int = 256) -> None:
+        self._memory = LRUCache(max_memory)
+        self._lock = Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response BLOB)')
+            self._db.commit()
+
+    def get(self, key: str):
+        """
+
+        :return: the cached response or None
+        """
+        serialized = self._memory.get(key)
+        if serialized is not None:
+            self._count(hits=1)
+            return Serializer.deserialize(serialized)
+        serialized = self._get_from_disk(key)
+        if serialized is None:
+            self._count(misses=1)
+            return None
+        self._memory.put(key, serialized)
+        self._count(hits=1, disk_hits=1)
+        return Serializer.deserialize(serialized)
+
+    def put(self, key: str, response: dict):
+        serialized = Serializer.serialize(response)
+        self._memory.put(key, serialized)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?)', (key, serialized))
+                self._db.commit()
+
+    def clear(self):
+        self._memory.clear()
+        if self._db is not None:
+            with self._lock:
+                self._db.execute('DELETE FROM responses')
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def get_stats(self) -> dict:
+        """
+
+        :return: {'hits': all hits, 'disk_hits': hits that were only on disk, 'misses': misses,
+                  'memory_size': entries in memory}
+        """
+        with self._lock:
+            return {'hits': self._hits, 'disk_hits': self._disk_hits, 'misses': self._misses,
+                    'memory_size': len(self._memory)}
+
+    def _get_from_disk(self, key):
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _count(self, hits=0, disk_hits=0, misses=0):
+        with self._lock:
+            self._hits += hits
+            self._disk_hits += disk_hits
+            self._misses += misses
@@ -2,14 +2,28 @@ from queue import Queue
 
 from dicetables import DiceRecord, DiceTable
 
-from dicetables_db.tools.tasktools import TableGenerator, is_new_table, extract_modifiers, apply_modifier
+from dicetables_db.tools.dbprep import get_score, get_label_list
+from dicetables_db.tools.lrucache import LRUCache
+from dicetables_db.tools.tasktools import (TableGenerator, is_new_table, extract_modifiers, ModifiedTable,
+                                           get_dice_power_dict, get_die_step)
 from dicetables_db.insertandretrieve import DiceTableInsertionAndRetrieval
 
 
 class TaskManager(object):
-    def __init__(self, insert_retrieve: DiceTableInsertionAndRetrieval, step_size=30) -> None:
+    def __init__(self, insert_retrieve: DiceTableInsertionAndRetrieval, step_size=30, saver=None,
+                 closed_form=False, closed_form_cache_size=32) -> None:
+        """
+
+        :param saver: optional object with submit(table_list), such as writebehind.WriteBehindSaver.
+            process_request hands intermediates to it instead of saving them before returning.
+        :param closed_form: if True, requests for one kind of die (plus modifiers) are computed directly with
+            tasktools.get_dice_power_dict and cached, without searching or saving to the database.
+        """
         self._insert_retrieve = insert_retrieve
         self._step_size = step_size
+        self._saver = saver
+        self._closed_form = closed_form
+        self._closed_form_tables = LRUCache(closed_form_cache_size)
 
     @property
     def step_size(self):
@@ -24,14 +38,36 @@ class TaskManager(object):
         return self._insert_retrieve.get_table(id_)
 
     def save_table_list(self, table_list: list):
+        to_check = {}
         for table in table_list:
-            if not is_new_table(table) and not self._insert_retrieve.has_table(table):
-                self._insert_retrieve.add_table(table)
+            if not is_new_table(table):
+                to_check.setdefault(tuple(table.get_list()), table)
+        tables = list(to_check.values())
+        is_saved = self._insert_retrieve.has_tables(tables)
+        self._insert_retrieve.add_tables([table for table, saved in zip(tables, is_saved) if not saved])
 
-    def process_request(self, dice_record: DiceRecord, update_queue: Queue = None) -> DiceTable:
+    def get_closed_form_table(self, die, number: int) -> DiceTable:
+        key = (die, number)
+        return self._closed_form_tables.get_or_make(
+            key, lambda: DiceTable(get_dice_power_dict(die, number), DiceRecord({die: number})))
+
+    def process_request(self, dice_record: DiceRecord, update_queue: Queue = None, lazy_modifier=False):
+        """
+
+        :param lazy_modifier: if True, return a tasktools.ModifiedTable of the unmodified table instead of
+            building the modified DiceTable.
+        """
 
         modifier, new_record = extract_modifiers(dice_record)
 
+        dice = new_record.get_dict()
+        if self._closed_form and len(dice) == 1:
+            (die, number), = dice.items()
+            if update_queue is not None:
+                update_queue.put('STOP')
+            raw_final_table = self.get_closed_form_table(die, number)
+            return _get_answer(raw_final_table, modifier, dice_record, lazy_modifier)
+
         if new_record == DiceRecord.new():
             closest = DiceTable.new()
         else:
@@ -45,11 +81,92 @@ class TaskManager(object):
         else:
             intermediate_table = tables_to_save[-1]
 
-        self.save_table_list(tables_to_save)
+        if self._saver is None:
+            self.save_table_list(tables_to_save)
+        elif tables_to_save:
+            self._saver.submit(tables_to_save)
 
         raw_final_table = table_generator.create_target_table(intermediate_table)
-        table_with_modifier = apply_modifier(raw_final_table, modifier)
 
-        answer = DiceTable(table_with_modifier.get_dict(), dice_record)
+        return _get_answer(raw_final_table, modifier, dice_record, lazy_modifier)
+
+    def process_requests(self, dice_records: list, lazy_modifier=False) -> list:
+        """
+        the answers to dice_records, in order, as process_request would give them.
+
+        each distinct modifier-free record is built once, smallest first. the intermediates of earlier
+        requests seed later ones, and the database is only searched when no intermediate is within one step
+        of the request. the last few dice are added to the largest table built so far that the request
+        contains. every new intermediate is saved together at the end.
+        """
+        plans = [extract_modifiers(dice_record) for dice_record in dice_records]
+        distinct = {}
+        for _, new_record in plans:
+            dice_list = sorted(new_record.get_dict().items())
+            distinct.setdefault(tuple(get_label_list(dice_list)), (get_score(dice_list), new_record))
+
+        built = {}
+        seeds = {}
+        tables_to_save = []
+        for key, (score, new_record) in sorted(distinct.items(), key=lambda item: item[1][0]):
+            table = self._build_from_batch(new_record, seeds, built, tables_to_save)
+            built[key] = (score, table)
+
+        if self._saver is None:
+            self.save_table_list(tables_to_save)
+        elif tables_to_save:
+            self._saver.submit(tables_to_save)
+
+        answers = []
+        for dice_record, (modifier, new_record) in zip(dice_records, plans):
+            key = tuple(get_label_list(sorted(new_record.get_dict().items())))
+            answers.append(_get_answer(built[key][1], modifier, dice_record, lazy_modifier))
+        return answers
+
+    def _build_from_batch(self, new_record, seeds, built, tables_to_save):
+        if new_record == DiceRecord.new():
+            return DiceTable.new()
+        dice = new_record.get_dict()
+        if self._closed_form and len(dice) == 1:
+            (die, number), = dice.items()
+            return self.get_closed_form_table(die, number)
+
+        target = dict(get_label_list(sorted(new_record.get_dict().items())))
+        score, closest = _get_largest_contained(target, seeds)
+        if closest is None or not self._is_within_one_step(new_record, closest):
+            from_database = self.get_closest_from_database(new_record)
+            if closest is None or get_score(from_database.get_list()) > score:
+                closest = from_database
+
+        table_generator = TableGenerator(new_record)
+        saves = table_generator.create_save_list(closest, self.step_size)
+        tables_to_save.extend(saves)
+        for table in saves:
+            dice_list = table.get_list()
+            seeds[tuple(get_label_list(dice_list))] = (get_score(dice_list), table)
+
+        intermediate_table = saves[-1] if saves else closest
+        built_score, largest_built = _get_largest_contained(target, built)
+        if largest_built is not None and built_score > get_score(intermediate_table.get_list()):
+            intermediate_table = largest_built
+        return table_generator.create_target_table(intermediate_table)
+
+    def _is_within_one_step(self, dice_record, table):
+        return all(number - table.number_of_dice(die) < get_die_step(die, self.step_size)
+                   for die, number in dice_record.get_dict().items())
+
+
+def _get_answer(raw_table, modifier, dice_record, lazy_modifier):
+    answer = ModifiedTable(raw_table, modifier, dice_record)
+    return answer if lazy_modifier else answer.to_dice_table()
+
+
+def _get_largest_contained(target: dict, tables: dict):
+    """
 
-        return answer
+    :param tables: {label tuple: (score, table)}
+    :return: (score, table) of the highest scoring table whose labels are all in target, or (0, None)
+    """
+    contained = [score_table for key, score_table in tables.items()
+                 if all(number <= target.get(label, 0) for label, number in key)]
+    return max(contained, key=lambda score_table: score_table[0], default=(0, None))
@@ -0,0 +1,82 @@
+import struct
+from itertools import islice
+from zlib import crc32
+
+from dicetables_db.connections.baseconnection import BaseConnection
+from dicetables_db.tools.serializer import Serializer
+
+# archive layout: MAGIC, then chunks of [CHUNK_HEADER(payload length, crc32 of payload), payload], then an empty
+# chunk header followed by TRAILER(total documents, crc32 of all payloads). each payload is a serialized list of
+# documents without their '_id', so an archive can be loaded into any BaseConnection.
+MAGIC = b'DTDBARC1'
+CHUNK_HEADER = struct.Struct('<II')
+TRAILER = struct.Struct('<QI')
+
+
+def export_collection(connection: BaseConnection, file_obj, chunk_size=500, progress=None) -> int:
+    """
+
+    :param file_obj: binary file opened for writing
+    :param progress: optional callable(documents_written)
+    :return: number of documents written
+    """
+    file_obj.write(MAGIC)
+    documents = (_without_id(document) for document in connection.find())
+    total = 0
+    checksum = 0
+    chunk = list(islice(documents, chunk_size))
+    while chunk:
+        payload = Serializer.serialize(chunk)
+        file_obj.write(CHUNK_HEADER.pack(len(payload), crc32(payload)))
+        file_obj.write(payload)
+        checksum = crc32(payload, checksum)
+        total += len(chunk)
+        if progress is not None:
+            progress(total)
+        chunk = list(islice(documents, chunk_size))
+
+    file_obj.write(CHUNK_HEADER.pack(0, 0))
+    file_obj.write(TRAILER.pack(total, checksum))
+    return total
+
+
+def import_collection(connection: BaseConnection, file_obj, progress=None) -> int:
+    """
+
+    :param file_obj: binary file opened for reading
+    :param progress: optional callable(documents_read)
+    :return: number of documents inserted
+    :raises: ValueError if the archive is malformed or fails a checksum
+    """
+    if file_obj.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a dicetables_db archive.')
+    total = 0
+    checksum = 0
+    length, chunk_checksum = _read_struct(file_obj, CHUNK_HEADER)
+    while length:
+        payload = file_obj.read(length)
+        if len(payload) != length or crc32(payload) != chunk_checksum:
+            raise ValueError('Archive chunk {} is corrupt.'.format(total))
+        documents = Serializer.deserialize(payload)
+        connection.insert_many(documents)
+        checksum = crc32(payload, checksum)
+        total += len(documents)
+        if progress is not None:
+            progress(total)
+        length, chunk_checksum = _read_struct(file_obj, CHUNK_HEADER)
+
+    expected_total, expected_checksum = _read_struct(file_obj, TRAILER)
+    if (total, checksum) != (expected_total, expected_checksum):
+        raise ValueError('Archive checksum failed. Expected {} documents, read {}.'.format(expected_total, total))
+    return total
+
+
+def _read_struct(file_obj, struct_obj):
+    raw = file_obj.read(struct_obj.size)
+    if len(raw) != struct_obj.size:
+        raise ValueError('Archive is truncated.')
+    return struct_obj.unpack(raw)
+
+
+def _without_id(document):
+    return {key: value for key, value in document.items() if key != '_id'}
@@ -0,0 +1,93 @@
+import struct
+import sys
+from array import array
+
+from dicetables.eventsinfo import get_fast_pct_number
+
+MAGIC = b'DTAX'
+HEADER = struct.Struct('<4scqI')
+FLOAT_TYPES = ('d', 'f')
+
+
+def encode_axes(axes, float_type: str = 'd') -> bytes:
+    """
+    packs [(x, ...), (y, ...)] as: header (magic, float type, first x, length), the gaps between
+    consecutive x values as uint32 and the y values as little-endian float64 ('d') or float32 ('f').
+
+    x values must be increasing integers.
+    """
+    if float_type not in FLOAT_TYPES:
+        raise ValueError('float_type must be one of {}'.format(FLOAT_TYPES))
+    x_values, y_values = (tuple(axis) for axis in axes) if axes else ((), ())
+    if len(x_values) != len(y_values):
+        raise ValueError('Axes must be the same length.')
+    first = x_values[0] if x_values else 0
+    deltas = [x_values[index + 1] - x_values[index] for index in range(len(x_values) - 1)]
+    if any(delta < 1 for delta in deltas):
+        raise ValueError('x values must be increasing.')
+    deltas = array('I', deltas)
+    floats = array(float_type, y_values)
+    if sys.byteorder == 'big':
+        deltas.byteswap()
+        floats.byteswap()
+    header = HEADER.pack(MAGIC, float_type.encode('ascii'), first, len(x_values))
+    return header + deltas.tobytes() + floats.tobytes()
+
+
+def decode_axes(data: bytes):
+    """
+
+    :return: [(x, ...), (y, ...)]
+    """
+    if len(data) < HEADER.size:
+        raise ValueError('Data is too short for encoded axes.')
+    magic, float_type, first, length = HEADER.unpack_from(data)
+    float_type = float_type.decode('ascii')
+    if magic != MAGIC or float_type not in FLOAT_TYPES:
+        raise ValueError('Data is not encoded axes.')
+    deltas = array('I')
+    floats = array(float_type)
+    deltas_end = HEADER.size + max(length - 1, 0) * deltas.itemsize
+    if len(data) != deltas_end + length * floats.itemsize:
+        raise ValueError('Encoded axes have the wrong length.')
+    deltas.frombytes(data[HEADER.size:deltas_end])
+    floats.frombytes(data[deltas_end:])
+    if sys.byteorder == 'big':
+        deltas.byteswap()
+        floats.byteswap()
+
+    x_values = [first] if length else []
+    for delta in deltas:
+        x_values.append(x_values[-1] + delta)
+    return [tuple(x_values), tuple(floats)]
+
+
+def downsample_axes(events, max_points: int):
+    """
+    min/max bucketing of the percentage axes (zeroes included) straight from events.get_dict(). the range
+    is split into max_points // 2 buckets and each bucket keeps the x values of its lowest and highest
+    occurrence, in order, so peaks and gaps survive. only the kept points are converted to percentages.
+
+    a range of max_points or fewer values is returned whole, as calc.percentage_axes() would.
+
+    :return: [(x, ...), (y, ...)]
+    """
+    if max_points < 2:
+        raise ValueError('max_points must be at least 2.')
+    occurrences = events.get_dict()
+    start, stop = min(occurrences), max(occurrences)
+    total = sum(occurrences.values())
+    width = stop - start + 1
+    if width <= max_points:
+        kept = range(start, stop + 1)
+    else:
+        buckets = max_points // 2
+        bucket_size = -(-width // buckets)
+        kept = []
+        for bucket_start in range(start, stop + 1, bucket_size):
+            bucket = range(bucket_start, min(bucket_start + bucket_size, stop + 1))
+            lowest = min(bucket, key=lambda value: occurrences.get(value, 0))
+            highest = max(bucket, key=lambda value: occurrences.get(value, 0))
+            kept.extend(sorted({lowest, highest}))
+    y_values = tuple(get_fast_pct_number(occurrences.get(value, 0), total) for value in kept)
+    return [tuple(kept), y_values]
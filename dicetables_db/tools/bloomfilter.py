@@ -0,0 +1,84 @@
+import math
+import struct
+from hashlib import blake2b
+
+MAGIC = b'DTBLOOM1'
+HEADER = struct.Struct('<QQQ')
+
+
+class BloomFilter(object):
+    """
+    A set of strings that can answer "definitely not added" in memory.
+
+    "in" is False only for keys that were never added, and True for every added key and, with probability
+    about error_rate once capacity keys are added, for some keys that were not. Positions come from double
+    hashing one blake2b digest of the key.
+    """
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.01) -> None:
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError('capacity must be at least 1 and error_rate between 0 and 1.')
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        self._set_up(num_bits, num_hashes, 0, bytearray((num_bits + 7) // 8))
+
+    def _set_up(self, num_bits, num_hashes, count, bits):
+        self._num_bits = num_bits
+        self._num_hashes = num_hashes
+        self._count = count
+        self._bits = bits
+
+    @property
+    def num_bits(self):
+        return self._num_bits
+
+    @property
+    def num_hashes(self):
+        return self._num_hashes
+
+    def __len__(self):
+        """number of add() calls, including repeated keys."""
+        return self._count
+
+    def _positions(self, key):
+        digest = blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self._num_bits for index in range(self._num_hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def clear(self):
+        self._bits = bytearray(len(self._bits))
+        self._count = 0
+
+    def to_bytes(self) -> bytes:
+        return MAGIC + HEADER.pack(self._num_bits, self._num_hashes, self._count) + bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilter':
+        header_end = len(MAGIC) + HEADER.size
+        if data[:len(MAGIC)] != MAGIC or len(data) < header_end:
+            raise ValueError('Not a bloom filter.')
+        num_bits, num_hashes, count = HEADER.unpack_from(data, len(MAGIC))
+        bits = bytearray(data[header_end:])
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError('Bloom filter data is truncated.')
+        new = cls.__new__(cls)
+        new._set_up(num_bits, num_hashes, count, bits)
+        return new
+
+    def save(self, file_path: str):
+        with open(file_path, 'wb') as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, file_path: str) -> 'BloomFilter':
+        with open(file_path, 'rb') as file:
+            return cls.from_bytes(file.read())
@@ -1,9 +1,12 @@
-from itertools import combinations
+from hashlib import sha1
+from heapq import heappush, heappop
+from itertools import combinations, count
 from typing import List, Tuple
 
 from dicetables import DiceTable
 
 from dicetables_db.tools.serializer import Serializer
+from dicetables_db.tools.tasktools import Moments
 
 
 class PrepDiceTable(object):
@@ -14,6 +17,8 @@ class PrepDiceTable(object):
         self._serialized = Serializer.serialize(dice_table)
         self._score = get_score(input_list)
         self._label_list = get_label_list(input_list)
+        self._hash = get_hash(self._label_list)
+        self._moments = Moments.from_dice_list(input_list)
 
     def get_score(self) -> int:
         return self._score
@@ -21,6 +26,12 @@ class PrepDiceTable(object):
     def get_serialized(self):
         return self._serialized
 
+    def get_hash(self) -> str:
+        return self._hash
+
+    def get_moments(self) -> Moments:
+        return self._moments
+
     def get_label_list(self) -> List[Tuple[str, int]]:
         return self._label_list[:]
 
@@ -31,7 +42,8 @@ class PrepDiceTable(object):
         return '&'.join(self.get_group_list())
 
     def get_dict(self):
-        output = {'group': self.get_group(), 'score': self._score, 'serialized': self._serialized}
+        output = {'group': self.get_group(), 'score': self._score, 'serialized': self._serialized, 'hash': self._hash,
+                  'mean': str(self._moments.exact_mean), 'variance': str(self._moments.variance)}
         for die_repr, num in self._label_list:
             output[die_repr] = num
         return output
@@ -43,6 +55,7 @@ class SearchParams(object):
             raise ValueError('List may not be empty')
         self._score = get_score(dice_list)
         self._labels = get_label_list(dice_list)
+        self._label_scores = [get_score([die_num]) for die_num in dice_list]
 
     def get_search_params(self):
         return self._search_generator()
@@ -59,6 +72,42 @@ class SearchParams(object):
             elements_in_group -= 1
             yield out
 
+    def get_bounded_search_params(self):
+        """
+        every non-empty subset of the labels, lazily, in descending order of bound. bound is the sum of
+        the subset's label scores, the highest score any table in that subset can have.
+
+        :return: generator of (bound, group_string, {die_repr: num})
+        """
+        return self._bounded_search_generator()
+
+    def _bounded_search_generator(self):
+        # best-first walk over the labels left out, from the cheapest to remove to the most expensive.
+        # from removed = (..., i) the next states are (..., i, i+1) and (..., i+1), so every subset
+        # is reached exactly once and never before its parent.
+        by_score = sorted(range(len(self._labels)), key=lambda index: self._label_scores[index])
+        scores = [self._label_scores[index] for index in by_score]
+        tie_breaker = count()
+        heap = [(0, next(tie_breaker), ())]
+        while heap:
+            removed_score, _, removed = heappop(heap)
+            if len(removed) < len(by_score):
+                yield self._get_bounded_param(self._score - removed_score, {by_score[index] for index in removed})
+            if not removed:
+                heappush(heap, (scores[0], next(tie_breaker), (0,)))
+                continue
+            last = removed[-1]
+            if last + 1 < len(by_score):
+                add_next = removed + (last + 1,)
+                heappush(heap, (removed_score + scores[last + 1], next(tie_breaker), add_next))
+                swap_next = removed[:-1] + (last + 1,)
+                heappush(heap, (removed_score - scores[last] + scores[last + 1], next(tie_breaker), swap_next))
+
+    def _get_bounded_param(self, bound, removed_indices):
+        kept = [label for index, label in enumerate(self._labels) if index not in removed_indices]
+        group_string = '&'.join(repr_num[0] for repr_num in kept)
+        return bound, group_string, dict(kept)
+
     def get_score(self) -> int:
         return self._score
 
@@ -75,3 +124,13 @@ def get_score(dice_list: list) -> int:
 
 def get_label_list(dice_list: list) -> List[Tuple[str, int]]:
     return [(repr(die), num) for die, num in dice_list]
+
+
+def get_group(label_list: List[Tuple[str, int]]) -> str:
+    return '&'.join(label for label, _ in label_list)
+
+
+def get_hash(label_list: List[Tuple[str, int]]) -> str:
+    """the same dice in any order give the same hash."""
+    canonical = '&'.join('{}*{}'.format(num, label) for label, num in sorted(label_list))
+    return sha1(canonical.encode('utf-8')).hexdigest()
@@ -18,9 +18,16 @@ class DocumentId(object):
     def from_bson_id(cls, bson_id: ObjectId) -> 'DocumentId':
         return cls(bson_id)
 
+    @classmethod
+    def from_bytes(cls, raw_bytes: bytes) -> 'DocumentId':
+        return cls(ObjectId(raw_bytes))
+
     def to_bson_id(self) -> ObjectId:
         return self._id
 
+    def to_bytes(self) -> bytes:
+        return self._id.binary
+
     def to_string(self) -> str:
         return str(self)
 
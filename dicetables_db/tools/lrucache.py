@@ -0,0 +1,57 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache(object):
+    """
+    A thread-safe dict that holds at most max_size items and drops the least recently used one first.
+    """
+
+    def __init__(self, max_size: int = 128) -> None:
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1.')
+        self._max_size = max_size
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+    def get_or_make(self, key, maker):
+        """
+
+        :return: the cached value for key, or maker() after caching it.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = maker()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_MISSING = object()
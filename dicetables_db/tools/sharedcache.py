@@ -0,0 +1,175 @@
+import struct
+from multiprocessing import Lock, shared_memory
+from typing import Optional
+
+from dicetables import DiceTable
+
+from dicetables_db.tools.documentid import DocumentId
+from dicetables_db.tools.serializer import Serializer
+
+CLOCK = struct.Struct('<q')
+SLOT = struct.Struct('<12sqqQ')
+EMPTY_KEY = bytes(12)
+
+
+class SharedTableCache(object):
+    """
+    A table cache that lives in shared memory, so a table fetched by one process is available to the others.
+
+    The slot table (document id, reference count, last use, data length) lives in one shared block and each
+    cached table is a separate block named after its slot table and id. Slots are evicted least recently used
+    first and never while their reference count is above zero. Create it once, before starting the worker
+    processes, and pass it to them; it pickles by name along with its lock.
+    """
+
+    def __init__(self, name: str, max_tables: int = 64, lock=None, create: bool = True) -> None:
+        self._name = name
+        self._max_tables = max_tables
+        self._lock = Lock() if lock is None else lock
+        size = CLOCK.size + max_tables * SLOT.size
+        if create:
+            self._slots = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._slots.buf[:size] = bytes(size)
+        else:
+            self._slots = _attach(name)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def max_tables(self):
+        return self._max_tables
+
+    def __getstate__(self):
+        return self._name, self._max_tables, self._lock
+
+    def __setstate__(self, state):
+        name, max_tables, lock = state
+        self.__init__(name, max_tables, lock=lock, create=False)
+
+    def __len__(self):
+        with self._lock:
+            return sum(1 for index in range(self._max_tables) if self._read_slot(index)[0] != EMPTY_KEY)
+
+    def __contains__(self, doc_id: DocumentId):
+        with self._lock:
+            return self._find_slot(doc_id.to_bytes()) is not None
+
+    def get(self, doc_id: DocumentId) -> Optional[DiceTable]:
+        key = doc_id.to_bytes()
+        with self._lock:
+            index = self._find_slot(key)
+            if index is None:
+                return None
+            _, ref_count, _, length = self._read_slot(index)
+            self._write_slot(index, key, ref_count + 1, self._tick(), length)
+        try:
+            return self._read_table(key, length)
+        except FileNotFoundError:
+            return None
+        finally:
+            self._release(key)
+
+    def _read_table(self, key, length):
+        block = _attach(self._block_name(key))
+        try:
+            return Serializer.deserialize(bytes(block.buf[:length]))
+        finally:
+            block.close()
+
+    def _release(self, key):
+        with self._lock:
+            index = self._find_slot(key)
+            if index is not None:
+                _, ref_count, last_used, length = self._read_slot(index)
+                self._write_slot(index, key, max(ref_count - 1, 0), last_used, length)
+
+    def put(self, doc_id: DocumentId, dice_table: DiceTable) -> bool:
+        """
+
+        :return: False if every slot is in use and nothing could be evicted.
+        """
+        key = doc_id.to_bytes()
+        data = Serializer.serialize(dice_table)
+        with self._lock:
+            if self._find_slot(key) is not None:
+                return True
+            index = self._get_free_slot()
+            if index is None:
+                return False
+            block = shared_memory.SharedMemory(name=self._block_name(key), create=True, size=max(len(data), 1))
+            block.buf[:len(data)] = data
+            block.close()
+            self._write_slot(index, key, 0, self._tick(), len(data))
+            return True
+
+    def _get_free_slot(self):
+        evictable = []
+        for index in range(self._max_tables):
+            key, ref_count, last_used, _ = self._read_slot(index)
+            if key == EMPTY_KEY:
+                return index
+            if not ref_count:
+                evictable.append((last_used, index))
+        if not evictable:
+            return None
+        index = min(evictable)[1]
+        self._evict(index)
+        return index
+
+    def _evict(self, index):
+        key = self._read_slot(index)[0]
+        _unlink(self._block_name(key))
+        self._write_slot(index, EMPTY_KEY, 0, 0, 0)
+
+    def clear(self):
+        with self._lock:
+            for index in range(self._max_tables):
+                if self._read_slot(index)[0] != EMPTY_KEY:
+                    self._evict(index)
+
+    def close(self):
+        self._slots.close()
+
+    def unlink(self):
+        """removes every cached table and the slot table. call once, from the process that created the cache."""
+        self.clear()
+        self._slots.close()
+        self._slots.unlink()
+
+    def _find_slot(self, key):
+        for index in range(self._max_tables):
+            if self._read_slot(index)[0] == key:
+                return index
+        return None
+
+    def _tick(self):
+        tick = CLOCK.unpack_from(self._slots.buf, 0)[0] + 1
+        CLOCK.pack_into(self._slots.buf, 0, tick)
+        return tick
+
+    def _read_slot(self, index):
+        return SLOT.unpack_from(self._slots.buf, CLOCK.size + index * SLOT.size)
+
+    def _write_slot(self, index, key, ref_count, last_used, length):
+        SLOT.pack_into(self._slots.buf, CLOCK.size + index * SLOT.size, key, ref_count, last_used, length)
+
+    def _block_name(self, key):
+        return '{}_{}'.format(self._name, key.hex())
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _unlink(name):
+    try:
+        block = _attach(name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
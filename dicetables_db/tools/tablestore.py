@@ -0,0 +1,82 @@
+import mmap
+import os
+import struct
+from typing import Optional
+
+from dicetables_db.tools.documentid import DocumentId
+
+RECORD_HEADER = struct.Struct('<12sQ')
+
+
+class MMapTableStore(object):
+    """
+    An append-only segment file of serialized tables, read through a memory map.
+
+    Each record is a header of (12 byte document id, data length) followed by the data. The offset index is
+    rebuilt by scanning the segment, so any number of processes can share one file (and one page cache).
+    get() returns a memoryview into the map, so reads do not copy the stored bytes.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self._path = file_path
+        self._appender = open(file_path, 'ab')
+        self._reader = open(file_path, 'rb')
+        self._map = None
+        self._mapped_size = 0
+        self._scanned_to = 0
+        self._index = {}
+        self.refresh()
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        return len(self._index)
+
+    def refresh(self):
+        """maps and indexes any records appended since the last refresh, including by other processes."""
+        size = os.fstat(self._reader.fileno()).st_size
+        if size == self._mapped_size:
+            return
+        self._map = mmap.mmap(self._reader.fileno(), size, access=mmap.ACCESS_READ)
+        self._mapped_size = size
+        self._scan()
+
+    def _scan(self):
+        offset = self._scanned_to
+        while offset + RECORD_HEADER.size <= self._mapped_size:
+            raw_id, length = RECORD_HEADER.unpack_from(self._map, offset)
+            data_start = offset + RECORD_HEADER.size
+            if data_start + length > self._mapped_size:
+                break
+            self._index[raw_id] = (data_start, length)
+            offset = data_start + length
+        self._scanned_to = offset
+
+    def add(self, doc_id: DocumentId, data: bytes):
+        self._appender.write(RECORD_HEADER.pack(doc_id.to_bytes(), len(data)) + data)
+        self._appender.flush()
+        self.refresh()
+
+    def has(self, doc_id: DocumentId) -> bool:
+        return self._get_location(doc_id) is not None
+
+    def get(self, doc_id: DocumentId) -> Optional[memoryview]:
+        location = self._get_location(doc_id)
+        if location is None:
+            return None
+        start, length = location
+        return memoryview(self._map)[start: start + length]
+
+    def _get_location(self, doc_id):
+        raw_id = doc_id.to_bytes()
+        if raw_id not in self._index:
+            self.refresh()
+        return self._index.get(raw_id)
+
+    def close(self):
+        self._appender.close()
+        self._reader.close()
+        self._map = None
+        self._index = {}
@@ -1,3 +1,5 @@
+from fractions import Fraction
+from functools import lru_cache
 from queue import Queue
 from typing import Tuple, List
 
@@ -36,6 +38,111 @@ class TableGenerator(object):
         return new_table
 
 
+class Moments(object):
+    """
+    The exact mean and variance of a sum of independent dice. Both are additive, so a table's moments come
+    from its dice list alone, without touching its events.
+    """
+
+    def __init__(self, mean=Fraction(0), variance=Fraction(0)) -> None:
+        self._mean = Fraction(mean)
+        self._variance = Fraction(variance)
+
+    @classmethod
+    def from_dice_list(cls, dice_list: list) -> 'Moments':
+        moments = cls()
+        for die, number in dice_list:
+            moments = moments.add_die(die, number)
+        return moments
+
+    @property
+    def exact_mean(self) -> Fraction:
+        return self._mean
+
+    @property
+    def variance(self) -> Fraction:
+        return self._variance
+
+    def add_die(self, die: ProtoDie, number: int = 1) -> 'Moments':
+        die_mean, die_variance = get_die_moments(die)
+        return Moments(self._mean + number * die_mean, self._variance + number * die_variance)
+
+    def add_modifier(self, modifier: int) -> 'Moments':
+        return Moments(self._mean + modifier, self._variance)
+
+    def mean(self) -> float:
+        return float(self._mean)
+
+    def stddev(self, decimal_place=4) -> float:
+        return round(float(self._variance) ** 0.5, decimal_place)
+
+    def __eq__(self, other):
+        return isinstance(other, Moments) and (self._mean, self._variance) == (other._mean, other._variance)
+
+    def __repr__(self):
+        return 'Moments(mean={}, variance={})'.format(self._mean, self._variance)
+
+
+@lru_cache(maxsize=256)
+def get_die_moments(die: ProtoDie) -> Tuple[Fraction, Fraction]:
+    """
+
+    :return: (mean, variance) of one roll of die, as Fractions.
+    """
+    die_dict = die.get_dict()
+    total = sum(die_dict.values())
+    mean = Fraction(sum(value * weight for value, weight in die_dict.items()), total)
+    mean_of_squares = Fraction(sum(value * value * weight for value, weight in die_dict.items()), total)
+    return mean, mean_of_squares - mean * mean
+
+
+def get_dice_power_dict(die: ProtoDie, number: int) -> dict:
+    """
+    the events of number rolls of die, without convolving. with die = x^low * Q(x), the table is
+    x^(low * number) * Q^number and P = Q^number satisfies Q * P' = number * Q' * P. that gives each
+    coefficient of P from the previous (die size) ones with exact integer division, so the cost is
+    about (table range) * (die size), or (table range) for uniform dice.
+    """
+    die_dict = die.get_dict()
+    if number == 0:
+        return {0: 1}
+    low, high = min(die_dict), max(die_dict)
+    weights = set(die_dict.values())
+    if len(weights) == 1 and len(die_dict) == high - low + 1:
+        weight_power = weights.pop() ** number
+        coefficients = [weight_power * coefficient for coefficient in _get_uniform_power(high - low, number)]
+    else:
+        coefficients = _get_power(sorted((value - low, weight) for value, weight in die_dict.items()), number)
+    return {low * number + index: coefficient for index, coefficient in enumerate(coefficients) if coefficient}
+
+
+def _get_power(terms, number):
+    (_, q_zero), terms = terms[0], terms[1:]
+    coefficients = [q_zero ** number] + [0] * (terms[-1][0] * number if terms else 0)
+    for index in range(1, len(coefficients)):
+        total = 0
+        for power, weight in terms:
+            if power > index:
+                break
+            total += (number * power - (index - power)) * weight * coefficients[index - power]
+        coefficients[index] = total // (q_zero * index)
+    return coefficients
+
+
+def _get_uniform_power(max_power, number):
+    # Q = 1 + x + ... + x^max_power, so the recurrence's sum is (number + 1) * window_moment - index * window_sum
+    # over the last max_power coefficients. both are updated in O(1) as the window moves.
+    coefficients = [1] + [0] * (max_power * number)
+    window_sum = window_moment = 0
+    for index in range(1, len(coefficients)):
+        previous = coefficients[index - 1]
+        leaving = coefficients[index - 1 - max_power] if index - 1 - max_power >= 0 else 0
+        window_moment += previous + window_sum - (max_power + 1) * leaving
+        window_sum += previous - leaving
+        coefficients[index] = ((number + 1) * window_moment - index * window_sum) // index
+    return coefficients
+
+
 def extract_modifiers(dice_record: DiceRecord) -> Tuple[int, DiceRecord]:
     new_record = dice_record
     modifier = 0
@@ -59,6 +166,56 @@ def apply_modifier(initial_table: DiceTable, modifier: int) -> DiceTable:
     return initial_table.add_die(Modifier(modifier))
 
 
+class ModifiedTable(object):
+    """
+    A read-only view of table with every event moved by modifier, for the dice in dice_record.
+
+    Making it is O(1). get_dict() and to_dice_table() build the moved events once, on first use; code that
+    knows about the view (requesthandler.make_dict) reads table and modifier instead and never builds them.
+    """
+
+    def __init__(self, table: DiceTable, modifier: int, dice_record: DiceRecord) -> None:
+        self._table = table
+        self._modifier = modifier
+        self._record = dice_record
+        self._dice_table = None
+
+    @property
+    def table(self) -> DiceTable:
+        return self._table
+
+    @property
+    def modifier(self) -> int:
+        return self._modifier
+
+    def dice_data(self) -> DiceRecord:
+        return self._record
+
+    def get_list(self):
+        return sorted(self._record.get_dict().items())
+
+    def number_of_dice(self, query_die):
+        return self._record.get_number(query_die)
+
+    def get_dict(self) -> dict:
+        return self.to_dice_table().get_dict()
+
+    def to_dice_table(self) -> DiceTable:
+        if self._dice_table is None:
+            if self._modifier == 0 and self._record == self._table.dice_data():
+                self._dice_table = self._table
+            else:
+                moved = {event + self._modifier: occurrences for event, occurrences in self._table.get_dict().items()}
+                self._dice_table = DiceTable(moved, self._record)
+        return self._dice_table
+
+    def __str__(self):
+        return '\n'.join(die.multiply_str(number) for die, number in self.get_list())
+
+    def __repr__(self):
+        return '<{} containing [{}]>'.format(self._table.__class__.__name__, str(self).replace('\n', ', '))
+
+
 def is_new_table(table: DiceTable) -> bool:
     return table == DiceTable.new()
 
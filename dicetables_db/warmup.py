@@ -0,0 +1,129 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from dicetables import DiceRecord, DiceTable, Parser
+
+from dicetables_db.connections.baseconnection import BaseConnection
+from dicetables_db.connections.sql_connection import SQLConnection
+from dicetables_db.insertandretrieve import DiceTableInsertionAndRetrieval
+from dicetables_db.taskmanager import TaskManager
+from dicetables_db.tools.tasktools import TableGenerator
+
+
+class WarmUp(object):
+    """
+    Seeds a database with a geometric ladder of tables for common die types.
+
+    Each die type's ladder is built in a worker process and bulk saved by the calling process as soon as it
+    is done. Rungs already in the database are skipped and missing rungs start from the closest stored table,
+    so an interrupted warm up picks up where it stopped.
+    """
+
+    def __init__(self, insert_retrieve: DiceTableInsertionAndRetrieval, step_size=30, ratio=2.0, workers=1) -> None:
+        if ratio <= 1:
+            raise ValueError('ratio must be > 1')
+        self._insert_retrieve = insert_retrieve
+        self._task_manager = TaskManager(insert_retrieve, step_size)
+        self._ratio = ratio
+        self._workers = workers
+
+    def get_missing_counts(self, die, start: int, stop: int) -> List[int]:
+        ladder = get_ladder(start, stop, self._ratio)
+        return [count for count in ladder if not self._insert_retrieve.has_dice_list([(die, count)])]
+
+    def run(self, spec: list, progress=None) -> int:
+        """
+
+        :param spec: [(die, start, stop), ...]
+        :param progress: optional callable(die, number_of_tables_built)
+        :return: number of tables built
+        """
+        jobs = []
+        for die, start, stop in spec:
+            missing = self.get_missing_counts(die, start, stop)
+            if missing:
+                initial_table = self._task_manager.get_closest_from_database(DiceRecord({die: missing[0]}))
+                jobs.append((die, missing, initial_table, self._task_manager.step_size))
+
+        if self._workers <= 1:
+            results = (build_ladder(*job) for job in jobs)
+            return self._save_all(jobs, results, progress)
+
+        with ProcessPoolExecutor(self._workers) as executor:
+            futures = [executor.submit(build_ladder, *job) for job in jobs]
+            return self._save_all(jobs, (future.result() for future in futures), progress)
+
+    def _save_all(self, jobs, results, progress):
+        total = 0
+        for job, tables in zip(jobs, results):
+            self._task_manager.save_table_list(tables)
+            total += len(tables)
+            if progress is not None:
+                progress(job[0], len(tables))
+        return total
+
+
+def get_ladder(start: int, stop: int, ratio: float = 2.0) -> List[int]:
+    if start < 1 or stop < start:
+        raise ValueError('start and stop must satisfy 1 <= start <= stop')
+    ladder = []
+    count = start
+    while count < stop:
+        ladder.append(count)
+        count = max(count + 1, int(count * ratio))
+    ladder.append(stop)
+    return ladder
+
+
+def build_ladder(die, counts: List[int], initial_table: DiceTable, step_size: int) -> List[DiceTable]:
+    tables = []
+    current = initial_table
+    for count in counts:
+        generator = TableGenerator(DiceRecord({die: count}))
+        saves = generator.create_save_list(current, step_size)
+        current = generator.create_target_table(saves[-1] if saves else current)
+        if not saves or saves[-1].dice_data() != current.dice_data():
+            saves.append(current)
+        tables += saves
+    return tables
+
+
+def get_connection(args) -> BaseConnection:
+    if args.mongo:
+        from dicetables_db.connections.mongodb_connection import MongoDBConnection
+        return MongoDBConnection(args.mongo, args.collection, args.ip, args.port)
+    return SQLConnection(args.sql, args.collection)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='seed a dicetables database with common tables.')
+    parser.add_argument('dice', nargs='+', help='die reprs to warm up, e.g. "Die(6)" "Die(20)"')
+    parser.add_argument('--start', type=int, default=1)
+    parser.add_argument('--stop', type=int, default=500)
+    parser.add_argument('--ratio', type=float, default=2.0)
+    parser.add_argument('--step-size', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--collection', default='dicetables')
+    backend = parser.add_mutually_exclusive_group(required=True)
+    backend.add_argument('--sql', metavar='DB_PATH')
+    backend.add_argument('--mongo', metavar='DB_NAME')
+    parser.add_argument('--ip', default='localhost')
+    parser.add_argument('--port', type=int, default=27017)
+    args = parser.parse_args(argv)
+
+    die_parser = Parser(ignore_case=True)
+    spec = [(die_parser.parse_die_within_limits(die_str), args.start, args.stop) for die_str in args.dice]
+
+    connection = get_connection(args)
+    try:
+        warm_up = WarmUp(DiceTableInsertionAndRetrieval(connection), step_size=args.step_size,
+                         ratio=args.ratio, workers=args.workers)
+        total = warm_up.run(spec, progress=lambda die, built: print('{!r}: built {} tables'.format(die, built)))
+        print('done. built {} tables'.format(total))
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
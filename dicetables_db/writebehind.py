@@ -0,0 +1,177 @@
+import atexit
+from collections import deque
+from queue import Queue, Empty
+from threading import Thread, Lock
+from time import monotonic
+from typing import Callable
+
+from dicetables_db.connections.baseconnection import BaseConnection
+from dicetables_db.insertandretrieve import DiceTableInsertionAndRetrieval
+from dicetables_db.taskmanager import TaskManager
+
+_STOP = object()
+
+
+class WriteBehindSaver(object):
+    """
+    Saves lists of intermediate tables on a background thread, so TaskManager(saver=...) can answer a
+    request before its intermediates are in the database.
+
+    The thread makes its own connection with connection_factory (sqlite connections can not be shared
+    between threads) and closes it on close(). submit() blocks while max_queue lists are waiting, which
+    keeps a slow database from growing the queue without limit. Up to batch_size waiting lists are saved
+    together in one transaction. Anything still queued when the interpreter exits is saved by an atexit
+    hook.
+
+    If the thread can not make its connection, the error is counted in get_metrics(), queued lists are
+    dropped and submit() and flush() raise RuntimeError.
+    """
+
+    def __init__(self, connection_factory: Callable[[], BaseConnection], max_queue: int = 100,
+                 batch_size: int = 20) -> None:
+        self._connection_factory = connection_factory
+        self._batch_size = batch_size
+        self._queue = Queue(max_queue)
+        self._lock = Lock()
+        self._submit_times = deque()
+        self._submitted = 0
+        self._saved = 0
+        self._batches = 0
+        self._errors = 0
+        self._last_error = None
+        self._failed = None
+        self._closed = False
+        self._thread = Thread(target=self._run, name='WriteBehindSaver', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, table_list: list, timeout: float = None):
+        """
+        queues table_list to be saved.
+
+        :raises queue.Full: if the queue is still full after timeout seconds. timeout=None waits forever.
+        :raises RuntimeError: if the thread could not start saving.
+        """
+        if self._closed:
+            raise ValueError('WriteBehindSaver is closed.')
+        self._raise_error_if_failed()
+        with self._lock:
+            self._submit_times.append(monotonic())
+            self._submitted += 1
+        try:
+            self._queue.put(list(table_list), timeout=timeout)
+        except BaseException:
+            with self._lock:
+                self._submit_times.pop()
+                self._submitted -= 1
+            raise
+        self._raise_error_if_failed()
+
+    def flush(self):
+        """
+        blocks until every submitted list has been saved.
+
+        :raises RuntimeError: if the thread could not start saving.
+        """
+        self._queue.join()
+        self._raise_error_if_failed()
+
+    def _raise_error_if_failed(self):
+        if self._failed is not None:
+            raise RuntimeError('WriteBehindSaver could not start saving.') from self._failed
+
+    def close(self):
+        """saves everything still queued, then stops the thread and closes its connection."""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_metrics(self) -> dict:
+        """
+
+        :return: {'queue_depth': lists waiting, 'lag': seconds the oldest unsaved list has waited,
+                  'submitted': lists, 'saved': lists, 'batches': transactions, 'errors': failed batches,
+                  'last_error': exception or None}
+        """
+        with self._lock:
+            lag = monotonic() - self._submit_times[0] if self._submit_times else 0.0
+            return {
+                'queue_depth': self._queue.qsize(),
+                'lag': lag,
+                'submitted': self._submitted,
+                'saved': self._saved,
+                'batches': self._batches,
+                'errors': self._errors,
+                'last_error': self._last_error
+            }
+
+    def _run(self):
+        connection = None
+        try:
+            connection = self._connection_factory()
+            task_manager = TaskManager(DiceTableInsertionAndRetrieval(connection))
+        except Exception as error:
+            if connection is not None:
+                connection.close()
+            self._drop_queued(error)
+            return
+        try:
+            stop = False
+            while not stop:
+                items = self._get_batch()
+                stop = _STOP in items
+                table_lists = [item for item in items if item is not _STOP]
+                if table_lists:
+                    self._save(task_manager, table_lists)
+                for _ in items:
+                    self._queue.task_done()
+        finally:
+            connection.close()
+
+    def _drop_queued(self, error):
+        """keeps emptying the queue until close(), so submit() and flush() do not wait on a dead thread."""
+        with self._lock:
+            self._errors += 1
+            self._last_error = error
+            self._failed = error
+        item = None
+        while item is not _STOP:
+            item = self._queue.get()
+            if item is not _STOP:
+                with self._lock:
+                    self._submit_times.popleft()
+            self._queue.task_done()
+
+    def _get_batch(self):
+        items = [self._queue.get()]
+        while len(items) < self._batch_size and items[-1] is not _STOP:
+            try:
+                items.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return items
+
+    def _save(self, task_manager, table_lists):
+        error = None
+        try:
+            task_manager.save_table_list([table for table_list in table_lists for table in table_list])
+        except Exception as exception:
+            error = exception
+        with self._lock:
+            for _ in table_lists:
+                self._submit_times.popleft()
+            self._batches += 1
+            if error is None:
+                self._saved += len(table_lists)
+            else:
+                self._errors += 1
+                self._last_error = error
@@ -28,6 +28,7 @@ setup(name='dicetables_db',
       ],
       packages=find_packages(exclude=['tests*', 'frontend*']),
       install_requires=['dicetables'],
+      entry_points={'console_scripts': ['dicetables-warmup=dicetables_db.warmup:main']},
       python_requires='>=3',
       include_package_data=True,
       zip_safe=False)
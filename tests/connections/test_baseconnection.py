@@ -2,7 +2,7 @@ import unittest
 from operator import lt, le, gt, ge, ne
 
 
-from dicetables_db.connections.baseconnection import BaseConnection
+from dicetables_db.connections.baseconnection import BaseConnection, DuplicateKeyError, ASCENDING, DESCENDING
 from dicetables_db.tools.serializer import Serializer
 from dicetables_db.tools.documentid import DocumentId
 
@@ -55,14 +55,14 @@ class MockConnection(BaseConnection):
     def close(self):
         self.collection_name = None
 
-    def find(self, params_dict=None, projection=None):
-        out = []
+    def find(self, params_dict=None, projection=None, batch_size=None, sort=None, limit=None):
         raise_error_for_bad_projection(projection)
-        for document in self._documents_pointer():
-            if fits_search(document, params_dict):
-                new = get_new_document(document, projection)
-                out.append(new)
-        return out
+        found = [document for document in self._documents_pointer() if fits_search(document, params_dict)]
+        for key, direction in reversed(sort or []):
+            found.sort(key=lambda document: document.get(key), reverse=direction == DESCENDING)
+        if limit is not None:
+            found = found[:limit]
+        return [get_new_document(document, projection) for document in found]
 
     def find_one(self, params_dict=None, projection=None):
         raise_error_for_bad_projection(projection)
@@ -76,10 +76,22 @@ class MockConnection(BaseConnection):
         new_id = self.id_class().new()
         to_insert = document.copy()
         to_insert['_id'] = new_id
+        self._raise_error_for_duplicate_key(to_insert)
         self._documents_pointer().append(to_insert)
         return new_id
 
-    def create_index(self, columns_tuple):
+    def _raise_error_for_duplicate_key(self, document):
+        for columns_tuple in self._collection_pointer().get('unique', []):
+            key = [document.get(column) for column in columns_tuple]
+            if any(key == [other.get(column) for column in columns_tuple] for other in self._documents_pointer()):
+                raise DuplicateKeyError('duplicate key for {}'.format(columns_tuple))
+
+    def create_index(self, columns_tuple, unique=False):
+        if unique:
+            keys = [tuple(document.get(column) for column in columns_tuple) for document in self._documents_pointer()]
+            if len(set(keys)) < len(keys):
+                raise DuplicateKeyError('duplicate key for {}'.format(columns_tuple))
+            self._collection_pointer().setdefault('unique', []).append(columns_tuple)
         self._indices_pointer().append(columns_tuple)
 
     def has_index(self, columns_tuple):
@@ -124,32 +136,44 @@ def fits_search(document, params_dict):
     if not params_dict:
         return True
 
-    should_add_bool = True
     for key, value in params_dict.items():
-        if key not in document.keys():
+        if key == '$or':
+            if not any(fits_search(document, sub_params) for sub_params in value):
+                return False
+        elif key not in document.keys():
+            if not fits_missing(value):
+                return False
+        elif isinstance(value, dict):
+            if not is_inequality_true(document[key], value):
+                return False
+        elif document[key] != value:
             return False
-        if not should_add_bool:
-            break
 
-        if isinstance(value, dict):
-            should_add_bool = is_inequality_true(document[key], value)
-        else:
-            should_add_bool = (document[key] == value)
+    return True
+
 
-    return should_add_bool
+def fits_missing(query):
+    operators = query if isinstance(query, dict) else {'$eq': query}
+    matches = {
+        '$exists': lambda should_exist: not should_exist,
+        '$eq': lambda to_match: to_match is None,
+        '$ne': lambda to_match: to_match is not None,
+        '$in': lambda options: None in options
+    }
+    return all(matches.get(operator, lambda _: False)(operand) for operator, operand in operators.items())
 
 
 def is_inequality_true(value, inequality_dict):
-    inequality_str, limiter = list(inequality_dict.items())[0]
     inequalities = {
         '$lt': lt,
         '$lte': le,
         '$gt': gt,
         '$gte': ge,
-        '$ne': ne
+        '$ne': ne,
+        '$in': lambda to_check, options: to_check in options,
+        '$exists': lambda to_check, should_exist: bool(should_exist)
     }
-    operator = inequalities[inequality_str]
-    return operator(value, limiter)
+    return all(inequalities[inequality_str](value, limiter) for inequality_str, limiter in inequality_dict.items())
 
 
 class TestBaseConnection(unittest.TestCase):
@@ -436,7 +460,7 @@ class TestBaseConnection(unittest.TestCase):
 
     def test_39_find_using_id_value(self):
         doc_id = self.connection.insert({'a': 1})
-        result = self.connection.find({'_id': doc_id})
+        result = list(self.connection.find({'_id': doc_id}))
         self.assertEqual(result, [{'_id': doc_id, 'a': 1}])
 
     def test_40_has_index_true(self):
@@ -496,6 +520,126 @@ class TestBaseConnection(unittest.TestCase):
         self.assertTrue(connection_2.has_index(('a', )))
         self.assertEqual(connection_2.find_one(), {'_id': doc_id, 'a': 1})
 
+    def test_49_insert_many(self):
+        documents = [{'a': 1}, {'a': 2, 'b': 3}]
+        doc_ids = self.connection.insert_many(documents)
+        self.assertEqual(len(doc_ids), 2)
+        for doc_id, document in zip(doc_ids, documents):
+            self.assertIsInstance(doc_id, self.connection.id_class())
+            self.assertEqual(self.connection.find_one({'_id': doc_id}, {'a': 1}), {'a': document['a']})
+        self.assertEqual(documents, [{'a': 1}, {'a': 2, 'b': 3}])
+
+    def test_50_insert_many_empty(self):
+        self.assertEqual(self.connection.insert_many([]), [])
+        self.assertTrue(self.connection.is_collection_empty())
+
+    def test_51_find_with_sort(self):
+        for a, b in [(2, 1), (1, 2), (3, 0), (1, 1)]:
+            self.connection.insert({'a': a, 'b': b})
+        ascending = list(self.connection.find(projection={'a': 1, 'b': 1}, sort=[('a', ASCENDING), ('b', DESCENDING)]))
+        self.assertEqual(ascending, [{'a': 1, 'b': 2}, {'a': 1, 'b': 1}, {'a': 2, 'b': 1}, {'a': 3, 'b': 0}])
+        descending = list(self.connection.find(projection={'a': 1}, sort=[('a', DESCENDING)]))
+        self.assertEqual(descending, [{'a': 3}, {'a': 2}, {'a': 1}, {'a': 1}])
+
+    def test_52_find_with_limit(self):
+        self.populate_db()
+        self.assertEqual(len(list(self.connection.find(limit=3))), 3)
+        self.assertEqual(len(list(self.connection.find({'a': 1}, limit=100))), 3)
+
+    def test_53_find_with_sort_and_limit_top_one(self):
+        for score in [3, 7, 5]:
+            self.connection.insert({'group': 'x', 'score': score})
+        self.connection.insert({'group': 'y', 'score': 10})
+        results = self.connection.find({'group': 'x', 'score': {'$lte': 6}}, {'score': 1},
+                                       sort=[('score', DESCENDING)], limit=1)
+        self.assertEqual(list(results), [{'score': 5}])
+
+    def test_54_find_with_sort_and_limit_no_results(self):
+        self.connection.insert({'a': 1})
+        results = self.connection.find({'a': 2}, sort=[('a', DESCENDING)], limit=1)
+        self.assertEqual(list(results), [])
+
+    def test_55_range_with_two_operators(self):
+        for a in range(6):
+            self.connection.insert({'a': a})
+        results = self.connection.find({'a': {'$gte': 2, '$lt': 5}}, {'a': 1})
+        self.assertEqual(sorted(doc['a'] for doc in results), [2, 3, 4])
+
+    def test_56_in_syntax_with_find(self):
+        self.populate_db()
+        results = list(self.connection.find({'a': {'$in': [0, 2]}}, {'a': 1}))
+        self.assertEqual(sorted(doc['a'] for doc in results), [0, 0, 0, 0, 2, 2, 2])
+        self.assertEqual(list(self.connection.find({'a': {'$in': []}})), [])
+
+    def test_57_in_syntax_with_id(self):
+        docs = self.populate_db()
+        wanted = [docs[1]['_id'], docs[4]['_id']]
+        results = self.connection.find({'_id': {'$in': wanted}}, {'_id': 1})
+        self.assertEqual(sorted(doc['_id'].to_string() for doc in results), sorted(id_.to_string() for id_ in wanted))
+
+    def test_58_or_syntax_with_find(self):
+        for a, b in [(1, 1), (1, 2), (2, 1), (3, 3)]:
+            self.connection.insert({'a': a, 'b': b})
+        results = self.connection.find({'$or': [{'a': 1, 'b': 2}, {'a': {'$gt': 2}}]}, {'a': 1, 'b': 1})
+        self.assertEqual(sorted((doc['a'], doc['b']) for doc in results), [(1, 2), (3, 3)])
+
+    def test_59_or_combined_with_other_params(self):
+        for a, b in [(1, 1), (1, 2), (2, 1), (2, 2)]:
+            self.connection.insert({'a': a, 'b': b})
+        results = self.connection.find({'b': 2, '$or': [{'a': 1}, {'a': 3}]}, {'a': 1, 'b': 1})
+        self.assertEqual(list(results), [{'a': 1, 'b': 2}])
+
+    def test_60_exists_syntax_with_find(self):
+        self.populate_db()
+        self.assertEqual(len(list(self.connection.find({'a': {'$exists': True}}))), 10)
+        self.assertEqual(len(list(self.connection.find({'z': {'$exists': False}}))), 10)
+        self.assertEqual(list(self.connection.find({'z': {'$exists': True}})), [])
+
+    def test_61_non_existent_column_inside_or(self):
+        self.populate_db()
+        results = self.connection.find({'$or': [{'z': 1}, {'a': 1}]}, {'a': 1})
+        self.assertEqual(list(results), [{'a': 1}] * 3)
+
+    def test_62_unique_index_rejects_duplicate(self):
+        self.connection.create_index(('a',), unique=True)
+        self.assertTrue(self.connection.has_index(('a',)))
+        doc_id = self.connection.insert({'a': 'x', 'b': 1})
+        self.assertRaises(DuplicateKeyError, self.connection.insert, {'a': 'x', 'b': 2})
+        self.connection.insert({'a': 'y', 'b': 2})
+        self.assertEqual(list(self.connection.find({'a': 'x'})), [{'_id': doc_id, 'a': 'x', 'b': 1}])
+
+    def test_63_unique_index_on_existing_duplicates_raises_error(self):
+        self.connection.insert({'a': 1})
+        self.connection.insert({'a': 1})
+        self.assertRaises(DuplicateKeyError, self.connection.create_index, ('a',), True)
+
+    def test_64_exists_syntax_when_only_some_documents_have_the_field(self):
+        self.connection.insert({'a': 1})
+        self.connection.insert({'a': 2, 'b': 5})
+        self.connection.insert({'a': 3, 'c': 'x'})
+        self.assertEqual(list(self.connection.find({'b': {'$exists': False}}, {'a': 1})), [{'a': 1}, {'a': 3}])
+        self.assertEqual(list(self.connection.find({'b': {'$exists': True}}, {'a': 1})), [{'a': 2}])
+        self.assertEqual(list(self.connection.find({'c': {'$exists': False}}, {'a': 1})), [{'a': 1}, {'a': 2}])
+        self.assertEqual(list(self.connection.find({'b': {'$lte': 5}}, {'a': 1})), [{'a': 2}])
+
+    def test_65_ne_and_none_match_documents_without_the_field(self):
+        self.connection.insert({'a': 1})
+        self.connection.insert({'a': 2, 'b': 3})
+        self.connection.insert({'a': 3, 'b': 4})
+        self.assertEqual(list(self.connection.find({'b': {'$ne': 3}}, {'a': 1})), [{'a': 1}, {'a': 3}])
+        self.assertEqual(list(self.connection.find({'b': {'$ne': None}}, {'a': 1})), [{'a': 2}, {'a': 3}])
+        self.assertEqual(list(self.connection.find({'b': None}, {'a': 1})), [{'a': 1}])
+        self.assertEqual(list(self.connection.find({'b': {'$in': [None, 4]}}, {'a': 1})), [{'a': 1}, {'a': 3}])
+
+    def test_66_ne_and_none_on_a_field_no_document_has(self):
+        self.connection.insert({'a': 1})
+        self.connection.insert({'a': 2})
+        self.assertEqual(list(self.connection.find({'zz': {'$ne': 3}}, {'a': 1})), [{'a': 1}, {'a': 2}])
+        self.assertEqual(list(self.connection.find({'zz': None}, {'a': 1})), [{'a': 1}, {'a': 2}])
+        self.assertEqual(list(self.connection.find({'zz': {'$in': [None]}}, {'a': 1})), [{'a': 1}, {'a': 2}])
+        self.assertEqual(list(self.connection.find({'zz': {'$ne': None}}, {'a': 1})), [])
+        self.assertEqual(list(self.connection.find({'zz': {'$lt': 3}}, {'a': 1})), [])
+
 
 if __name__ == '__main__':
     unittest.main()
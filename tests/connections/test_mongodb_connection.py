@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import patch
 
 import tests.connections.test_baseconnection as tbc
 import dicetables_db.connections.mongodb_connection as mg
@@ -58,5 +59,95 @@ class AdditionalMongoDBTests(unittest.TestCase):
     def test_projection_id_pos_neg(self):
         pass
 
+
+class FakeDatabase(object):
+    def __init__(self):
+        self.collections = []
+        self.calls = 0
+
+    def list_collection_names(self):
+        self.calls += 1
+        return self.collections[:]
+
+
+class FakeCollection(object):
+    name = 'test'
+
+    def __init__(self):
+        self.index_info = {'_id_': {'key': [('_id', 1)]}}
+        self.calls = 0
+
+    def index_information(self):
+        self.calls += 1
+        return dict(self.index_info)
+
+
+class TestMongoInformation(unittest.TestCase):
+    def setUp(self):
+        self.database = FakeDatabase()
+        self.collection = FakeCollection()
+        self.database.collections = ['other', 'test']
+        self.collection.index_info['a_1_b_1'] = {'key': [('a', 1), ('b', 1)]}
+
+    def test_reads_lazily_and_once(self):
+        info = mg.MongoInformation(self.database, self.collection)
+        self.assertEqual((self.database.calls, self.collection.calls), (0, 0))
+        self.assertTrue(info.has_index(('a', 'b')))
+        self.assertFalse(info.has_index(('a',)))
+        self.assertEqual(info.collections, ['other', 'test'])
+        self.assertEqual(info.indices, [('a', 'b')])
+        self.assertEqual((self.database.calls, self.collection.calls), (1, 1))
+
+    def test_missing_collection_skips_index_read(self):
+        self.database.collections = ['other']
+        info = mg.MongoInformation(self.database, self.collection)
+        self.assertEqual(info.indices, [])
+        self.assertEqual(self.collection.calls, 0)
+
+    def test_add_index_and_drop_collection(self):
+        self.database.collections = []
+        info = mg.MongoInformation(self.database, self.collection)
+        info.refresh_information()
+        info.add_index(('c',))
+        self.assertEqual(info.collections, ['test'])
+        self.assertTrue(info.has_index(('c',)))
+        info.drop_collection()
+        self.assertEqual((info.collections, info.indices), ([], []))
+        self.assertEqual(self.database.calls, 1)
+
+    def test_add_collection(self):
+        self.database.collections = []
+        info = mg.MongoInformation(self.database, self.collection)
+        info.refresh_information()
+        info.add_collection()
+        info.add_collection()
+        self.assertEqual(info.collections, ['test'])
+
+    def test_changes_before_first_read_are_read_from_server(self):
+        info = mg.MongoInformation(self.database, self.collection)
+        info.add_index(('c',))
+        info.drop_collection()
+        self.assertEqual(info.indices, [('a', 'b')])
+
+    def test_ttl(self):
+        info = mg.MongoInformation(self.database, self.collection, ttl=10.0)
+        with patch.object(mg, 'monotonic', return_value=100.0):
+            info.refresh_information()
+        self.collection.index_info['c_1'] = {'key': [('c', 1)]}
+        with patch.object(mg, 'monotonic', return_value=105.0):
+            self.assertFalse(info.has_index(('c',)))
+        with patch.object(mg, 'monotonic', return_value=110.0):
+            self.assertTrue(info.has_index(('c',)))
+        self.assertEqual(self.collection.calls, 2)
+
+    def test_refresh_information(self):
+        info = mg.MongoInformation(self.database, self.collection)
+        self.assertEqual(info.indices, [('a', 'b')])
+        del self.collection.index_info['a_1_b_1']
+        self.assertEqual(info.indices, [('a', 'b')])
+        info.refresh_information()
+        self.assertEqual(info.indices, [])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+from dicetables_db.connections.routing_connection import RoutingConnection
+from dicetables_db.connections.sql_connection import SQLConnection
+
+
+class TestRoutingConnection(unittest.TestCase):
+    def setUp(self):
+        self.primary = SQLConnection(':memory:', 'test')
+        self.replicas = [SQLConnection(':memory:', 'test'), SQLConnection(':memory:', 'test')]
+        self.connection = RoutingConnection(self.primary, self.replicas)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_init(self):
+        self.assertIs(self.connection.primary, self.primary)
+        self.assertEqual(self.connection.replicas, self.replicas)
+        self.assertEqual(self.connection.read_your_writes, 0.0)
+
+    def test_get_info(self):
+        expected = self.primary.get_info()
+        expected['replicas'] = 2
+        self.assertEqual(self.connection.get_info(), expected)
+
+    def test_writes_go_to_primary(self):
+        doc_id = self.connection.insert({'a': 1})
+        self.connection.create_index(('a',))
+        self.assertEqual(self.primary.find_one(), {'_id': doc_id, 'a': 1})
+        self.assertTrue(self.primary.has_index(('a',)))
+        for replica in self.replicas:
+            self.assertTrue(replica.is_collection_empty())
+            self.assertFalse(replica.has_index(('a',)))
+
+    def test_reset_collection_goes_to_primary(self):
+        self.primary.insert({'a': 1})
+        self.replicas[0].insert({'a': 1})
+        self.connection.reset_collection()
+        self.assertTrue(self.primary.is_collection_empty())
+        self.assertFalse(self.replicas[0].is_collection_empty())
+
+    def test_reads_round_robin_replicas(self):
+        first_id = self.replicas[0].insert({'a': 1})
+        second_id = self.replicas[1].insert({'a': 2})
+        self.assertEqual(self.connection.find_one(), {'_id': first_id, 'a': 1})
+        self.assertEqual(list(self.connection.find()), [{'_id': second_id, 'a': 2}])
+        self.assertEqual(self.connection.find_one(), {'_id': first_id, 'a': 1})
+
+    def test_reads_with_no_replicas_go_to_primary(self):
+        connection = RoutingConnection(SQLConnection(':memory:', 'test'))
+        doc_id = connection.insert({'a': 1})
+        self.assertEqual(connection.find_one(), {'_id': doc_id, 'a': 1})
+        self.assertFalse(connection.is_collection_empty())
+        connection.close()
+
+    def test_no_read_your_writes_reads_replica_after_write(self):
+        self.connection.insert({'a': 1})
+        self.assertIsNone(self.connection.find_one())
+
+    def test_read_your_writes_reads_primary_after_write(self):
+        connection = RoutingConnection(self.primary, self.replicas, read_your_writes=60.0)
+        self.assertTrue(connection.is_collection_empty())
+
+        doc_id = connection.insert({'a': 1})
+        self.assertEqual(connection.find_one(), {'_id': doc_id, 'a': 1})
+        self.assertEqual(list(connection.find()), [{'_id': doc_id, 'a': 1}])
+
+        connection.mark_replicas_synced()
+        self.assertIsNone(connection.find_one())
+
+    def test_close_closes_all(self):
+        self.connection.close()
+        for connection in [self.primary] + self.replicas:
+            self.assertRaises(Exception, connection.find)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from dicetables import DiceTable, Die
+
+from dicetables_db.connections.baseconnection import ASCENDING, DESCENDING
+from dicetables_db.connections.sharded_connection import ShardedConnection
+from dicetables_db.connections.sql_connection import SQLConnection
+from dicetables_db.insertandretrieve import DiceTableInsertionAndRetrieval
+from tests.connections.test_baseconnection import MockConnection
+
+
+class TestShardedConnection(unittest.TestCase):
+    def setUp(self):
+        self.connection = ShardedConnection.using_SQL(':memory:', 'test', 3)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def shard_with_document(self, doc_id):
+        return [shard for shard in self.connection.shards if shard.find_one({'_id': doc_id}) is not None]
+
+    def test_init_no_shards_raises_error(self):
+        self.assertRaises(ValueError, ShardedConnection, [])
+
+    def test_using_SQL(self):
+        shards = self.connection.shards
+        self.assertEqual(len(shards), 3)
+        for index, shard in enumerate(shards):
+            self.assertIsInstance(shard, SQLConnection)
+            self.assertEqual(shard.get_info()['current_collection'], 'test_{}'.format(index))
+
+    def test_get_info(self):
+        self.connection.create_index(('a',))
+        self.connection.shards[0].create_index(('b',))
+        expected = {
+            'db': [':memory:'] * 3,
+            'collections': ['test_0', 'test_1', 'test_2'],
+            'current_collection': ['test_0', 'test_1', 'test_2'],
+            'indices': [('a',)],
+            'shards': 3
+        }
+        self.assertEqual(self.connection.get_info(), expected)
+
+    def test_get_shard_index_uses_die_type_set(self):
+        index = self.connection.get_shard_index('Die(4)&Die(6)')
+        self.assertEqual(index, self.connection.get_shard_index('Die(6)&Die(4)'))
+        self.assertIn(index, range(3))
+
+    def test_get_shard_index_spreads_groups(self):
+        indices = {self.connection.get_shard_index('Die({})'.format(size)) for size in range(1, 30)}
+        self.assertEqual(indices, {0, 1, 2})
+
+    def test_insert_goes_to_routed_shard_only(self):
+        group = 'Die(6)'
+        doc_id = self.connection.insert({'group': group, 'score': 6})
+        self.assertEqual(self.shard_with_document(doc_id), [self.connection.get_shard(group)])
+
+    def test_is_collection_empty(self):
+        self.assertTrue(self.connection.is_collection_empty())
+        self.connection.insert({'group': 'Die(6)', 'score': 6})
+        self.assertFalse(self.connection.is_collection_empty())
+
+    def test_find_with_group_queries_one_shard(self):
+        for size in range(1, 10):
+            self.connection.insert({'group': 'Die({})'.format(size), 'score': size})
+        for shard in self.connection.shards:
+            shard.find = None
+        target = self.connection.get_shard('Die(3)')
+        del target.find
+
+        self.assertEqual(list(self.connection.find({'group': 'Die(3)'}, {'score': 1})), [{'score': 3}])
+
+    def test_find_without_group_fans_out(self):
+        for size in range(1, 10):
+            self.connection.insert({'group': 'Die({})'.format(size), 'score': size})
+        results = self.connection.find({'score': {'$gt': 3}}, {'score': 1})
+        self.assertEqual(sorted(result['score'] for result in results), list(range(4, 10)))
+
+    def test_find_without_group_sort_and_limit_across_shards(self):
+        for size in range(1, 10):
+            self.connection.insert({'group': 'Die({})'.format(size), 'score': size})
+        results = self.connection.find(projection={'score': 1}, sort=[('score', DESCENDING)], limit=2)
+        self.assertEqual(list(results), [{'score': 9}, {'score': 8}])
+
+    def test_find_without_group_sort_by_column_not_in_projection(self):
+        for size in range(1, 10):
+            self.connection.insert({'group': 'Die({})'.format(size), 'score': size})
+        results = self.connection.find({}, {'group': 1}, sort=[('score', DESCENDING)], limit=2)
+        self.assertEqual(list(results), [{'group': 'Die(9)'}, {'group': 'Die(8)'}])
+        results = self.connection.find({}, {'score': 0, '_id': 0}, sort=[('score', ASCENDING)], limit=2)
+        self.assertEqual(list(results), [{'group': 'Die(1)'}, {'group': 'Die(2)'}])
+
+    def test_find_without_group_sort_by_several_columns(self):
+        for size in range(1, 10):
+            self.connection.insert({'group': 'Die({})'.format(size), 'score': size % 3, 'size': size})
+        results = self.connection.find({}, {'size': 1}, sort=[('score', DESCENDING), ('size', ASCENDING)])
+        self.assertEqual([result['size'] for result in results], [2, 5, 8, 1, 4, 7, 3, 6, 9])
+
+    def test_find_without_group_sort_with_missing_column(self):
+        for size in range(1, 7):
+            document = {'group': 'Die({})'.format(size)}
+            if size % 2:
+                document['rank'] = size
+            self.connection.insert(document)
+        for shard in self.connection.shards:
+            shard.insert({'group': 'Die(2)', 'rank': None})
+        results = self.connection.find({}, {'rank': 1}, sort=[('rank', ASCENDING)])
+        self.assertEqual([result.get('rank') for result in results][-3:], [1, 3, 5])
+
+    def test_exact_probes_go_to_one_shard(self):
+        insert_retrieve = DiceTableInsertionAndRetrieval(self.connection)
+        tables = [DiceTable.new().add_die(Die(size), number) for size in (4, 6) for number in (1, 2)]
+        insert_retrieve.add_tables(tables)
+        queried = []
+
+        def record_shard(index, method):
+            def new_method(*args, **kwargs):
+                queried.append(index)
+                return method(*args, **kwargs)
+            return new_method
+
+        for index, shard in enumerate(self.connection.shards):
+            shard.find = record_shard(index, shard.find)
+            shard.find_one = record_shard(index, shard.find_one)
+
+        self.assertTrue(insert_retrieve.has_table(tables[0]))
+        self.assertEqual(queried, [self.connection.get_shard_index('Die(4)')])
+        queried.clear()
+        self.assertEqual(insert_retrieve.has_tables(tables), [True] * 4)
+        expected = sorted(self.connection.get_shard_index(group) for group in ('Die(4)', 'Die(6)'))
+        self.assertEqual(sorted(queried), expected)
+
+    def test_find_one(self):
+        doc_id = self.connection.insert({'group': 'Die(6)', 'score': 6})
+        self.assertEqual(self.connection.find_one({'_id': doc_id}), {'_id': doc_id, 'group': 'Die(6)', 'score': 6})
+        self.assertEqual(self.connection.find_one({'group': 'Die(6)'}, {'score': 1}), {'score': 6})
+        self.assertIsNone(self.connection.find_one({'group': 'Die(5)'}))
+
+    def test_create_index_and_has_index(self):
+        self.assertFalse(self.connection.has_index(('group', 'score')))
+        self.connection.create_index(('group', 'score'))
+        self.assertTrue(self.connection.has_index(('group', 'score')))
+        self.connection.shards[1].reset_collection()
+        self.assertFalse(self.connection.has_index(('group', 'score')))
+
+    def test_reset_collection(self):
+        self.connection.insert({'group': 'Die(6)', 'score': 6})
+        self.connection.create_index(('a',))
+        self.connection.reset_collection()
+        self.assertTrue(self.connection.is_collection_empty())
+        self.assertEqual(self.connection.get_info()['indices'], [])
+
+    def test_drop_collection(self):
+        self.connection.insert({'group': 'Die(6)', 'score': 6})
+        self.connection.drop_collection()
+        self.assertEqual(self.connection.get_info()['collections'], [])
+
+
+class TestShardedConnectionSQLFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'shards.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_using_SQL_gives_each_shard_its_own_file(self):
+        connection = ShardedConnection.using_SQL(self.path, 'test', 3)
+        expected = [os.path.join(self.directory, 'shards_{}.db'.format(index)) for index in range(3)]
+        self.assertEqual(connection.get_info()['db'], expected)
+        connection.close()
+
+    def test_insert_and_retrieve_on_file(self):
+        connection = ShardedConnection.using_SQL(self.path, 'test', 3)
+        insert_retrieve = DiceTableInsertionAndRetrieval(connection)
+        tables = [DiceTable.new().add_die(Die(size), 2) for size in range(2, 8)]
+        insert_retrieve.add_tables(tables)
+        connection.close()
+
+        connection = ShardedConnection.using_SQL(self.path, 'test', 3)
+        insert_retrieve = DiceTableInsertionAndRetrieval(connection)
+        self.assertEqual(insert_retrieve.has_tables(tables), [True] * 6)
+        doc_id = insert_retrieve.find_nearest_table([(Die(5), 3)])
+        self.assertEqual(insert_retrieve.get_table(doc_id), DiceTable.new().add_die(Die(5), 2))
+        connection.close()
+
+
+class TestShardedConnectionThreaded(unittest.TestCase):
+    def setUp(self):
+        self.shards = [MockConnection('sharded_{}'.format(index)) for index in range(3)]
+        self.connection = ShardedConnection(self.shards, max_workers=3)
+
+    def tearDown(self):
+        self.connection.drop_collection()
+        self.connection.close()
+
+    def test_fan_out_with_threads(self):
+        for size in range(1, 10):
+            self.connection.insert({'group': 'Die({})'.format(size), 'score': size})
+        results = self.connection.find(projection={'score': 1})
+        self.assertEqual(sorted(result['score'] for result in results), list(range(1, 10)))
+        self.assertEqual(self.connection.find_one({'score': 5}, {'group': 1}), {'group': 'Die(5)'})
+
+    def test_fan_out_fetches_first_batch_in_worker_threads(self):
+        for size in range(1, 10):
+            self.connection.insert({'group': 'Die({})'.format(size), 'score': size})
+        fetched_in = []
+
+        def record_thread(find):
+            def new_find(*args):
+                for document in find(*args):
+                    fetched_in.append(threading.current_thread())
+                    yield document
+            return new_find
+
+        for shard in self.shards:
+            shard.find = record_thread(shard.find)
+        results = self.connection.find(projection={'score': 1}, batch_size=100)
+        self.assertEqual(len(fetched_in), 9)
+        self.assertNotIn(threading.main_thread(), fetched_in)
+        self.assertEqual(sorted(result['score'] for result in results), list(range(1, 10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
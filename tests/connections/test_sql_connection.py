@@ -1,8 +1,12 @@
 import unittest
 
 import os
+import shutil
+import tempfile
+import sqlite3 as lite
 
 import tests.connections.test_baseconnection as tbc
+from dicetables_db.connections.baseconnection import DESCENDING
 from dicetables_db.connections.sql_connection import SQLConnection, InMemoryInformation
 
 
@@ -112,18 +116,80 @@ class AdditionalSQLTests(unittest.TestCase):
     def test_new_columns_default_integer(self):
         self.connection.insert({'a': 1, 'b': 1})
         doc_id = self.connection.insert({'a': 2})
-        self.assertEqual(self.connection.find_one({'_id': doc_id}), {'_id': doc_id, 'a': 2, 'b': 0})
+        self.assertEqual(self.connection.find_one({'_id': doc_id}), {'_id': doc_id, 'a': 2, 'b': None})
 
     def test_new_columns_default_text(self):
         self.connection.insert({'a': 1, 'b': 'hello'})
         doc_id = self.connection.insert({'a': 2})
-        self.assertEqual(self.connection.find_one({'_id': doc_id}), {'_id': doc_id, 'a': 2, 'b': ''})
+        self.assertEqual(self.connection.find_one({'_id': doc_id}), {'_id': doc_id, 'a': 2, 'b': None})
 
     def test_new_columns_default_blob(self):
         self.connection.insert({'a': 1, 'b': self.connection.id_class().new()})
         doc_id = self.connection.insert({'a': 2})
         self.assertEqual(self.connection.find_one({'_id': doc_id}), {'_id': doc_id, 'a': 2, 'b': None})
 
+    def test_find_is_lazy(self):
+        self.connection.insert({'a': 1})
+        results = self.connection.find({}, {'a': 1})
+        self.assertNotIsInstance(results, list)
+        self.assertEqual(next(results), {'a': 1})
+        self.assertRaises(StopIteration, next, results)
+
+    def test_find_batch_size_returns_all_documents(self):
+        for number in range(5):
+            self.connection.insert({'a': number})
+        results = self.connection.find({'a': {'$gt': 0}}, {'a': 1}, batch_size=2)
+        self.assertEqual(list(results), [{'a': number} for number in range(1, 5)])
+
+    def test_find_errors_are_not_lazy(self):
+        self.assertRaises(ValueError, self.connection.find, {'a': 1}, {'_id': 0, 'b': 1})
+
+    def test_find_unsupported_operator_raises_error(self):
+        self.connection.insert({'a': 1})
+        self.assertRaises(ValueError, self.connection.find, {'a': {'$regex': 'x'}})
+        self.assertRaises(ValueError, self.connection.find, {'$or': []})
+
+    def test_save_to_target(self):
+        doc_id = self.connection.insert({'a': 1})
+        self.connection.create_index(('a',))
+        self.connection.save_to_target('test.db')
+
+        copy = SQLConnection('test.db', 'test')
+        self.assertEqual(copy.find_one(), {'_id': doc_id, 'a': 1})
+        self.assertTrue(copy.has_index(('a',)))
+        copy.drop_collection()
+        copy.close()
+        os.remove('test.db')
+
+    def test_save_to_target_progress(self):
+        self.connection.insert({'a': 1})
+        progress = []
+        self.connection.save_to_target('test.db', progress=lambda *args: progress.append(args))
+        self.assertEqual(progress[-1][1], 0)
+        os.remove('test.db')
+
+    def test_load_from_target(self):
+        source = SQLConnection('test.db', 'test')
+        doc_id = source.insert({'b': 2})
+        source.create_index(('b',))
+        source.close()
+
+        self.connection.insert({'a': 1})
+        self.connection.load_from_target('test.db')
+        self.assertEqual(list(self.connection.find()), [{'_id': doc_id, 'b': 2}])
+        self.assertEqual(self.connection.get_info()['indices'], [('b',)])
+        os.remove('test.db')
+
+    def test_load_from_target_without_collection(self):
+        other = SQLConnection('test.db', 'other')
+        other.close()
+
+        self.connection.insert({'a': 1})
+        self.connection.load_from_target('test.db')
+        self.assertTrue(self.connection.is_collection_empty())
+        self.assertEqual(self.connection.get_info()['collections'], ['other', 'test'])
+        os.remove('test.db')
+
     def test_InMemoryInformation_refresh_columns(self):
         self.assertEqual(self.in_memory.columns, ['_id'])
         self.connection.insert({'a': 1})
@@ -208,5 +274,124 @@ class AdditionalSQLTests(unittest.TestCase):
         self.assertEqual(self.in_memory.indices, [])
         self.assertEqual(self.in_memory.collections, ['will_still_exist'])
 
+
+class SQLCommitTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.db')
+        self.connections = []
+
+    def tearDown(self):
+        for connection in self.connections:
+            connection.close()
+        shutil.rmtree(self.directory)
+
+    def new_connection(self, **kwargs):
+        connection = SQLConnection(self.path, 'test', **kwargs)
+        self.connections.append(connection)
+        return connection
+
+    def make_writer_and_reader(self, **kwargs):
+        writer = self.new_connection(**kwargs)
+        writer.create_index(('a',))
+        reader = self.new_connection()
+        return writer, reader
+
+    def test_default_commits_only_on_commit(self):
+        writer, reader = self.make_writer_and_reader()
+        writer.insert({'a': 1})
+        self.assertTrue(reader.is_collection_empty())
+        writer.commit()
+        self.assertFalse(reader.is_collection_empty())
+
+    def test_commit_every(self):
+        writer, reader = self.make_writer_and_reader(commit_every=2)
+        writer.insert({'a': 1})
+        self.assertTrue(reader.is_collection_empty())
+        writer.insert({'a': 2})
+        self.assertEqual(len(list(reader.find())), 2)
+
+    def test_commit_interval(self):
+        writer, reader = self.make_writer_and_reader(commit_interval=0.0)
+        writer.insert({'a': 1})
+        self.assertFalse(reader.is_collection_empty())
+
+    def test_transaction_commits_on_exit(self):
+        writer, reader = self.make_writer_and_reader(commit_every=1)
+        with writer.transaction():
+            writer.insert({'a': 1})
+            writer.insert({'a': 2})
+            self.assertTrue(reader.is_collection_empty())
+        self.assertEqual(len(list(reader.find())), 2)
+
+    def test_transaction_rolls_back_on_error(self):
+        writer, reader = self.make_writer_and_reader()
+        doc_id = writer.insert({'a': 1})
+        with self.assertRaises(KeyError):
+            with writer.transaction():
+                writer.insert({'a': 2, 'b': 'new column'})
+                raise KeyError('oops')
+        self.assertEqual(list(writer.find()), [{'_id': doc_id, 'a': 1}])
+        self.assertEqual(list(reader.find()), [{'_id': doc_id, 'a': 1}])
+        self.assertEqual(writer.get_info()['indices'], [('a',)])
+
+    def test_nested_transaction_commits_with_outermost(self):
+        writer, reader = self.make_writer_and_reader()
+        with writer.transaction():
+            with writer.transaction():
+                writer.insert({'a': 1})
+            self.assertTrue(reader.is_collection_empty())
+        self.assertFalse(reader.is_collection_empty())
+
+    def test_insert_many_is_one_transaction(self):
+        writer, reader = self.make_writer_and_reader()
+        writer.insert_many([{'a': 1}, {'a': 2}])
+        self.assertEqual(len(list(reader.find())), 2)
+
+    def test_pragmas(self):
+        connection = self.new_connection(synchronous='normal', journal_mode='wal')
+        self.assertEqual(connection.cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+        self.assertEqual(connection.cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_bad_pragmas_raise_error(self):
+        self.assertRaises(ValueError, SQLConnection, self.path, 'test', synchronous='sometimes')
+        self.assertRaises(ValueError, SQLConnection, self.path, 'test', journal_mode='wal; DROP TABLE test')
+
+    def test_columns_and_index_added_by_another_connection(self):
+        first = self.new_connection()
+        second = self.new_connection()
+        first.create_index(('a', 'b'))
+        first.commit()
+        second.create_index(('a', 'b'))
+        second.insert({'a': 1, 'b': 2})
+        second.commit()
+        self.assertTrue(second.has_index(('a', 'b')))
+        self.assertEqual(list(first.find({}, {'_id': 0})), [{'a': 1, 'b': 2}])
+
+    def test_queries_see_columns_added_by_another_connection(self):
+        first = self.new_connection()
+        second = self.new_connection()
+        first.insert({'a': 1})
+        first.commit()
+        second.find_one({'a': 1})
+        first.insert({'a': 2, 'b': 3})
+        first.commit()
+        self.assertEqual(list(second.find({'b': {'$lte': 3}}, {'a': 1})), [{'a': 2}])
+        self.assertEqual(list(second.find({'a': 2}, {'_id': 0})), [{'a': 2, 'b': 3}])
+        self.assertEqual(list(second.find({'a': 2}, {'b': 1})), [{'b': 3}])
+        self.assertEqual(list(second.find({}, {'a': 1}, sort=[('b', DESCENDING)], limit=1)), [{'a': 2}])
+
+    def test_index_added_by_another_connection_must_match(self):
+        first = self.new_connection()
+        second = self.new_connection()
+        first.create_index(('a',))
+        first.create_index(('b',), unique=True)
+        first.commit()
+        self.assertRaises(lite.OperationalError, second.create_index, ('a',), unique=True)
+        self.assertRaises(lite.OperationalError, second.create_index, ('b',))
+        second.create_index(('b',), unique=True)
+        self.assertTrue(second.has_index(('b',)))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 import dicetables as dt
@@ -6,7 +9,10 @@ from dicetables_db.connections.mongodb_connection import MongoDBConnection
 from dicetables_db.connections.sql_connection import SQLConnection
 from dicetables_db.insertandretrieve import DiceTableInsertionAndRetrieval, Finder
 from tests.connections.test_baseconnection import MockConnection
-from dicetables_db.tools.dbprep import Serializer
+from dicetables_db.tools.bloomfilter import BloomFilter
+from dicetables_db.tools.dbprep import Serializer, get_hash
+from dicetables_db.tools.sharedcache import SharedTableCache
+from dicetables_db.tools.tablestore import MMapTableStore
 
 
 class TestDBInterface(unittest.TestCase):
@@ -30,7 +36,16 @@ class TestDBInterface(unittest.TestCase):
         self.assertEqual(new_conn.get_info()['indices'], [])
         DiceTableInsertionAndRetrieval(new_conn)
 
-        self.assertEqual(new_conn.get_info()['indices'], [('group', 'score')])
+        self.assertEqual(new_conn.get_info()['indices'], [('group', 'score'), ('hash',)])
+
+    def test_init_does_not_create_hash_index_on_old_collection(self):
+        old_conn = SQLConnection(':memory:', 'old_collection')
+        old_conn.insert({'group': 'Die(2)', 'score': 2, 'Die(2)': 1})
+        interface = DiceTableInsertionAndRetrieval(old_conn)
+        self.assertEqual(old_conn.get_info()['indices'], [('group', 'score')])
+        self.assertFalse(interface.has_required_index())
+        self.assertTrue(interface.has_dice_list([(dt.Die(2), 1)]))
+        self.assertEqual(interface.has_tables([dt.DiceTable.new().add_die(dt.Die(2))]), [True])
 
     def test_has_required_index_true(self):
         self.assertTrue(self.interface.has_required_index())
@@ -56,6 +71,48 @@ class TestDBInterface(unittest.TestCase):
         stupid_table = dt.DiceTable({1: 2, 3: 4}, dt.DiceRecord.new())
         self.assertFalse(self.interface.has_table(stupid_table))
 
+    def test_has_dice_list_true_and_false(self):
+        self.interface.add_table(dt.DiceTable.new().add_die(dt.Die(3), 2))
+        self.assertTrue(self.interface.has_dice_list([(dt.Die(3), 2)]))
+        self.assertFalse(self.interface.has_dice_list([(dt.Die(3), 1)]))
+
+    def test_has_tables(self):
+        stored = [dt.DiceTable.new().add_die(dt.Die(3), 2), dt.DiceTable.new().add_die(dt.Die(2)).add_die(dt.Die(4))]
+        for table in stored:
+            self.interface.add_table(table)
+        to_check = [
+            dt.DiceTable.new().add_die(dt.Die(3), 2),
+            dt.DiceTable.new().add_die(dt.Die(3), 1),
+            dt.DiceTable.new(),
+            dt.DiceTable.new().add_die(dt.Die(2)).add_die(dt.Die(4)),
+            dt.DiceTable.new().add_die(dt.Die(2), 2).add_die(dt.Die(4)),
+            dt.DiceTable.new().add_die(dt.Die(6)),
+        ]
+        self.assertEqual(self.interface.has_tables(to_check), [True, False, False, True, False, False])
+
+    def test_has_tables_same_score_different_counts(self):
+        self.interface.add_table(dt.DiceTable.new().add_die(dt.Die(2), 3).add_die(dt.Die(3), 2))
+        to_check = [dt.DiceTable.new().add_die(dt.Die(2), 3).add_die(dt.Die(3), 2),
+                    dt.DiceTable.new().add_die(dt.Die(2), 6).add_die(dt.Die(3))]
+        self.assertEqual(self.interface.has_tables(to_check), [True, False])
+
+    def test_has_tables_empty_list(self):
+        self.assertEqual(self.interface.has_tables([]), [])
+
+    def test_has_tables_uses_one_query(self):
+        tables = [dt.DiceTable.new().add_die(dt.Die(2), number) for number in range(1, 6)]
+        self.interface.add_table(tables[1])
+        queries = []
+        find = self.connection.find
+
+        def counting_find(*args, **kwargs):
+            queries.append(args)
+            return find(*args, **kwargs)
+
+        self.connection.find = counting_find
+        self.assertEqual(self.interface.has_tables(tables), [False, True, False, False, False])
+        self.assertEqual(len(queries), 1)
+
     def test_add_table_empty_table_raises_error(self):
         self.assertRaises(ValueError, self.interface.add_table, dt.DiceTable.new())
 
@@ -69,20 +126,24 @@ class TestDBInterface(unittest.TestCase):
         table = dt.DiceTable.new().add_die(dt.Die(2))
         doc_id = self.interface.add_table(table)
         table_data = Serializer.serialize(table)
-        expected = {'_id': doc_id, 'group': 'Die(2)', 'serialized': table_data, 'score': 2, 'Die(2)': 1}
+        expected = {'_id': doc_id, 'group': 'Die(2)', 'serialized': table_data, 'score': 2, 'Die(2)': 1,
+                    'hash': get_hash([('Die(2)', 1)]), 'mean': '3/2', 'variance': '1/4'}
         document = self.connection.find_one()
         self.assertEqual(document, expected)
 
-    def test_ATTENTION_add_table_can_add_same_table_twice(self):
+    def test_add_table_same_table_twice_returns_stored_id(self):
         table = dt.DiceTable.new().add_die(dt.Die(2))
         doc_id_1 = self.interface.add_table(table)
         doc_id_2 = self.interface.add_table(table)
-        table_data = Serializer.serialize(table)
-        expected_1 = {'_id': doc_id_1, 'group': 'Die(2)', 'serialized': table_data, 'score': 2, 'Die(2)': 1}
-        expected_2 = {'_id': doc_id_2, 'group': 'Die(2)', 'serialized': table_data, 'score': 2, 'Die(2)': 1}
-        documents = self.connection.find()
-        self.assertIn(expected_1, documents)
-        self.assertIn(expected_2, documents)
+        self.assertEqual(doc_id_1, doc_id_2)
+        self.assertEqual(len(list(self.connection.find())), 1)
+
+    def test_add_tables(self):
+        tables = [dt.DiceTable.new().add_die(dt.Die(2), number) for number in range(1, 4)]
+        doc_ids = self.interface.add_tables(tables)
+        self.assertEqual(len(doc_ids), 3)
+        for doc_id, table in zip(doc_ids, tables):
+            self.assertEqual(self.interface.get_table(doc_id), table)
 
     def test_find_nearest_table_no_match(self):
         dice_list = [(dt.Die(1), 1)]
@@ -183,6 +244,142 @@ class TestDBInterface(unittest.TestCase):
 
         self.assertEqual(finder1.find_nearest_table(), dice_table1_id)
 
+    def test_Finder_find_nearest_table_smaller_group_with_higher_score_wins(self):
+        self.interface.add_table(dt.DiceTable.new().add_die(dt.Die(2)).add_die(dt.Die(3)))
+        big_id = self.interface.add_table(dt.DiceTable.new().add_die(dt.Die(20)))
+        finder = Finder(self.connection, [(dt.Die(2), 1), (dt.Die(3), 1), (dt.Die(20), 1), (dt.Die(30), 1)])
+        self.assertEqual(finder.find_nearest_table(), big_id)
+
+    def test_Finder_find_nearest_table_skips_groups_that_cannot_win(self):
+        doc_id = self.interface.add_table(dt.DiceTable.new().add_die(dt.Die(30)))
+        queries = []
+        find = self.connection.find
+
+        def counting_find(params_dict=None, *args, **kwargs):
+            queries.append(params_dict['group'])
+            return find(params_dict, *args, **kwargs)
+
+        self.connection.find = counting_find
+        finder = Finder(self.connection, [(dt.Die(10), 1), (dt.Die(20), 1), (dt.Die(30), 1)])
+        self.assertEqual(finder.find_nearest_table(), doc_id)
+        self.assertEqual(queries, ['Die(10)&Die(20)&Die(30)', 'Die(20)&Die(30)', 'Die(10)&Die(30)', 'Die(30)'])
+
+
+class TestDBInterfaceWithTableStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = MMapTableStore(os.path.join(self.directory, 'tables.seg'))
+        self.connection = SQLConnection(':memory:', 'test_collection')
+        self.interface = DiceTableInsertionAndRetrieval(self.connection, table_store=self.store)
+
+    def tearDown(self):
+        self.connection.close()
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_add_table_writes_to_store(self):
+        table = dt.DiceTable.new().add_die(dt.Die(2))
+        doc_id = self.interface.add_table(table)
+        self.assertEqual(bytes(self.store.get(doc_id)), Serializer.serialize(table))
+
+    def test_get_table_reads_from_store(self):
+        table = dt.DiceTable.new().add_die(dt.Die(2))
+        doc_id = self.interface.add_table(table)
+        self.connection.reset_collection()
+        self.assertEqual(self.interface.get_table(doc_id), table)
+
+    def test_get_table_falls_back_to_connection(self):
+        table = dt.DiceTable.new().add_die(dt.Die(2))
+        doc_id = DiceTableInsertionAndRetrieval(self.connection).add_table(table)
+        self.assertFalse(self.store.has(doc_id))
+        self.assertEqual(self.interface.get_table(doc_id), table)
+
+
+class TestDBInterfaceWithTableCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = SharedTableCache('dt_interface_test_{}'.format(os.getpid()), max_tables=4)
+        self.connection = SQLConnection(':memory:', 'test_collection')
+        self.interface = DiceTableInsertionAndRetrieval(self.connection, table_cache=self.cache)
+
+    def tearDown(self):
+        self.connection.close()
+        self.cache.unlink()
+
+    def test_get_table_fills_cache(self):
+        table = dt.DiceTable.new().add_die(dt.Die(2))
+        doc_id = self.interface.add_table(table)
+        self.assertNotIn(doc_id, self.cache)
+        self.assertEqual(self.interface.get_table(doc_id), table)
+        self.assertIn(doc_id, self.cache)
+
+    def test_get_table_reads_from_cache(self):
+        table = dt.DiceTable.new().add_die(dt.Die(2))
+        doc_id = self.interface.add_table(table)
+        self.interface.get_table(doc_id)
+        self.connection.reset_collection()
+        self.assertEqual(self.interface.get_table(doc_id), table)
+
+
+class TestDBInterfaceWithBloomFilter(unittest.TestCase):
+    def setUp(self):
+        self.connection = SQLConnection(':memory:', 'test_collection')
+        self.bloom = BloomFilter(100)
+        self.interface = DiceTableInsertionAndRetrieval(self.connection, bloom_filter=self.bloom)
+        self.queries = []
+        find, find_one = self.connection.find, self.connection.find_one
+
+        def counting_find(*args, **kwargs):
+            self.queries.append(args)
+            return find(*args, **kwargs)
+
+        def counting_find_one(*args, **kwargs):
+            self.queries.append(args)
+            return find_one(*args, **kwargs)
+
+        self.connection.find, self.connection.find_one = counting_find, counting_find_one
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_add_table_adds_to_filter(self):
+        table = dt.DiceTable.new().add_die(dt.Die(2))
+        self.interface.add_table(table)
+        self.assertIn(get_hash([('Die(2)', 1)]), self.bloom)
+
+    def test_has_table_miss_does_not_query(self):
+        self.assertFalse(self.interface.has_table(dt.DiceTable.new().add_die(dt.Die(2))))
+        self.assertFalse(self.interface.has_dice_list([(dt.Die(3), 1)]))
+        self.assertEqual(self.queries, [])
+
+    def test_has_table_hit_queries(self):
+        table = dt.DiceTable.new().add_die(dt.Die(2))
+        self.interface.add_table(table)
+        self.assertTrue(self.interface.has_table(table))
+        self.assertEqual(len(self.queries), 1)
+
+    def test_has_tables_all_misses_does_not_query(self):
+        tables = [dt.DiceTable.new().add_die(dt.Die(2), number) for number in range(1, 4)]
+        self.assertEqual(self.interface.has_tables(tables), [False, False, False])
+        self.assertEqual(self.queries, [])
+
+    def test_find_nearest_table_skips_exact_query_on_miss(self):
+        doc_id = self.interface.add_table(dt.DiceTable.new().add_die(dt.Die(2)))
+        self.queries.clear()
+        self.assertEqual(self.interface.find_nearest_table([(dt.Die(2), 3)]), doc_id)
+        exact_query = {'group': 'Die(2)', 'hash': get_hash([('Die(2)', 3)])}
+        self.assertNotIn(exact_query, [query[0] for query in self.queries])
+
+    def test_init_rebuilds_empty_filter_from_collection(self):
+        self.interface.add_table(dt.DiceTable.new().add_die(dt.Die(2)))
+        bloom = BloomFilter(100)
+        DiceTableInsertionAndRetrieval(self.connection, bloom_filter=bloom)
+        self.assertIn(get_hash([('Die(2)', 1)]), bloom)
+
+    def test_reset_clears_filter(self):
+        self.interface.add_table(dt.DiceTable.new().add_die(dt.Die(2)))
+        self.interface.reset()
+        self.assertEqual(len(self.bloom), 0)
+
 
 class TestDBInterfaceWithSQL(TestDBInterface):
     @staticmethod
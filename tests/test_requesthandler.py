@@ -1,5 +1,11 @@
+from multiprocessing import Process, Queue as ProcessQueue
+import os
 from queue import Queue
+import shutil
 from string import printable
+import subprocess
+import sys
+import tempfile
 import unittest
 
 from dicetables import (DiceTable, DetailedDiceTable, DiceRecord, Parser,
@@ -9,7 +15,35 @@ from dicetables import (DiceTable, DetailedDiceTable, DiceRecord, Parser,
 from dicetables_db.connections.mongodb_connection import MongoDBConnection
 from dicetables_db.connections.sql_connection import SQLConnection
 
-from dicetables_db.requesthandler import RequestHandler, make_dict
+from dicetables_db.requesthandler import (RequestHandler, make_dict, iter_response, RESPONSE_FIELDS,
+                                          DOWNSAMPLED_AXES, get_response_key)
+from dicetables_db.responsecache import ResponseCache
+from dicetables_db.tools.axestools import decode_axes, downsample_axes
+from dicetables_db.tools.sharedcache import SharedTableCache
+from dicetables_db.tools.tasktools import Moments, ModifiedTable
+
+
+class CountingCache(object):
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+
+    def get(self, doc_id):
+        table = self.cache.get(doc_id)
+        if table is not None:
+            self.hits += 1
+        return table
+
+    def put(self, doc_id, dice_table):
+        return self.cache.put(doc_id, dice_table)
+
+
+def get_mean_with_shared_cache(db_path, cache, input_str, results):
+    counting = CountingCache(cache)
+    handler = RequestHandler.using_SQL(db_path, 'test', table_cache=counting)
+    results.put((handler.get_response(input_str)['mean'], counting.hits))
+    handler.close_connection()
+    cache.close()
 
 
 class TestRequestHandler(unittest.TestCase):
@@ -37,6 +71,22 @@ class TestRequestHandler(unittest.TestCase):
         self.assertEqual(conn.get_info()['ip'], 'localhost')
         self.assertEqual(conn.get_info()['port'], '27017')
 
+    def test_init_does_not_touch_database(self):
+        connection = SQLConnection(':memory:', 'test')
+        RequestHandler(connection)
+        self.assertEqual(connection.get_info()['indices'], [])
+
+    def test_first_request_creates_index(self):
+        self.handler.get_response('Die(6)')
+        self.assertTrue(self.handler._conn.has_index(('group', 'score')))
+
+    def test_sql_only_use_does_not_import_pymongo(self):
+        code = ("import sys, dicetables_db; "
+                "dicetables_db.RequestHandler.using_SQL(':memory:', 'test').get_response('2*Die(6)'); "
+                "print('pymongo' in sys.modules)")
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'False')
+
     def test_init_default_max_score(self):
         self.assertEqual(self.handler._max_dice_value, 12000)
         new_handler = RequestHandler.using_mongo_db('test_db', 'test', max_dice_value=10)
@@ -306,6 +356,306 @@ class TestRequestHandler(unittest.TestCase):
         self.assertEqual(table.calc.stddev(3), 0.471)
         self.assertEqual(answer['stddev'], 0.471)
 
+    def test_make_dict_default_fields(self):
+        table = DiceTable.new().add_die(Die(4))
+        self.assertEqual(tuple(sorted(make_dict(table).keys())), tuple(sorted(RESPONSE_FIELDS)))
+
+    def test_make_dict_only_requested_fields(self):
+        table = DiceTable.new().add_die(Die(4))
+        self.assertEqual(make_dict(table, ['range', 'mean']), {'range': (1, 4), 'mean': 2.5})
+
+    def test_make_dict_binary_data(self):
+        table = DiceTable.new().add_die(Die(6), 3)
+        answer = make_dict(table, ['data', 'binaryData'])
+        self.assertEqual(decode_axes(answer['binaryData']), answer['data'])
+
+    def test_make_dict_unknown_field_raises_value_error(self):
+        self.assertRaises(ValueError, make_dict, DiceTable.new(), ['range', 'nope'])
+
+    def test_iter_response_chunks_join_to_make_dict(self):
+        table = DiceTable.new().add_die(Die(6), 3).add_die(ModDie(4, -12))
+        expected = make_dict(table)
+        answer = {'tableString': '', 'forSciNum': {}, 'data': [(), ()]}
+        counts = dict.fromkeys(RESPONSE_FIELDS, 0)
+        for field, chunk in iter_response(table, rows_per_chunk=4):
+            counts[field] += 1
+            if field == 'tableString':
+                answer[field] += chunk
+            elif field == 'forSciNum':
+                answer[field].update(chunk)
+            elif field == 'data':
+                answer[field] = [answer[field][0] + chunk[0], answer[field][1] + chunk[1]]
+            else:
+                answer[field] = chunk
+        self.assertEqual(answer, expected)
+        self.assertEqual(counts['tableString'], 5)
+        self.assertEqual(counts['forSciNum'], 5)
+        self.assertEqual(counts['data'], 5)
+        self.assertEqual(counts['name'], 1)
+
+    def test_iter_response_only_requested_fields(self):
+        table = DiceTable.new().add_die(Die(4))
+        self.assertEqual(list(iter_response(table, ['stddev', 'range'])), [('stddev', 1.118), ('range', (1, 4))])
+
+    def test_iter_response_is_lazy(self):
+        table = DiceTable.new().add_die(Die(6), 100)
+        chunks = iter_response(table, ['tableString'], rows_per_chunk=10)
+        first_rows = make_dict(table, ['tableString'])['tableString'].splitlines(True)[:10]
+        self.assertEqual(next(chunks), ('tableString', ''.join(first_rows)))
+
+    def test_iter_response_bad_values_raise_value_error(self):
+        self.assertRaises(ValueError, list, iter_response(DiceTable.new(), ['nope']))
+        self.assertRaises(ValueError, list, iter_response(DiceTable.new(), rows_per_chunk=0))
+
+    def test_get_response_fields(self):
+        answer = self.handler.get_response('Die(6)', fields=['range', 'mean'])
+        self.assertEqual(answer, {'range': (1, 6), 'mean': 3.5})
+
+    def test_make_dict_max_points_downsamples_data(self):
+        table = DiceTable.new().add_die(Die(6), 100)
+        answer = make_dict(table, ['data', 'binaryData'], max_points=50)
+        self.assertLessEqual(len(answer['data'][0]), 50)
+        self.assertEqual(max(answer['data'][1]), max(make_dict(table, ['data'])['data'][1]))
+        self.assertEqual(decode_axes(answer['binaryData']), answer['data'])
+
+    def test_make_dict_max_points_is_cached(self):
+        DOWNSAMPLED_AXES.clear()
+        record = DiceRecord.new().add_die(Die(6), 100)
+        table = ModifiedTable(DiceTable.new().add_die(Die(6), 100), 0, record)
+        first = make_dict(table, ['data'], max_points=50)['data']
+        same_table = ModifiedTable(DiceTable.new().add_die(Die(6), 100), 0, record)
+        self.assertEqual(make_dict(same_table, ['data'], max_points=50)['data'], first)
+        self.assertEqual(len(DOWNSAMPLED_AXES), 1)
+        self.assertNotEqual(make_dict(table, ['data'], max_points=40)['data'], first)
+        self.assertEqual(len(DOWNSAMPLED_AXES), 2)
+
+    def test_make_dict_max_points_cache_returns_copies(self):
+        DOWNSAMPLED_AXES.clear()
+        table = ModifiedTable(DiceTable.new().add_die(Die(6), 100), 0, DiceRecord.new().add_die(Die(6), 100))
+        first = make_dict(table, ['data'], max_points=50)['data']
+        expected = list(first)
+        first.append('junk')
+        self.assertEqual(make_dict(table, ['data'], max_points=50)['data'], expected)
+
+    def test_make_dict_max_points_is_not_cached_for_plain_tables(self):
+        DOWNSAMPLED_AXES.clear()
+        first_table = DiceTable({1: 1, 2: 5, 3: 1}, DiceRecord.new())
+        second_table = DiceTable({10: 1, 20: 5, 30: 1}, DiceRecord.new())
+        self.assertEqual(make_dict(first_table, ['data'], max_points=2)['data'], downsample_axes(first_table, 2))
+        self.assertEqual(make_dict(second_table, ['data'], max_points=2)['data'], downsample_axes(second_table, 2))
+        self.assertEqual(len(DOWNSAMPLED_AXES), 0)
+
+    def test_iter_response_max_points(self):
+        table = DiceTable.new().add_die(Die(6), 100)
+        chunks = [chunk for _, chunk in iter_response(table, ['data'], rows_per_chunk=20, max_points=50)]
+        self.assertEqual(len(chunks), 3)
+        x_values = sum((tuple(chunk[0]) for chunk in chunks), ())
+        self.assertEqual(x_values, make_dict(table, ['data'], max_points=50)['data'][0])
+
+    def test_get_response_max_points(self):
+        answer = self.handler.get_response('Die(6)', fields=['data'], max_points=4)
+        self.assertEqual(answer['data'], [(1, 4), (100 / 6, 100 / 6)])
+
+    def test_make_dict_with_moments(self):
+        table = DiceTable.new().add_die(Die(6), 10).add_die(ModDie(4, -1), 3)
+        moments = Moments.from_dice_list(table.get_list())
+        self.assertEqual(make_dict(table, moments=moments), make_dict(table))
+
+    def test_make_dict_mean_and_stddev_come_from_moments(self):
+        table = DiceTable.new().add_die(Die(6))
+        answer = make_dict(table, ['mean', 'stddev'], moments=Moments(1, 4))
+        self.assertEqual(answer, {'mean': 1.0, 'stddev': 2.0})
+
+    def test_get_responses_matches_get_response(self):
+        instructions = ['3*Die(6)', '10*Die(6)&12*Die(3)', 'ModDie(4, 2)&Modifier(3)', '12*Die(3)&10*Die(6)',
+                        '40*Die(6)']
+        expected = [RequestHandler.using_SQL(':memory:', 'other').get_response(input_str)
+                    for input_str in instructions]
+        self.assertEqual(self.handler.get_responses(instructions), expected)
+
+    def test_get_responses_errors_are_in_place(self):
+        answer = self.handler.get_responses(['Die(6)', 'Die(-1)', '', 'nope'])
+        self.assertEqual(answer[0], make_dict(DiceTable.new().add_die(Die(6))))
+        self.assertEqual(answer[1], self.handler.get_response('Die(-1)'))
+        self.assertEqual(answer[2], self.handler.get_response(''))
+        self.assertEqual(answer[3], self.handler.get_response('nope'))
+
+    def test_get_responses_empty_list(self):
+        self.assertEqual(self.handler.get_responses([]), [])
+
+    def test_get_responses_only_errors(self):
+        self.assertEqual(self.handler.get_responses(['nope']), [self.handler.get_response('nope')])
+
+    def test_get_responses_duplicates_are_separate_dicts(self):
+        first, second = self.handler.get_responses(['2*Die(6)', '2*die(6)'])
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+    def test_get_responses_fields(self):
+        answer = self.handler.get_responses(['Die(6)', 'Die(4)'], fields=['range'])
+        self.assertEqual(answer, [{'range': (1, 6)}, {'range': (1, 4)}])
+        answer = self.handler.get_responses(['Die(6)', 'nope', 'Die(4)'], ['nope'])
+        expected = [self.handler.get_response('Die(6)', fields=['nope']), self.handler.get_response('nope'),
+                    self.handler.get_response('Die(4)', fields=['nope'])]
+        self.assertEqual(answer, expected)
+        self.assertEqual(answer[0]['type'], 'ValueError')
+
+    def test_get_responses_bad_max_points_is_in_place(self):
+        for workers in (1, 2):
+            answer = self.handler.get_responses(['2*Die(6)', 'nope'], max_points=1, workers=workers)
+            expected = [self.handler.get_response('2*Die(6)', max_points=1), self.handler.get_response('nope')]
+            self.assertEqual(answer, expected)
+            self.assertEqual(answer[0]['type'], 'ValueError')
+
+    def test_get_responses_closed_form_does_not_use_database(self):
+        handler = RequestHandler.using_SQL(':memory:', 'test', closed_form=True)
+        answer = handler.get_responses(['60*Die(6)', '40*Die(4)&Modifier(3)'])
+        self.assertEqual(answer, [handler.get_response('60*Die(6)'), handler.get_response('40*Die(4)&Modifier(3)')])
+        self.assertEqual(list(handler._conn.find()), [])
+        handler.close_connection()
+
+    def test_get_responses_get_table_is_last_input(self):
+        self.handler.get_responses(['Die(4)', 'Die(6)', 'Die(4)'])
+        self.assertEqual(self.handler.get_table(), DiceTable.new().add_die(Die(4)))
+        self.handler.get_responses(['Die(6)', 'Die(4)', 'Die(6)', 'nope'])
+        self.assertEqual(self.handler.get_table(), DiceTable.new().add_die(Die(6)))
+
+    def test_get_responses_saves_intermediates_once(self):
+        self.handler.get_responses(['{}*Die(6)'.format(number) for number in range(1, 21)] * 2)
+        self.assertEqual(sorted(document['Die(6)'] for document in self.handler._conn.find()), [5, 10, 15, 20])
+
+    def test_get_responses_with_workers(self):
+        instructions = ['{}*Die(6)'.format(number) for number in (5, 1, 12)]
+        expected = self.handler.get_responses(instructions)
+        self.assertEqual(self.handler.get_responses(instructions, workers=2), expected)
+
+    def test_parse_cache_skips_parser_for_repeated_instructions(self):
+        calls = []
+        original = self.handler._parser.parse_die_within_limits
+
+        def parse_die_within_limits(die_str):
+            calls.append(die_str)
+            return original(die_str)
+
+        self.handler._parser.parse_die_within_limits = parse_die_within_limits
+        self.handler.request_dice_table_construction('2*Die(6)&Die(4)')
+        self.handler.request_dice_table_construction('  2*DIE(6)&die(4) ')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.handler.get_table(), DiceTable.new().add_die(Die(6), 2).add_die(Die(4)))
+
+    def test_parse_cache_key_includes_delimiters(self):
+        self.handler.request_dice_table_construction('2$Die(6)', num_delimiter='$')
+        self.assertEqual(self.handler.get_table(), DiceTable.new().add_die(Die(6), 2))
+        self.assertRaises(SyntaxError, self.handler.request_dice_table_construction, '2$Die(6)')
+
+    def test_parse_cache_is_bounded(self):
+        handler = RequestHandler(SQLConnection(':memory:', 'test'), parse_cache_size=2)
+        for number in range(1, 5):
+            handler.request_dice_table_construction('{}*Die(2)'.format(number))
+        self.assertEqual(len(handler._parsed), 2)
+
+    def test_parse_cache_does_not_keep_errors(self):
+        handler = RequestHandler(SQLConnection(':memory:', 'test'), max_dice_value=12)
+        self.assertRaises(ValueError, handler.request_dice_table_construction, '3*Die(6)')
+        self.assertRaises(ValueError, handler.request_dice_table_construction, '3*Die(6)')
+        self.assertEqual(len(handler._parsed), 0)
+
+    def test_get_response_key_is_canonical(self):
+        first = DiceRecord({Die(6): 2, Modifier(3): 1})
+        same = DiceRecord({Modifier(3): 1, Die(6): 2})
+        self.assertEqual(get_response_key(first), get_response_key(same))
+        self.assertEqual(get_response_key(first), get_response_key(first, RESPONSE_FIELDS))
+        self.assertNotEqual(get_response_key(first), get_response_key(DiceRecord({Die(6): 2, Modifier(2): 1})))
+        self.assertNotEqual(get_response_key(first), get_response_key(first, ['mean']))
+        self.assertNotEqual(get_response_key(first), get_response_key(first, max_points=10))
+
+    def test_get_response_with_response_cache(self):
+        cache = ResponseCache()
+        handler = RequestHandler(SQLConnection(':memory:', 'test'), response_cache=cache)
+        first = handler.get_response('10*Die(6)&ModDie(4, 2)')
+        calls = []
+        handler._get_task_manager().process_request = lambda *args, **kwargs: calls.append(args)
+        second = handler.get_response(' moddie(4, 2)&10*DIE(6)')
+        self.assertEqual(first, second)
+        self.assertEqual(first, make_dict(DiceTable.new().add_die(Die(6), 10).add_die(ModDie(4, 2))))
+        self.assertEqual(calls, [])
+        self.assertEqual(cache.get_stats()['hits'], 1)
+
+    def test_get_response_with_response_cache_returns_copies(self):
+        handler = RequestHandler(SQLConnection(':memory:', 'test'), response_cache=ResponseCache())
+        handler.get_response('Die(6)')['mean'] = 'oops'
+        self.assertEqual(handler.get_response('Die(6)')['mean'], 3.5)
+
+    def test_get_response_with_response_cache_nested_values_are_copies(self):
+        handler = RequestHandler(SQLConnection(':memory:', 'test'), response_cache=ResponseCache())
+        handler.get_response('Die(6)')['data'][0] = 'oops'
+        expected = RequestHandler.using_SQL(':memory:', 'other').get_response('Die(6)')
+        for _ in range(2):
+            answer = handler.get_response('Die(6)')
+            self.assertEqual(answer, expected)
+            answer['data'][0] = 'oops'
+            answer['forSciNum'].clear()
+            [answer] = handler.get_responses(['Die(6)'])
+            self.assertEqual(answer, expected)
+            answer['forSciNum'].clear()
+
+    def test_get_response_with_response_cache_queue_gets_stop(self):
+        handler = RequestHandler(SQLConnection(':memory:', 'test'), response_cache=ResponseCache())
+        handler.get_response('Die(6)')
+        queue = Queue()
+        handler.get_response('Die(6)', queue)
+        self.assertEqual(queue.get(), 'STOP')
+        self.assertTrue(queue.empty())
+
+    def test_get_response_with_response_cache_does_not_keep_errors(self):
+        cache = ResponseCache()
+        handler = RequestHandler(SQLConnection(':memory:', 'test'), response_cache=cache)
+        handler.get_response('Die(6)', fields=['nope'])
+        self.assertEqual(cache.get_stats()['memory_size'], 0)
+
+    def test_get_responses_with_response_cache(self):
+        cache = ResponseCache()
+        handler = RequestHandler(SQLConnection(':memory:', 'test'), response_cache=cache)
+        handler.get_response('2*Die(6)')
+        answer = handler.get_responses(['2*Die(6)', '3*Die(6)', '3*Die(6)'])
+        self.assertEqual(answer, [make_dict(DiceTable.new().add_die(Die(6), number)) for number in (2, 3, 3)])
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'disk_hits': 0, 'misses': 3, 'memory_size': 2})
+
+    def test_make_dict_modified_table_matches_dice_table(self):
+        raw = DiceTable.new().add_die(Die(6), 5).add_die(WeightedDie({1: 1, 3: 2}), 3)
+        for modifier in (-40, -3, 0, 7, 1000):
+            record = raw.dice_data().add_die(Modifier(modifier), 1)
+            view = ModifiedTable(raw, modifier, record)
+            expected = make_dict(view.to_dice_table())
+            self.assertEqual(make_dict(ModifiedTable(raw, modifier, record)), expected)
+            self.assertEqual(make_dict(ModifiedTable(raw, modifier, record), RESPONSE_FIELDS + ('binaryData',),
+                                       moments=Moments.from_dice_list(record.get_dict().items())),
+                             make_dict(view.to_dice_table(), RESPONSE_FIELDS + ('binaryData',)))
+
+    def test_make_dict_modified_table_does_not_build_moved_events(self):
+        raw = DiceTable.new().add_die(Die(6), 5)
+        view = ModifiedTable(raw, 3, raw.dice_data().add_die(Modifier(3), 1))
+        make_dict(view, RESPONSE_FIELDS + ('binaryData',), max_points=10)
+        self.assertIsNone(view._dice_table)
+
+    def test_make_dict_modified_table_max_points(self):
+        raw = DiceTable.new().add_die(Die(6), 50)
+        record = raw.dice_data().add_die(Modifier(-7), 1)
+        answer = make_dict(ModifiedTable(raw, -7, record), ['data'], max_points=20)
+        self.assertEqual(answer, make_dict(ModifiedTable(raw, -7, record).to_dice_table(), ['data'], max_points=20))
+
+    def test_iter_response_modified_table(self):
+        raw = DiceTable.new().add_die(Die(6), 5)
+        view = ModifiedTable(raw, -20, raw.dice_data().add_die(Modifier(-20), 1))
+        table_string = ''.join(chunk for _, chunk in iter_response(view, ['tableString'], rows_per_chunk=7))
+        self.assertEqual(table_string, make_dict(view.to_dice_table(), ['tableString'])['tableString'])
+
+    def test_get_table_after_modified_request(self):
+        self.handler.request_dice_table_construction('3*ModDie(6, 2)&Modifier(-1)')
+        expected = DiceTable.new().add_die(ModDie(6, 2), 3).add_die(Modifier(-1))
+        self.assertEqual(self.handler.get_table(), expected)
+        self.assertIsInstance(self.handler.get_table(), DiceTable)
+
     def test_get_response_error_response(self):
         instructions = '2*Die(5) & *Die(4)'
         response = self.handler.get_response(instructions)
@@ -377,7 +727,7 @@ class TestRequestHandler(unittest.TestCase):
     def test_get_response_is_connecting_to_database(self):
         instructions = '10*Die(6)'
         self.handler.get_response(instructions)
-        answer = self.handler._conn.find()
+        answer = list(self.handler._conn.find())
         expected = [
             {'group': 'Die(6)', 'score': 30, 'Die(6)': 5},
             {'group': 'Die(6)', 'score': 60, 'Die(6)': 10}
@@ -396,3 +746,44 @@ class TestRequestHandler(unittest.TestCase):
         expected_queue = ['<DiceTable containing [5D6]>', '<DiceTable containing [10D6]>', 'STOP']
         for element in expected_queue:
             self.assertEqual(q.get(), element)
+
+
+class TestRequestHandlerPassThrough(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, 'tables.db')
+        self.cache = SharedTableCache('dt_handler_test_{}'.format(os.getpid()), max_tables=4)
+
+    def tearDown(self):
+        self.cache.unlink()
+        shutil.rmtree(self.directory)
+
+    def test_using_sql_passes_table_cache(self):
+        handler = RequestHandler.using_SQL(self.db_path, 'test', table_cache=self.cache)
+        handler.get_response('40*Die(6)')
+        self.assertEqual(len(self.cache), 0)
+        handler.get_response('41*Die(6)')
+        self.assertEqual(len(self.cache), 1)
+        handler.close_connection()
+
+    def test_using_sql_passes_closed_form(self):
+        handler = RequestHandler.using_SQL(self.db_path, 'test', closed_form=True)
+        self.assertEqual(handler.get_response('40*Die(6)')['mean'], 140.0)
+        handler.close_connection()
+        connection = SQLConnection(self.db_path, 'test')
+        self.assertTrue(connection.is_collection_empty())
+        connection.close()
+
+    def test_second_handler_process_reads_table_from_shared_cache(self):
+        handler = RequestHandler.using_SQL(self.db_path, 'test', table_cache=self.cache)
+        handler.get_response('40*Die(6)')
+        handler.get_response('41*Die(6)')
+        handler.close_connection()
+
+        results = ProcessQueue()
+        worker = Process(target=get_mean_with_shared_cache, args=(self.db_path, self.cache, '42*Die(6)', results))
+        worker.start()
+        mean, hits = results.get(timeout=30)
+        worker.join()
+        self.assertEqual(mean, 147.0)
+        self.assertGreater(hits, 0)
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from dicetables_db.responsecache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'responses.db')
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.directory)
+
+    def new_cache(self, path=None, max_memory=256):
+        cache = ResponseCache(path, max_memory)
+        self.caches.append(cache)
+        return cache
+
+    def test_memory_only(self):
+        cache = self.new_cache()
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', {'range': (1, 6)})
+        self.assertEqual(cache.get('a'), {'range': (1, 6)})
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'disk_hits': 0, 'misses': 1, 'memory_size': 1})
+
+    def test_get_returns_copies(self):
+        cache = self.new_cache()
+        response = {'data': [(1, 2), (50.0, 50.0)]}
+        cache.put('a', response)
+        response['data'].clear()
+        cache.get('a')['data'].append('junk')
+        self.assertEqual(cache.get('a'), {'data': [(1, 2), (50.0, 50.0)]})
+
+    def test_disk_survives_new_cache(self):
+        cache = self.new_cache(self.path)
+        cache.put('a', {'range': (1, 6), 'binaryData': b'\x00'})
+        cache.close()
+
+        new_cache = self.new_cache(self.path)
+        self.assertEqual(new_cache.get('a'), {'range': (1, 6), 'binaryData': b'\x00'})
+        self.assertEqual(new_cache.get_stats()['disk_hits'], 1)
+        new_cache.get('a')
+        self.assertEqual(new_cache.get_stats(), {'hits': 2, 'disk_hits': 1, 'misses': 0, 'memory_size': 1})
+
+    def test_disk_keeps_entries_dropped_from_memory(self):
+        cache = self.new_cache(self.path, max_memory=1)
+        cache.put('a', {'mean': 1.0})
+        cache.put('b', {'mean': 2.0})
+        self.assertEqual(cache.get('a'), {'mean': 1.0})
+        self.assertEqual(cache.get_stats()['disk_hits'], 1)
+
+    def test_put_replaces(self):
+        cache = self.new_cache(self.path)
+        cache.put('a', {'mean': 1.0})
+        cache.put('a', {'mean': 2.0})
+        cache.close()
+        self.assertEqual(self.new_cache(self.path).get('a'), {'mean': 2.0})
+
+    def test_clear(self):
+        cache = self.new_cache(self.path)
+        cache.put('a', {'mean': 1.0})
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        cache.close()
+        self.assertIsNone(self.new_cache(self.path).get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
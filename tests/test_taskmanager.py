@@ -86,7 +86,7 @@ class TestTaskManager(unittest.TestCase):
         self.task_manager.save_table_list([empty, non_empty])
 
         self.assertTrue(self.insert_retrieve.has_table(non_empty))
-        all_docs = self.connection.find()
+        all_docs = list(self.connection.find())
         self.assertTrue(len(all_docs), 1)  # has_table(empty) never actually checks database.
 
     def test_save_table_list_does_not_save_same_table_twice(self):
@@ -96,7 +96,7 @@ class TestTaskManager(unittest.TestCase):
         self.assertTrue(self.insert_retrieve.has_table(table))
         self.assertTrue(self.insert_retrieve.has_table(same_table))
 
-        all_docs = self.connection.find()
+        all_docs = list(self.connection.find())
         self.assertEqual(len(all_docs), 1)
 
     def test_save_table_list_saves_all_the_tables(self):
@@ -105,10 +105,17 @@ class TestTaskManager(unittest.TestCase):
             to_save.append(DiceTable.new().add_die(Die(2), dice_num))
 
         self.task_manager.save_table_list(to_save)
-        self.assertEqual(len(self.connection.find()), len(to_save))
+        self.assertEqual(len(list(self.connection.find())), len(to_save))
         for table in to_save:
             self.assertTrue(self.insert_retrieve.has_table(table))
 
+    def test_save_table_list_skips_tables_already_in_database(self):
+        saved = DiceTable.new().add_die(Die(2), 2)
+        self.insert_retrieve.add_table(saved)
+        to_save = [DiceTable.new().add_die(Die(2), dice_num) for dice_num in range(1, 4)]
+        self.task_manager.save_table_list(to_save)
+        self.assertEqual(len(list(self.connection.find())), 3)
+
     def test_process_request_empty_record(self):
         q = Queue()
         request = DiceRecord.new()
@@ -122,7 +129,7 @@ class TestTaskManager(unittest.TestCase):
         expected = DiceTable.new().add_die(Die(5), 2).add_die(Die(3), 2)
 
         self.assertEqual(answer, expected)
-        self.assertEqual(self.connection.find(), [])
+        self.assertEqual(list(self.connection.find()), [])
 
     def test_process_request_returns_correct_table_partly_too_small_to_save(self):
         request = DiceRecord({Die(5): 2, Die(3): 50})
@@ -152,7 +159,7 @@ class TestTaskManager(unittest.TestCase):
 
         for table in saved:
             self.assertTrue(self.insert_retrieve.has_table(table))
-        self.assertEqual(len(self.connection.find()), 4)
+        self.assertEqual(len(list(self.connection.find())), 4)
 
         self.assertEqual(answer, saved[-1])
 
@@ -188,7 +195,7 @@ class TestTaskManager(unittest.TestCase):
 
         for table in saved:
             self.assertTrue(self.insert_retrieve.has_table(table))
-        self.assertEqual(len(self.connection.find()), 4)
+        self.assertEqual(len(list(self.connection.find())), 4)
 
     def test_process_request_regression_test_check_times(self):
         big_request_one = DiceRecord({Die(6): 500})
@@ -198,13 +205,13 @@ class TestTaskManager(unittest.TestCase):
         self.task_manager.process_request(big_request_one)
         first_request_time = clock() - start
 
-        number_of_saved_tables = len(self.connection.find())
+        number_of_saved_tables = len(list(self.connection.find()))
 
         start = clock()
         self.task_manager.process_request(big_request_two)
         second_request_time = clock() - start
 
-        self.assertEqual(len(self.connection.find()), number_of_saved_tables)
+        self.assertEqual(len(list(self.connection.find())), number_of_saved_tables)
 
         self.assertTrue(first_request_time > 10 * second_request_time)
 
@@ -228,7 +235,7 @@ class TestTaskManager(unittest.TestCase):
         answer = self.task_manager.process_request(request)
 
         self.assertEqual(expected, answer)
-        self.assertEqual(self.connection.find(), [])
+        self.assertEqual(list(self.connection.find()), [])
 
     def test_process_request_with_queue_no_tables_saved(self):
         q = Queue()
@@ -308,12 +315,12 @@ class TestTaskManager(unittest.TestCase):
         initial_queue = Queue()
         initial_answer = one_step.process_request(request, initial_queue)
 
-        initial_db_size = len(self.connection.find())
+        initial_db_size = len(list(self.connection.find()))
 
         second_queue = Queue()
         second_answer = one_step.process_request(request, second_queue)
 
-        second_db_size = len(self.connection.find())
+        second_db_size = len(list(self.connection.find()))
 
         self.assertEqual(expected, initial_answer, second_answer)
         self.assertEqual(initial_db_size, second_db_size, 70)
@@ -321,6 +328,116 @@ class TestTaskManager(unittest.TestCase):
         self.assertEqual(initial_queue.qsize(), 71)
         self.assertEqual(second_queue.qsize(), 1)
 
+    def test_init_closed_form_is_off(self):
+        self.task_manager.process_request(DiceRecord({Die(6): 60}))
+        self.assertEqual(len(list(self.connection.find())), 12)
+
+    def test_process_request_closed_form_single_die(self):
+        manager = TaskManager(self.insert_retrieve, closed_form=True)
+        queue = Queue()
+        answer = manager.process_request(DiceRecord({Die(6): 60}), queue)
+        self.assertEqual(answer, DiceTable.new().add_die(Die(6), 60))
+        self.assertEqual(list(self.connection.find()), [])
+        self.assertEqual(queue.get(), 'STOP')
+        self.assertTrue(queue.empty())
+
+    def test_process_request_closed_form_with_modifiers(self):
+        manager = TaskManager(self.insert_retrieve, closed_form=True)
+        mod_weighted = ModWeightedDie({1: 2, 3: 4}, -2)
+        request = DiceRecord({Modifier(10): 2, mod_weighted: 30})
+        answer = manager.process_request(request)
+        self.assertEqual(answer, DiceTable.new().add_die(Modifier(10), 2).add_die(mod_weighted, 30))
+        self.assertEqual(list(self.connection.find()), [])
+
+    def test_process_request_closed_form_only_modifier(self):
+        manager = TaskManager(self.insert_retrieve, closed_form=True)
+        answer = manager.process_request(DiceRecord({Modifier(3): 2}))
+        self.assertEqual(answer, DiceTable.new().add_die(Modifier(3), 2))
+
+    def test_process_request_closed_form_several_die_types_uses_database(self):
+        manager = TaskManager(self.insert_retrieve, closed_form=True)
+        request = DiceRecord({Die(6): 30, Die(4): 3})
+        answer = manager.process_request(request)
+        self.assertEqual(answer, DiceTable.new().add_die(Die(6), 30).add_die(Die(4), 3))
+        self.assertEqual(len(list(self.connection.find())), 6)
+
+    def test_process_requests_closed_form(self):
+        manager = TaskManager(self.insert_retrieve, closed_form=True)
+        records = [DiceRecord({Die(6): 60}), DiceRecord({Die(6): 10, Modifier(2): 1}),
+                   DiceRecord({Die(6): 30, Die(4): 3})]
+        answers = manager.process_requests(records)
+        self.assertEqual(answers, [TaskManager(self.insert_retrieve).process_request(record) for record in records])
+        self.assertIs(answers[0], manager.get_closed_form_table(Die(6), 60))
+
+    def test_process_requests_closed_form_single_die_does_not_use_database(self):
+        manager = TaskManager(self.insert_retrieve, closed_form=True)
+        manager.process_requests([DiceRecord({Die(6): 60}), DiceRecord({Die(4): 90})])
+        self.assertEqual(list(self.connection.find()), [])
+
+    def test_get_closed_form_table_is_cached(self):
+        manager = TaskManager(self.insert_retrieve, closed_form=True)
+        table = manager.get_closed_form_table(Die(6), 10)
+        self.assertEqual(table, DiceTable.new().add_die(Die(6), 10))
+        self.assertIs(manager.get_closed_form_table(Die(6), 10), table)
+
+    def test_process_requests_returns_answers_in_order(self):
+        records = [DiceRecord({Die(6): 40}), DiceRecord({Die(6): 10, Modifier(2): 1}), DiceRecord({Die(6): 40})]
+        answers = self.task_manager.process_requests(records)
+        expected = [self.task_manager.process_request(record) for record in records]
+        self.assertEqual(answers, expected)
+        self.assertEqual([answer.get_list() for answer in answers],
+                         [sorted(record.get_dict().items()) for record in records])
+
+    def test_process_requests_empty_and_modifier_only(self):
+        answers = self.task_manager.process_requests([DiceRecord.new(), DiceRecord({Modifier(3): 1})])
+        self.assertEqual(answers, [DiceTable.new(), DiceTable.new().add_die(Modifier(3))])
+        self.assertEqual(list(self.connection.find()), [])
+
+    def test_process_requests_saves_each_intermediate_once(self):
+        records = [DiceRecord({Die(6): number}) for number in range(1, 41)]
+        self.task_manager.process_requests(records + records)
+        saved = sorted(document['Die(6)'] for document in self.connection.find())
+        self.assertEqual(saved, [5, 10, 15, 20, 25, 30, 35, 40])
+
+    def test_process_requests_smaller_tables_feed_larger(self):
+        searches = []
+        original_find_nearest_table = self.insert_retrieve.find_nearest_table
+
+        def find_nearest_table(dice_list):
+            searches.append(dice_list)
+            return original_find_nearest_table(dice_list)
+
+        self.insert_retrieve.find_nearest_table = find_nearest_table
+        records = [DiceRecord({Die(6): number}) for number in range(1, 41)]
+        answers = self.task_manager.process_requests(records)
+        self.assertEqual(answers[-1], DiceTable.new().add_die(Die(6), 40))
+        self.assertEqual(len(searches), 12)
+
+        self.insert_retrieve.reset()
+        searches.clear()
+        for record in records:
+            self.task_manager.process_request(record)
+        self.assertEqual(len(searches), 40)
+
+    def test_process_requests_uses_larger_table_from_database(self):
+        self.task_manager.process_request(DiceRecord({Die(6): 40}))
+        tables = self.task_manager.process_requests([DiceRecord({Die(6): 3}), DiceRecord({Die(6): 42})])
+        self.assertEqual(tables[1], DiceTable.new().add_die(Die(6), 42))
+        self.assertEqual(len(list(self.connection.find())), 8)
+
+    def test_process_request_lazy_modifier(self):
+        request = DiceRecord({ModDie(6, 2): 12, Modifier(-3): 1})
+        answer = self.task_manager.process_request(request, lazy_modifier=True)
+        self.assertEqual(answer.modifier, 21)
+        self.assertEqual(answer.table, DiceTable.new().add_die(Die(6), 12))
+        self.assertEqual(answer.to_dice_table(), self.task_manager.process_request(request))
+
+    def test_process_requests_lazy_modifier(self):
+        records = [DiceRecord({ModDie(6, 2): 12}), DiceRecord({Die(4): 3})]
+        answers = self.task_manager.process_requests(records, lazy_modifier=True)
+        self.assertEqual([answer.to_dice_table() for answer in answers], self.task_manager.process_requests(records))
+        self.assertEqual([answer.modifier for answer in answers], [24, 0])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from dicetables import DiceTable, Die, WeightedDie
+
+from dicetables_db.connections.sql_connection import SQLConnection
+from dicetables_db.insertandretrieve import DiceTableInsertionAndRetrieval
+from dicetables_db.warmup import WarmUp, get_ladder, build_ladder, main
+
+
+class TestWarmUp(unittest.TestCase):
+    def setUp(self):
+        self.connection = SQLConnection(':memory:', 'test')
+        self.insert_retrieve = DiceTableInsertionAndRetrieval(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_get_ladder(self):
+        self.assertEqual(get_ladder(1, 20), [1, 2, 4, 8, 16, 20])
+        self.assertEqual(get_ladder(5, 5), [5])
+        self.assertEqual(get_ladder(1, 10, 1.5), [1, 2, 3, 4, 6, 9, 10])
+
+    def test_get_ladder_bad_values(self):
+        self.assertRaises(ValueError, get_ladder, 0, 10)
+        self.assertRaises(ValueError, get_ladder, 10, 5)
+
+    def test_init_bad_ratio(self):
+        self.assertRaises(ValueError, WarmUp, self.insert_retrieve, ratio=1)
+
+    def test_build_ladder(self):
+        tables = build_ladder(Die(6), [2, 4, 10], DiceTable.new(), 30)
+        expected = [DiceTable.new().add_die(Die(6), number) for number in (2, 4, 9, 10)]
+        self.assertEqual(tables, expected)
+
+    def test_build_ladder_from_initial_table(self):
+        initial = DiceTable.new().add_die(Die(6), 3)
+        tables = build_ladder(Die(6), [4], initial, 30)
+        self.assertEqual(tables, [DiceTable.new().add_die(Die(6), 4)])
+
+    def test_run_saves_every_rung(self):
+        warm_up = WarmUp(self.insert_retrieve)
+        total = warm_up.run([(Die(6), 1, 12), (WeightedDie({1: 2, 2: 3}), 3, 3)])
+        for number in (1, 2, 4, 8, 12):
+            self.assertTrue(self.insert_retrieve.has_dice_list([(Die(6), number)]))
+        self.assertTrue(self.insert_retrieve.has_dice_list([(WeightedDie({1: 2, 2: 3}), 3)]))
+        self.assertEqual(total, 6)
+        self.assertEqual(len(list(self.connection.find())), 6)
+
+    def test_run_is_resumable(self):
+        warm_up = WarmUp(self.insert_retrieve)
+        warm_up.run([(Die(6), 1, 4)])
+        self.assertEqual(warm_up.get_missing_counts(Die(6), 1, 16), [8, 16])
+
+        progress = []
+        warm_up.run([(Die(6), 1, 16)], progress=lambda die, built: progress.append((die, built)))
+        self.assertEqual(progress, [(Die(6), 3)])
+        self.assertEqual(warm_up.get_missing_counts(Die(6), 1, 16), [])
+
+    def test_run_nothing_missing(self):
+        warm_up = WarmUp(self.insert_retrieve)
+        warm_up.run([(Die(6), 1, 4)])
+        self.assertEqual(warm_up.run([(Die(6), 1, 4)]), 0)
+
+    def test_run_with_worker_processes(self):
+        warm_up = WarmUp(self.insert_retrieve, workers=2)
+        warm_up.run([(Die(6), 1, 8), (Die(4), 1, 8)])
+        for die in (Die(6), Die(4)):
+            self.assertEqual(warm_up.get_missing_counts(die, 1, 8), [])
+
+
+class TestWarmUpMain(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, 'warm.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_main_with_sql(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            main(['Die(6)', 'die(4)', '--stop', '4', '--sql', self.db_path, '--collection', 'tables'])
+        self.assertIn('done. built 6 tables', output.getvalue())
+
+        connection = SQLConnection(self.db_path, 'tables')
+        insert_retrieve = DiceTableInsertionAndRetrieval(connection)
+        self.assertTrue(insert_retrieve.has_dice_list([(Die(6), 4)]))
+        self.assertTrue(insert_retrieve.has_dice_list([(Die(4), 2)]))
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
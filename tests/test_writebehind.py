@@ -0,0 +1,156 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from queue import Full
+from threading import Event
+
+from dicetables import DiceTable, DiceRecord, Die
+
+from dicetables_db.connections.sql_connection import SQLConnection
+from dicetables_db.insertandretrieve import DiceTableInsertionAndRetrieval
+from dicetables_db.requesthandler import RequestHandler
+from dicetables_db.taskmanager import TaskManager
+from dicetables_db.writebehind import WriteBehindSaver
+
+
+class TestWriteBehindSaver(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.db')
+        self.saver = None
+
+    def tearDown(self):
+        if self.saver is not None:
+            self.saver.close()
+        shutil.rmtree(self.directory)
+
+    def new_connection(self):
+        return SQLConnection(self.path, 'test')
+
+    def saved_tables(self):
+        connection = self.new_connection()
+        answer = sorted(document['score'] for document in connection.find({}, {'score': 1}))
+        connection.close()
+        return answer
+
+    def test_submit_and_flush(self):
+        self.saver = WriteBehindSaver(self.new_connection)
+        self.saver.submit([DiceTable.new().add_die(Die(2), number) for number in range(1, 4)])
+        self.saver.flush()
+        self.assertEqual(self.saved_tables(), [2, 4, 6])
+
+    def test_close_saves_queued_lists(self):
+        saver = WriteBehindSaver(self.new_connection)
+        for number in range(1, 6):
+            saver.submit([DiceTable.new().add_die(Die(3), number)])
+        saver.close()
+        self.assertEqual(self.saved_tables(), [3, 6, 9, 12, 15])
+
+    def test_duplicates_are_saved_once(self):
+        self.saver = WriteBehindSaver(self.new_connection)
+        table = DiceTable.new().add_die(Die(2))
+        self.saver.submit([table, DiceTable.new()])
+        self.saver.submit([table])
+        self.saver.flush()
+        self.assertEqual(self.saved_tables(), [2])
+
+    def test_submit_after_close_raises_error(self):
+        saver = WriteBehindSaver(self.new_connection)
+        saver.close()
+        saver.close()
+        self.assertRaises(ValueError, saver.submit, [])
+
+    def test_context_manager_closes(self):
+        with WriteBehindSaver(self.new_connection) as saver:
+            saver.submit([DiceTable.new().add_die(Die(2))])
+        self.assertEqual(self.saved_tables(), [2])
+
+    def test_backpressure_and_metrics(self):
+        release = Event()
+
+        def slow_factory():
+            release.wait()
+            return self.new_connection()
+
+        self.saver = WriteBehindSaver(slow_factory, max_queue=1)
+        self.saver.submit([DiceTable.new().add_die(Die(2))])
+        self.assertRaises(Full, self.saver.submit, [DiceTable.new().add_die(Die(3))], timeout=0.01)
+
+        metrics = self.saver.get_metrics()
+        self.assertEqual((metrics['queue_depth'], metrics['submitted'], metrics['saved']), (1, 1, 0))
+        self.assertGreater(metrics['lag'], 0.0)
+
+        release.set()
+        self.saver.flush()
+        metrics = self.saver.get_metrics()
+        self.assertEqual((metrics['queue_depth'], metrics['lag'], metrics['saved'], metrics['errors']), (0, 0.0, 1, 0))
+        self.assertEqual(metrics['batches'], 1)
+
+    def test_errors_are_counted_and_thread_keeps_running(self):
+        self.saver = WriteBehindSaver(self.new_connection)
+        self.saver.submit(['not a table'])
+        self.saver.flush()
+        self.saver.submit([DiceTable.new().add_die(Die(2))])
+        self.saver.flush()
+        metrics = self.saver.get_metrics()
+        self.assertEqual((metrics['errors'], metrics['saved']), (1, 1))
+        self.assertIsInstance(metrics['last_error'], AttributeError)
+        self.assertEqual(self.saved_tables(), [2])
+
+    def test_failed_connection_is_reported_and_does_not_block(self):
+        release = Event()
+
+        def failing_factory():
+            release.wait()
+            raise ValueError('no database')
+
+        self.saver = WriteBehindSaver(failing_factory, max_queue=1)
+        self.saver.submit([DiceTable.new().add_die(Die(2))])
+        release.set()
+        self.assertRaises(RuntimeError, self.saver.flush)
+        self.assertRaises(RuntimeError, self.saver.submit, [DiceTable.new().add_die(Die(3))])
+        self.assertRaises(RuntimeError, self.saver.submit, [DiceTable.new().add_die(Die(4))])
+
+        metrics = self.saver.get_metrics()
+        self.assertEqual((metrics['queue_depth'], metrics['lag'], metrics['saved'], metrics['errors']), (0, 0.0, 0, 1))
+        self.assertIsInstance(metrics['last_error'], ValueError)
+
+    def test_handler_finds_tables_saved_by_saver(self):
+        connection = self.new_connection()
+        self.saver = WriteBehindSaver(self.new_connection)
+        handler = RequestHandler(connection, saver=self.saver)
+        handler.get_response('200*Die(6)')
+        self.saver.flush()
+        doc_id = DiceTableInsertionAndRetrieval(connection).find_nearest_table([(Die(6), 210)])
+        self.assertIsNotNone(doc_id)
+        self.assertEqual(handler.get_response('210*Die(6)')['range'], (210, 1260))
+        handler.close_connection()
+
+    def test_queued_lists_are_saved_at_exit(self):
+        code = ('from dicetables import DiceTable, Die; '
+                'from dicetables_db.connections.sql_connection import SQLConnection; '
+                'from dicetables_db.writebehind import WriteBehindSaver; '
+                'saver = WriteBehindSaver(lambda: SQLConnection({!r}, "test")); '
+                'saver.submit([DiceTable.new().add_die(Die(2), number) for number in range(1, 4)])').format(self.path)
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.check_call([sys.executable, '-c', code], cwd=repo_root)
+        self.assertEqual(self.saved_tables(), [2, 4, 6])
+
+    def test_task_manager_with_saver(self):
+        self.saver = WriteBehindSaver(self.new_connection)
+        connection = self.new_connection()
+        task_manager = TaskManager(DiceTableInsertionAndRetrieval(connection), saver=self.saver)
+        connection.commit()
+
+        answer = task_manager.process_request(DiceRecord({Die(6): 10}))
+        self.assertEqual(answer, DiceTable.new().add_die(Die(6), 10))
+        self.saver.flush()
+        connection.close()
+        self.assertEqual(self.saved_tables(), [30, 60])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from io import BytesIO
+
+from dicetables import DiceTable, Die
+
+from dicetables_db.connections.sql_connection import SQLConnection
+from dicetables_db.insertandretrieve import DiceTableInsertionAndRetrieval
+from dicetables_db.tools.archive import export_collection, import_collection, MAGIC, CHUNK_HEADER
+from tests.connections.test_baseconnection import MockConnection
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.source = SQLConnection(':memory:', 'source')
+        self.target = SQLConnection(':memory:', 'target')
+        self.tables = [DiceTable.new().add_die(Die(6), number) for number in range(1, 8)]
+        insert_retrieve = DiceTableInsertionAndRetrieval(self.source)
+        for table in self.tables:
+            insert_retrieve.add_table(table)
+
+    def tearDown(self):
+        self.source.close()
+        self.target.close()
+
+    def export(self, chunk_size=3):
+        archive = BytesIO()
+        export_collection(self.source, archive, chunk_size=chunk_size)
+        archive.seek(0)
+        return archive
+
+    def test_export_returns_count(self):
+        self.assertEqual(export_collection(self.source, BytesIO()), 7)
+
+    def test_export_starts_with_magic(self):
+        self.assertTrue(self.export().getvalue().startswith(MAGIC))
+
+    def test_export_progress(self):
+        progress = []
+        export_collection(self.source, BytesIO(), chunk_size=3, progress=progress.append)
+        self.assertEqual(progress, [3, 6, 7])
+
+    def test_round_trip(self):
+        self.assertEqual(import_collection(self.target, self.export()), 7)
+        insert_retrieve = DiceTableInsertionAndRetrieval(self.target)
+        for table in self.tables:
+            self.assertTrue(insert_retrieve.has_table(table))
+            doc_id = insert_retrieve.find_nearest_table(table.get_list())
+            self.assertEqual(insert_retrieve.get_table(doc_id), table)
+
+    def test_round_trip_to_other_backend(self):
+        target = MockConnection('archive_target')
+        target.reset_collection()
+        import_collection(target, self.export())
+        source_documents = sorted((doc['score'], doc['serialized']) for doc in self.source.find())
+        target_documents = sorted((doc['score'], doc['serialized']) for doc in target.find())
+        self.assertEqual(source_documents, target_documents)
+        target.drop_collection()
+
+    def test_import_progress(self):
+        progress = []
+        import_collection(self.target, self.export(), progress=progress.append)
+        self.assertEqual(progress, [3, 6, 7])
+
+    def test_empty_collection_round_trip(self):
+        archive = BytesIO()
+        self.assertEqual(export_collection(self.target, archive), 0)
+        archive.seek(0)
+        self.assertEqual(import_collection(self.source, archive), 0)
+
+    def test_import_bad_magic(self):
+        self.assertRaises(ValueError, import_collection, self.target, BytesIO(b'not an archive'))
+
+    def test_import_corrupt_chunk(self):
+        raw = bytearray(self.export().getvalue())
+        raw[len(MAGIC) + CHUNK_HEADER.size + 10] ^= 0xFF
+        self.assertRaises(ValueError, import_collection, self.target, BytesIO(bytes(raw)))
+
+    def test_import_truncated(self):
+        raw = self.export().getvalue()
+        self.assertRaises(ValueError, import_collection, self.target, BytesIO(raw[:-4]))
+        self.assertRaises(ValueError, import_collection, self.target, BytesIO(raw[:len(raw) // 2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
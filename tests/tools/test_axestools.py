@@ -0,0 +1,79 @@
+import unittest
+
+from dicetables import DiceTable, EventsCalculations, AdditiveEvents, Die
+
+from dicetables_db.tools.axestools import encode_axes, decode_axes, downsample_axes, HEADER
+
+
+class TestAxesTools(unittest.TestCase):
+    def test_encode_decode_round_trip(self):
+        axes = [(-2, -1, 0, 5), (0.5, 1e-300, 99.5, 0.0)]
+        self.assertEqual(decode_axes(encode_axes(axes)), axes)
+
+    def test_encode_decode_empty(self):
+        self.assertEqual(decode_axes(encode_axes([(), ()])), [(), ()])
+        self.assertEqual(decode_axes(encode_axes([])), [(), ()])
+
+    def test_encode_size(self):
+        axes = [tuple(range(100)), tuple(float(x) for x in range(100))]
+        self.assertEqual(len(encode_axes(axes)), HEADER.size + 99 * 4 + 100 * 8)
+        self.assertEqual(len(encode_axes(axes, 'f')), HEADER.size + 99 * 4 + 100 * 4)
+
+    def test_encode_float32_loses_precision(self):
+        x_values, y_values = decode_axes(encode_axes([(1,), (1 / 3,)], 'f'))
+        self.assertEqual(x_values, (1,))
+        self.assertAlmostEqual(y_values[0], 1 / 3, places=6)
+        self.assertNotEqual(y_values[0], 1 / 3)
+
+    def test_encode_bad_values_raise_value_error(self):
+        self.assertRaises(ValueError, encode_axes, [(1, 2), (1.0,)])
+        self.assertRaises(ValueError, encode_axes, [(1,), (1.0,)], 'q')
+
+    def test_encode_not_increasing_x_raises_value_error(self):
+        self.assertRaises(ValueError, encode_axes, [(2, 1), (1.0, 1.0)])
+        self.assertRaises(ValueError, encode_axes, [(1, 1), (1.0, 1.0)])
+
+    def test_decode_bad_data_raises_value_error(self):
+        data = encode_axes([(1, 2), (1.0, 2.0)])
+        self.assertRaises(ValueError, decode_axes, b'')
+        self.assertRaises(ValueError, decode_axes, b'XXXX' + data[4:])
+        self.assertRaises(ValueError, decode_axes, data[:-1])
+
+    def test_downsample_axes_small_range_is_whole(self):
+        table = DiceTable.new().add_die(Die(6), 3)
+        self.assertEqual(downsample_axes(table, 16), EventsCalculations(table).percentage_axes())
+
+    def test_downsample_axes_small_range_includes_zeroes(self):
+        events = AdditiveEvents({1: 1, 4: 3})
+        self.assertEqual(downsample_axes(events, 10), [(1, 2, 3, 4), (25.0, 0.0, 0.0, 75.0)])
+
+    def test_downsample_axes_keeps_min_and_max_of_each_bucket(self):
+        events = AdditiveEvents({1: 1, 2: 5, 3: 2, 4: 2, 5: 1, 6: 9, 7: 4, 8: 1, 9: 3})
+        x_values, y_values = downsample_axes(events, 6)
+        self.assertEqual(x_values, (1, 2, 5, 6, 7, 8))
+        full = dict(zip(*EventsCalculations(events).percentage_axes()))
+        self.assertEqual(y_values, tuple(full[x_value] for x_value in x_values))
+
+    def test_downsample_axes_keeps_zero_gaps(self):
+        events = AdditiveEvents({0: 1, 9: 1})
+        self.assertEqual(downsample_axes(events, 4), [(0, 1, 5, 9), (50.0, 0.0, 0.0, 50.0)])
+
+    def test_downsample_axes_large_table(self):
+        table = DiceTable.new().add_die(Die(6), 500)
+        full = EventsCalculations(table).percentage_axes()
+        x_values, y_values = downsample_axes(table, 200)
+        self.assertLessEqual(len(x_values), 200)
+        self.assertEqual(list(x_values), sorted(x_values))
+        self.assertEqual(max(y_values), max(full[1]))
+        self.assertEqual(x_values[0], full[0][0])
+        self.assertEqual(x_values[-1], full[0][-1])
+        points = dict(zip(*full))
+        for x_value, y_value in zip(x_values, y_values):
+            self.assertEqual(points[x_value], y_value)
+
+    def test_downsample_axes_bad_max_points_raises_value_error(self):
+        self.assertRaises(ValueError, downsample_axes, AdditiveEvents({1: 1}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from dicetables_db.tools.bloomfilter import BloomFilter
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_init_sizes_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        self.assertEqual(bloom.num_bits, 9586)
+        self.assertEqual(bloom.num_hashes, 7)
+        self.assertEqual(len(bloom), 0)
+
+    def test_init_bad_values_raise_error(self):
+        self.assertRaises(ValueError, BloomFilter, 0)
+        self.assertRaises(ValueError, BloomFilter, 10, 0)
+        self.assertRaises(ValueError, BloomFilter, 10, 1)
+
+    def test_add_and_contains(self):
+        bloom = BloomFilter(100)
+        self.assertNotIn('a', bloom)
+        bloom.add('a')
+        self.assertIn('a', bloom)
+        self.assertEqual(len(bloom), 1)
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        keys = ['key_{}'.format(number) for number in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_false_positive_rate_near_error_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for number in range(1000):
+            bloom.add('in_{}'.format(number))
+        false_positives = sum('out_{}'.format(number) in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_clear(self):
+        bloom = BloomFilter(100)
+        bloom.add('a')
+        bloom.clear()
+        self.assertNotIn('a', bloom)
+        self.assertEqual(len(bloom), 0)
+
+    def test_to_bytes_and_from_bytes(self):
+        bloom = BloomFilter(100)
+        bloom.add('a')
+        new = BloomFilter.from_bytes(bloom.to_bytes())
+        self.assertIn('a', new)
+        self.assertNotIn('b', new)
+        self.assertEqual((new.num_bits, new.num_hashes, len(new)), (bloom.num_bits, bloom.num_hashes, 1))
+
+    def test_from_bytes_bad_data_raises_error(self):
+        data = BloomFilter(100).to_bytes()
+        self.assertRaises(ValueError, BloomFilter.from_bytes, b'garbage' + data)
+        self.assertRaises(ValueError, BloomFilter.from_bytes, data[:-1])
+
+    def test_save_and_load(self):
+        bloom = BloomFilter(100)
+        bloom.add('a')
+        file_path = os.path.join(tempfile.mkdtemp(), 'bloom.bin')
+        bloom.save(file_path)
+        self.assertIn('a', BloomFilter.load(file_path))
+        os.remove(file_path)
+        os.rmdir(os.path.dirname(file_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -61,10 +61,31 @@ class TestDBPrep(unittest.TestCase):
         expected = {'group': 'Die(2)&Die(3)',
                     'score': 5,
                     'serialized': Serializer.serialize(table),
+                    'hash': prep.get_hash([('Die(2)', 1), ('Die(3)', 1)]),
+                    'mean': '7/2',
+                    'variance': '11/12',
                     'Die(2)': 1,
                     'Die(3)': 1}
         self.assertEqual(prepped.get_dict(), expected)
 
+    def test_PrepDiceTable_get_moments(self):
+        table = dt.DiceTable.new().add_die(dt.Die(2)).add_die(dt.Die(3))
+        calc = dt.EventsCalculations(table)
+        moments = prep.PrepDiceTable(table).get_moments()
+        self.assertEqual(moments.mean(), calc.mean())
+        self.assertEqual(moments.stddev(), calc.stddev())
+
+    def test_get_hash_ignores_order(self):
+        self.assertEqual(prep.get_hash([('Die(2)', 1), ('Die(3)', 2)]), prep.get_hash([('Die(3)', 2), ('Die(2)', 1)]))
+
+    def test_get_hash_depends_on_numbers(self):
+        self.assertNotEqual(prep.get_hash([('Die(2)', 1), ('Die(3)', 2)]),
+                            prep.get_hash([('Die(2)', 2), ('Die(3)', 1)]))
+
+    def test_PrepDiceTable_get_hash(self):
+        table = dt.DiceTable.new().add_die(dt.Die(3)).add_die(dt.Die(2), 2)
+        self.assertEqual(prep.PrepDiceTable(table).get_hash(), prep.get_hash([('Die(2)', 2), ('Die(3)', 1)]))
+
     def test_SearchParams_init_creates_score(self):
         table_list = [(dt.Die(2), 2), (dt.Die(3), 1)]
         retriever = prep.SearchParams(table_list)
@@ -143,6 +164,33 @@ class TestDBPrep(unittest.TestCase):
                           ('Die(3)', {'Die(3)': 1})]
                          )
 
+    def test_SearchParams_get_bounded_search_params(self):
+        table_list = [(dt.Die(1), 4), (dt.Die(2), 2), (dt.Die(3), 1)]
+        retriever = prep.SearchParams(table_list)
+        expected = [(11, 'Die(1)&Die(2)&Die(3)', {'Die(1)': 4, 'Die(2)': 2, 'Die(3)': 1}),
+                    (8, 'Die(1)&Die(2)', {'Die(1)': 4, 'Die(2)': 2}),
+                    (7, 'Die(1)&Die(3)', {'Die(1)': 4, 'Die(3)': 1}),
+                    (7, 'Die(2)&Die(3)', {'Die(2)': 2, 'Die(3)': 1}),
+                    (4, 'Die(1)', {'Die(1)': 4}),
+                    (4, 'Die(2)', {'Die(2)': 2}),
+                    (3, 'Die(3)', {'Die(3)': 1})]
+        result = list(retriever.get_bounded_search_params())
+        self.assertEqual([element[0] for element in result], [element[0] for element in expected])
+        self.assertEqual(sorted(result), sorted(expected))
+
+    def test_SearchParams_get_bounded_search_params_is_lazy_and_complete(self):
+        table_list = [(dt.Die(size), 1) for size in range(1, 11)]
+        retriever = prep.SearchParams(table_list)
+        searcher = retriever.get_bounded_search_params()
+        self.assertEqual(next(searcher)[0], 55)
+        self.assertEqual(next(searcher), (54, '&'.join(repr(dt.Die(size)) for size in range(2, 11)),
+                                          {repr(dt.Die(size)): 1 for size in range(2, 11)}))
+        rest = list(searcher)
+        self.assertEqual(len(rest), 2 ** 10 - 3)
+        bounds = [element[0] for element in rest]
+        self.assertEqual(bounds, sorted(bounds, reverse=True))
+        self.assertEqual(len({element[1] for element in rest}), len(rest))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -26,6 +26,16 @@ class TestDocumentId(unittest.TestCase):
         expected_equal = DocumentId.from_bson_id(to_test.to_bson_id())
         self.assertEqual(to_test, expected_equal)
 
+    def test_to_bytes(self):
+        to_test = DocumentId.new()
+        self.assertEqual(to_test.to_bytes(), to_test.to_bson_id().binary)
+        self.assertEqual(len(to_test.to_bytes()), 12)
+
+    def test_from_bytes_constructor(self):
+        to_test = DocumentId.new()
+        expected_equal = DocumentId.from_bytes(to_test.to_bytes())
+        self.assertEqual(to_test, expected_equal)
+
     def test__eq__false(self):
         ne_1 = DocumentId.new()
         ne_2 = DocumentId.new()
@@ -0,0 +1,52 @@
+import unittest
+
+from dicetables_db.tools.lrucache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_init_bad_size_raises_value_error(self):
+        self.assertRaises(ValueError, LRUCache, 0)
+
+    def test_put_and_get(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 'default'), 'default')
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 1)
+
+    def test_put_drops_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_get_or_make_only_makes_once(self):
+        cache = LRUCache(2)
+        calls = []
+        maker = lambda: calls.append(1) or len(calls)
+        self.assertEqual(cache.get_or_make('a', maker), 1)
+        self.assertEqual(cache.get_or_make('a', maker), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_make_caches_none(self):
+        cache = LRUCache(2)
+        calls = []
+        cache.get_or_make('a', lambda: calls.append(1))
+        cache.get_or_make('a', lambda: calls.append(1))
+        self.assertEqual(len(calls), 1)
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import unittest
+from multiprocessing import Process
+
+from dicetables import DiceTable, Die
+
+from dicetables_db.tools.documentid import DocumentId
+from dicetables_db.tools.sharedcache import SharedTableCache
+
+
+def put_in_cache(cache, doc_id_bytes, die_size):
+    cache.put(DocumentId.from_bytes(doc_id_bytes), DiceTable.new().add_die(Die(die_size)))
+    cache.close()
+
+
+class TestSharedTableCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = SharedTableCache('dt_test_{}'.format(os.getpid()), max_tables=3)
+
+    def tearDown(self):
+        self.cache.unlink()
+
+    def test_init(self):
+        self.assertEqual(self.cache.max_tables, 3)
+        self.assertEqual(self.cache.name, 'dt_test_{}'.format(os.getpid()))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_get_missing_is_none(self):
+        self.assertIsNone(self.cache.get(DocumentId.new()))
+        self.assertNotIn(DocumentId.new(), self.cache)
+
+    def test_put_and_get(self):
+        doc_id = DocumentId.new()
+        table = DiceTable.new().add_die(Die(6), 3)
+        self.assertTrue(self.cache.put(doc_id, table))
+        self.assertIn(doc_id, self.cache)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get(doc_id), table)
+
+    def test_put_same_id_twice_uses_one_slot(self):
+        doc_id = DocumentId.new()
+        self.cache.put(doc_id, DiceTable.new().add_die(Die(6)))
+        self.cache.put(doc_id, DiceTable.new().add_die(Die(6)))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_least_recently_used_is_evicted(self):
+        ids = [DocumentId.new() for _ in range(4)]
+        for size, doc_id in enumerate(ids[:3], 1):
+            self.cache.put(doc_id, DiceTable.new().add_die(Die(size)))
+        self.cache.get(ids[0])
+
+        self.cache.put(ids[3], DiceTable.new().add_die(Die(4)))
+
+        self.assertEqual(len(self.cache), 3)
+        self.assertNotIn(ids[1], self.cache)
+        for doc_id in (ids[0], ids[2], ids[3]):
+            self.assertIn(doc_id, self.cache)
+
+    def test_referenced_tables_are_not_evicted(self):
+        ids = [DocumentId.new() for _ in range(4)]
+        for size, doc_id in enumerate(ids[:3], 1):
+            self.cache.put(doc_id, DiceTable.new().add_die(Die(size)))
+        for index in range(3):
+            key, _, last_used, length = self.cache._read_slot(index)
+            self.cache._write_slot(index, key, 1, last_used, length)
+
+        self.assertFalse(self.cache.put(ids[3], DiceTable.new().add_die(Die(4))))
+        self.assertNotIn(ids[3], self.cache)
+
+    def test_get_releases_reference(self):
+        doc_id = DocumentId.new()
+        self.cache.put(doc_id, DiceTable.new().add_die(Die(6)))
+        self.cache.get(doc_id)
+        self.assertEqual(self.cache._read_slot(0)[1], 0)
+
+    def test_clear(self):
+        self.cache.put(DocumentId.new(), DiceTable.new().add_die(Die(6)))
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_attached_cache_sees_tables(self):
+        other = SharedTableCache(self.cache.name, max_tables=3, create=False)
+        doc_id = DocumentId.new()
+        self.cache.put(doc_id, DiceTable.new().add_die(Die(6)))
+        self.assertEqual(other.get(doc_id), DiceTable.new().add_die(Die(6)))
+        other.close()
+
+    def test_table_put_by_other_process_is_available(self):
+        doc_id = DocumentId.new()
+        worker = Process(target=put_in_cache, args=(self.cache, doc_id.to_bytes(), 5))
+        worker.start()
+        worker.join()
+        self.assertEqual(self.cache.get(doc_id), DiceTable.new().add_die(Die(5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from dicetables import DiceTable, Die
+
+from dicetables_db.tools.documentid import DocumentId
+from dicetables_db.tools.serializer import Serializer
+from dicetables_db.tools.tablestore import MMapTableStore, RECORD_HEADER
+
+
+class TestMMapTableStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tables.seg')
+        self.store = MMapTableStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_new_store_is_empty(self):
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.path, self.path)
+        self.assertFalse(self.store.has(DocumentId.new()))
+        self.assertIsNone(self.store.get(DocumentId.new()))
+
+    def test_add_and_get(self):
+        doc_id = DocumentId.new()
+        self.store.add(doc_id, b'hello')
+        self.assertTrue(self.store.has(doc_id))
+        self.assertEqual(len(self.store), 1)
+        self.assertEqual(bytes(self.store.get(doc_id)), b'hello')
+
+    def test_get_returns_memoryview(self):
+        doc_id = DocumentId.new()
+        self.store.add(doc_id, b'hello')
+        self.assertIsInstance(self.store.get(doc_id), memoryview)
+
+    def test_many_records(self):
+        ids = [DocumentId.new() for _ in range(10)]
+        for index, doc_id in enumerate(ids):
+            self.store.add(doc_id, bytes([index]) * index)
+        for index, doc_id in enumerate(ids):
+            self.assertEqual(bytes(self.store.get(doc_id)), bytes([index]) * index)
+
+    def test_segment_file_format(self):
+        doc_id = DocumentId.new()
+        self.store.add(doc_id, b'abc')
+        with open(self.path, 'rb') as file:
+            raw = file.read()
+        self.assertEqual(raw, RECORD_HEADER.pack(doc_id.to_bytes(), 3) + b'abc')
+
+    def test_serialized_table_round_trip(self):
+        table = DiceTable.new().add_die(Die(6), 10)
+        doc_id = DocumentId.new()
+        self.store.add(doc_id, Serializer.serialize(table))
+        self.assertEqual(Serializer.deserialize(self.store.get(doc_id)), table)
+
+    def test_store_is_persistent(self):
+        doc_id = DocumentId.new()
+        self.store.add(doc_id, b'hello')
+        self.store.close()
+
+        self.store = MMapTableStore(self.path)
+        self.assertEqual(bytes(self.store.get(doc_id)), b'hello')
+
+    def test_other_store_sees_new_records(self):
+        other = MMapTableStore(self.path)
+        doc_id = DocumentId.new()
+        self.store.add(doc_id, b'hello')
+        self.assertEqual(bytes(other.get(doc_id)), b'hello')
+        other.close()
+
+    def test_incomplete_record_is_ignored_until_complete(self):
+        doc_id = DocumentId.new()
+        record = RECORD_HEADER.pack(doc_id.to_bytes(), 5) + b'hello'
+        with open(self.path, 'ab') as file:
+            file.write(record[:-2])
+        self.assertFalse(self.store.has(doc_id))
+        with open(self.path, 'ab') as file:
+            file.write(record[-2:])
+        self.assertEqual(bytes(self.store.get(doc_id)), b'hello')
+
+    def test_views_survive_refresh(self):
+        first_id = DocumentId.new()
+        self.store.add(first_id, b'first')
+        view = self.store.get(first_id)
+        self.store.add(DocumentId.new(), b'second')
+        self.assertEqual(bytes(view), b'first')
+
+
+if __name__ == '__main__':
+    unittest.main()
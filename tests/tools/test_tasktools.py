@@ -1,11 +1,14 @@
+from fractions import Fraction
 from queue import Queue
 from unittest import TestCase
 
-from dicetables import (DiceRecord, DiceTable, DiceRecordError,
+from dicetables import (DiceRecord, DiceTable, DiceRecordError, EventsCalculations,
                         Die, ModDie, WeightedDie, ModWeightedDie,
                         StrongDie, Exploding, ExplodingOn, Modifier)
 
-from dicetables_db.tools.tasktools import extract_modifiers, apply_modifier, is_new_table, get_die_step, TableGenerator
+from dicetables_db.tools.tasktools import (extract_modifiers, apply_modifier, is_new_table, get_die_step,
+                                           TableGenerator, Moments, get_die_moments, get_dice_power_dict,
+                                           ModifiedTable)
 
 
 class TestTaskTool(TestCase):
@@ -325,3 +328,81 @@ class TestTaskTool(TestCase):
         like_initial = apply_modifier(no_mods, modifier)
         self.assertEqual(like_initial.get_dict(), initial_table.get_dict())
         self.assertNotEqual(like_initial.dice_data(), initial_table.dice_data())
+
+    def test_get_die_moments(self):
+        self.assertEqual(get_die_moments(Die(6)), (Fraction(7, 2), Fraction(35, 12)))
+        self.assertEqual(get_die_moments(WeightedDie({1: 1, 2: 3})), (Fraction(7, 4), Fraction(3, 16)))
+        self.assertEqual(get_die_moments(Modifier(3)), (Fraction(3), Fraction(0)))
+
+    def test_moments_new_is_zero(self):
+        self.assertEqual(Moments(), Moments(0, 0))
+        self.assertEqual(Moments().mean(), 0.0)
+        self.assertEqual(Moments().stddev(), 0.0)
+
+    def test_moments_add_die(self):
+        moments = Moments().add_die(Die(6), 2).add_die(Die(4))
+        self.assertEqual(moments.exact_mean, Fraction(19, 2))
+        self.assertEqual(moments.variance, Fraction(35, 6) + Fraction(5, 4))
+
+    def test_moments_add_modifier_only_moves_mean(self):
+        moments = Moments().add_die(Die(6)).add_modifier(-2)
+        self.assertEqual(moments, Moments(Fraction(3, 2), Fraction(35, 12)))
+
+    def test_moments_match_events_calculations(self):
+        dice_lists = [[(Die(6), 10), (Die(3), 12)], [(ModDie(6, 3), 100)], [(WeightedDie({1: 1, 2: 2}), 1)],
+                      [(StrongDie(Die(4), 3), 5), (Modifier(-4), 1)], [(Exploding(Die(6)), 3)]]
+        for dice_list in dice_lists:
+            table = DiceTable.new()
+            for die, number in dice_list:
+                table = table.add_die(die, number)
+            calc = EventsCalculations(table)
+            moments = Moments.from_dice_list(table.get_list())
+            self.assertAlmostEqual(moments.mean(), calc.mean())
+            self.assertEqual(moments.stddev(3), calc.stddev(3))
+
+    def test_moments_through_extract_and_apply_modifier(self):
+        record = DiceRecord({ModDie(6, 2): 3, Die(4): 1})
+        modifier, no_mods = extract_modifiers(record)
+        moments = Moments.from_dice_list(sorted(no_mods.get_dict().items())).add_modifier(modifier)
+        self.assertEqual(moments, Moments.from_dice_list(record.get_dict().items()))
+
+    def test_get_dice_power_dict_zero_dice(self):
+        self.assertEqual(get_dice_power_dict(Die(6), 0), {0: 1})
+
+    def test_get_dice_power_dict_uniform_dice(self):
+        for die, number in [(Die(6), 1), (Die(6), 7), (Die(1), 10), (Die(2), 50), (ModDie(6, -3), 5),
+                            (WeightedDie({1: 3, 2: 3, 3: 3}), 6), (Modifier(3), 2)]:
+            self.assertEqual(get_dice_power_dict(die, number), DiceTable.new().add_die(die, number).get_dict())
+
+    def test_get_dice_power_dict_non_uniform_dice(self):
+        for die, number in [(WeightedDie({1: 2, 3: 5, 4: 1}), 7), (StrongDie(Die(4), 3), 5), (Exploding(Die(6)), 4),
+                            (ModWeightedDie({1: 2, 2: 0, 5: 3}, -4), 9)]:
+            self.assertEqual(get_dice_power_dict(die, number), DiceTable.new().add_die(die, number).get_dict())
+
+    def test_get_dice_power_dict_large(self):
+        self.assertEqual(get_dice_power_dict(Die(6), 200), DiceTable.new().add_die(Die(6), 200).get_dict())
+
+    def test_modified_table_matches_apply_modifier(self):
+        raw = DiceTable.new().add_die(Die(6), 3)
+        record = raw.dice_data().add_die(Modifier(-4), 1)
+        view = ModifiedTable(raw, -4, record)
+        expected = DiceTable(apply_modifier(raw, -4).get_dict(), record)
+        self.assertEqual(view.to_dice_table(), expected)
+        self.assertEqual(view.get_dict(), expected.get_dict())
+        self.assertEqual(view.get_list(), expected.get_list())
+        self.assertEqual(view.dice_data(), record)
+        self.assertEqual(view.number_of_dice(Modifier(-4)), 1)
+        self.assertEqual(repr(view), repr(expected))
+        self.assertEqual(str(view), str(expected))
+
+    def test_modified_table_is_lazy(self):
+        raw = DiceTable.new().add_die(Die(6), 3)
+        view = ModifiedTable(raw, 2, raw.dice_data().add_die(Modifier(2), 1))
+        self.assertIs(view.table, raw)
+        self.assertEqual(view.modifier, 2)
+        self.assertIsNone(view._dice_table)
+        self.assertIs(view.to_dice_table(), view.to_dice_table())
+
+    def test_modified_table_no_modifier_same_record_is_table(self):
+        raw = DiceTable.new().add_die(Die(6), 3)
+        self.assertIs(ModifiedTable(raw, 0, raw.dice_data()).to_dice_table(), raw)